@@ -31,6 +31,7 @@ load_dotenv()
 
 API_URL = "http://localhost:8000"
 API_KEY = os.getenv("TGR_API_KEY", "TGR-SECRET-KEY-12345")
+CHART_MAX_POINTS = 1000  # au-delà, l'API sous-échantillonne history/forecast (LTTB)
 
 # Configuration Streamlit
 st.set_page_config(
@@ -123,11 +124,22 @@ with st.sidebar:
 
     ordonateur_code = None
     if dataset_mode == "By ORDONNATEUR":
-        ordonateur_code = st.text_input(
-            "Code ORDONNATEUR",
-            value="",
-            help="Entrez l'ORDONNATEUR à filtrer (ex: 146014)"
-        )
+        catalog = st.session_state.get("dataset_codes")
+        if catalog:
+            # Catalogue du dataset enregistré : codes triés par montant total
+            entry = st.selectbox(
+                "Code ORDONNATEUR",
+                catalog,
+                format_func=lambda e: f"{e['code']} — {e['total']:,.0f} ({e['active_months']} mois actifs)",
+                help="Codes présents dans le fichier, plus gros ordonnateurs d'abord"
+            )
+            ordonateur_code = entry["code"]
+        else:
+            ordonateur_code = st.text_input(
+                "Code ORDONNATEUR",
+                value="",
+                help="Entrez l'ORDONNATEUR à filtrer (ex: 146014)"
+            )
     
     months_param = None
     if prediction_mode == "USER (Manuel)":
@@ -156,10 +168,10 @@ st.subheader("📁 Charger vos données")
 col1, col2 = st.columns(2)
 
 with col1:
-    st.write("**Formats acceptés:** CSV, XLS")
+    st.write("**Formats acceptés:** CSV, XLS, Parquet, Feather")
     uploaded_file = st.file_uploader(
         "Glissez-déposez ou cliquez pour sélectionner",
-        type=["csv", "xls", "xlsx"],
+        type=["csv", "xls", "xlsx", "parquet", "feather"],
         key="file_uploader"
     )
 
@@ -189,13 +201,33 @@ if uploaded_file:
             params = {"code": ordonateur_code}
             if prediction_mode != "AUTO (Intelligent)":
                 params["months"] = months_param
+            # Enregistrer le fichier une seule fois (POST /datasets), puis
+            # interroger chaque code par dataset_id : ni ré-upload ni re-parsing
+            dataset_key = (uploaded_file.name, uploaded_file.size)
+            if st.session_state.get("dataset_key") != dataset_key:
+                with st.spinner("📦 Enregistrement du dataset..."):
+                    reg = requests.post(f"{API_URL}/datasets", files=files, headers=headers, timeout=120)
+                st.session_state["dataset_key"] = dataset_key
+                st.session_state["dataset_id"] = reg.json().get("dataset_id") if reg.status_code == 200 else None
+                st.session_state["dataset_codes"] = None
+                if st.session_state["dataset_id"]:
+                    cat = requests.get(
+                        f"{API_URL}/datasets/{st.session_state['dataset_id']}/codes",
+                        params={"sort": "total"}, headers=headers, timeout=30
+                    )
+                    if cat.status_code == 200:
+                        st.session_state["dataset_codes"] = cat.json()["codes"]
+            if st.session_state.get("dataset_id"):
+                params["dataset_id"] = st.session_state["dataset_id"]
+                files = None  # sinon : repli sur l'upload complet
         else:
             if prediction_mode == "AUTO (Intelligent)":
                 endpoint = f"{API_URL}/predict/auto"
-                params = None
+                params = {}
             else:
                 endpoint = f"{API_URL}/predict"
                 params = {"months": months_param}
+        params["max_points"] = CHART_MAX_POINTS
         
         # Appel API
         with st.spinner("🔄 Appel API..."):
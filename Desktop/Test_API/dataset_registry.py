@@ -0,0 +1,305 @@
+"""
+dataset_registry.py - Registre de datasets : un fichier ingéré une fois, prédit N fois
+
+POURQUOI ?
+  Le mode "By ORDONNATEUR" du dashboard renvoyait tout l'export national à
+  /predict/by-code pour CHAQUE code : 50 codes = 50 uploads + 50 parsings CSV.
+
+PRINCIPE :
+  POST /datasets parse le fichier une seule fois (DataCleaner : séparateur,
+  encodage, formats de date et de montant) et stocke sur disque les seules
+  colonnes utiles, déjà typées, au format Parquet :
+
+      code (str, si présent) | date (datetime64) | montant (float64)
+
+  La clé est le SHA256 du fichier reçu (hash_file_content) : ré-uploader le
+  même fichier ne reparse rien. Les endpoints de prédiction acceptent ensuite
+  `dataset_id` à la place d'un fichier ; le filtre par code est poussé dans la
+  lecture Parquet (statistiques des row groups, lignes triées par code).
+
+STOCKAGE (DATASET_DIR) :
+  <sha256>.parquet        données typées
+  <sha256>.json           métadonnées (lignes, période, colonnes, codes)
+  <sha256>.catalog.json   catalogue des codes ordonnateur (voir code_catalog)
+
+INDEX PAR CODE (mémoire) :
+  CodeIndex garde les lignes typées d'un fichier parsé avec un index
+  code → positions construit une seule fois (code catégoriel + tri stable).
+  Les CODE_INDEX_CACHE_SIZE derniers fichiers (clé SHA256) restent en mémoire :
+  un /predict/by-code suivant coûte O(lignes du code), sans re-parsing.
+"""
+
+import importlib.util
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from db_endpoints import hash_file_content
+from logic import DataCleaner
+
+DATASET_DIR = os.getenv("DATASET_DIR", "dataset_store")
+DATASET_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+CATALOG_SORTS = ("code", "total", "rows", "active_months", "last_date")
+CODE_INDEX_CACHE_SIZE = int(os.getenv("CODE_INDEX_CACHE_SIZE", "2"))
+
+_code_indexes = OrderedDict()  # SHA256 → CodeIndex (LRU)
+_code_indexes_lock = threading.Lock()
+
+
+def _paths(dataset_id):
+    if not DATASET_ID_PATTERN.match(dataset_id or ""):
+        raise ValueError(
+            f"dataset_id invalide : {dataset_id!r} (SHA256 hexadécimal attendu)"
+        )
+    base = os.path.join(DATASET_DIR, dataset_id)
+    return base + ".parquet", base + ".json"
+
+
+def _write_json(path, payload):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def build_code_catalog(frame):
+    """
+    Statistiques par code en une passe groupby vectorisée :
+    lignes, mois actifs (mois distincts avec au moins une ligne), première et
+    dernière date, montant total.
+
+    Returns:
+        list[dict]: une entrée par code, triée par code
+    """
+    months = frame["date"].dt.year * 12 + frame["date"].dt.month
+    stats = frame.groupby("code", sort=True).agg(
+        rows=("montant", "size"),
+        first_date=("date", "min"),
+        last_date=("date", "max"),
+        total=("montant", "sum"),
+    )
+    stats["active_months"] = months.groupby(frame["code"]).nunique()
+    stats["first_date"] = stats["first_date"].dt.strftime("%Y-%m-%d")
+    stats["last_date"] = stats["last_date"].dt.strftime("%Y-%m-%d")
+    stats["total"] = stats["total"].round(2)
+    columns = ["rows", "active_months", "first_date", "last_date", "total"]
+    return stats[columns].reset_index().to_dict(orient="records")
+
+
+def dataset_path(dataset_id):
+    """Chemin du fichier Parquet d'un dataset enregistré (ValueError si inconnu)."""
+    data_path, meta_path = _paths(dataset_id)
+    if not os.path.exists(meta_path):
+        raise ValueError(f"Dataset inconnu : {dataset_id}")
+    return data_path
+
+
+def load_meta(dataset_id):
+    """Métadonnées d'un dataset enregistré (ValueError si inconnu)."""
+    dataset_path(dataset_id)
+    with open(_paths(dataset_id)[1], encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_code_frame(stream, compression=None, schema=None):
+    """
+    Parse un fichier une fois (DataCleaner) et retourne ses lignes valides typées :
+    code (str, si la colonne existe) | date | montant, triées par code puis date.
+
+    Le mode lean est toujours désactivé ici : ce chemin a besoin de la table ligne à ligne.
+
+    Returns:
+        tuple: (DataFrame, DataCleaner utilisé — logs, stats, colonnes sources)
+    """
+    cleaner = DataCleaner(
+        stream, schema=schema, compression=compression, keep_code=True, lean=False
+    )
+    cleaner.run()
+    frame = pd.DataFrame(
+        {"date": cleaner.df.index, "montant": cleaner.df["clean_amount"].to_numpy()}
+    )
+    if cleaner.code_col:
+        codes = cleaner.df[cleaner.code_col].astype(str).str.strip().to_numpy()
+        frame.insert(0, "code", codes)
+        frame = frame.sort_values(["code", "date"], kind="stable", ignore_index=True)
+    return frame, cleaner
+
+
+def ingest_dataset(stream, filename=None, compression=None, schema=None):
+    """
+    Parse un fichier uploadé et l'enregistre au format colonnaire.
+
+    Args:
+        stream: flux binaire rembobinable (voir uploads.open_upload) ou bytes
+        compression (str, optional): 'gzip' / 'zstd' (None = signature)
+        schema (dict, optional): indications de schéma (voir DataCleaner)
+
+    Returns:
+        tuple: (métadonnées, True si le dataset vient d'être créé)
+    """
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ValueError(
+            "Registre de datasets : le module pyarrow est requis (pip install pyarrow)"
+        )
+    dataset_id = hash_file_content(stream)
+    data_path, meta_path = _paths(dataset_id)
+    if os.path.exists(meta_path):
+        return load_meta(dataset_id), False
+
+    frame, cleaner = parse_code_frame(stream, compression=compression, schema=schema)
+    col_date, col_amount = cleaner._columns
+
+    meta = {
+        "dataset_id": dataset_id,
+        "filename": filename,
+        "rows": len(frame),
+        "rows_read": cleaner.stats.get("rows_read"),
+        "first_date": frame["date"].min().strftime("%Y-%m-%d"),
+        "last_date": frame["date"].max().strftime("%Y-%m-%d"),
+        "source_columns": {
+            "date": col_date,
+            "amount": col_amount,
+            "code": cleaner.code_col,
+        },
+        "codes": int(frame["code"].nunique()) if cleaner.code_col else 0,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+    # Écriture atomique : données, catalogue puis métadonnées (la présence du .json = dataset complet)
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    frame.to_parquet(data_path + ".tmp", index=False)
+    os.replace(data_path + ".tmp", data_path)
+    if cleaner.code_col:
+        _write_json(_catalog_path(dataset_id), build_code_catalog(frame))
+    _write_json(meta_path, meta)
+    return meta, True
+
+
+def _catalog_path(dataset_id):
+    return os.path.join(DATASET_DIR, dataset_id + ".catalog.json")
+
+
+def code_catalog(dataset_id, sort="code", limit=None):
+    """
+    Catalogue des codes ordonnateur d'un dataset, calculé à l'ingestion.
+    Un dataset enregistré avant le catalogue est complété au premier appel.
+
+    Args:
+        sort (str): 'code' (croissant) ou 'total', 'rows', 'active_months',
+            'last_date' (décroissant : gros ordonnateurs d'abord)
+        limit (int, optional): nombre maximal d'entrées retournées
+    """
+    if sort not in CATALOG_SORTS:
+        raise ValueError(f"Tri inconnu : {sort} (attendu : {', '.join(CATALOG_SORTS)})")
+    path = _catalog_path(dataset_id)
+    if not os.path.exists(path):
+        frame = read_dataset(dataset_id, columns=("code", "date", "montant"))
+        _write_json(path, build_code_catalog(frame))
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    if sort != "code":
+        catalog.sort(key=lambda entry: entry[sort], reverse=True)
+    return catalog[:limit] if limit else catalog
+
+
+def read_dataset(dataset_id, code=None, columns=("date", "montant")):
+    """
+    Lit un dataset enregistré ; avec `code`, seules les lignes de ce code sont
+    décodées (filtre poussé dans la lecture Parquet).
+    """
+    path = dataset_path(dataset_id)
+    filters = None
+    if code is not None or "code" in columns:
+        if not load_meta(dataset_id)["source_columns"].get("code"):
+            raise ValueError("Ce dataset n'a pas de colonne code ordonnateur")
+    if code is not None:
+        filters = [("code", "==", str(code).strip())]
+    return pd.read_parquet(path, columns=list(columns), filters=filters)
+
+
+class CodeIndex:
+    """
+    Lignes typées (date, montant) d'un fichier, indexées par code ordonnateur.
+
+    Le code est converti UNE fois en catégoriel ; un tri stable des codes
+    entiers donne, pour chaque code, la plage de positions de ses lignes.
+    Une recherche ne touche ensuite que les lignes du code demandé.
+    """
+
+    def __init__(self, frame):
+        codes = frame["code"].astype("category")
+        self.codes = list(codes.cat.categories)
+        self.dates = frame["date"].to_numpy()
+        self.amounts = frame["montant"].to_numpy(dtype="float64")
+        cat_codes = codes.cat.codes.to_numpy()
+        self._order = np.argsort(cat_codes, kind="stable")
+        self._bounds = np.searchsorted(
+            cat_codes[self._order], np.arange(len(self.codes) + 1)
+        )
+        self._position = {code: i for i, code in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __contains__(self, code):
+        return str(code).strip() in self._position
+
+    def rows(self, code):
+        """DataFrame (date, montant) des lignes du code, ou None s'il est absent."""
+        i = self._position.get(str(code).strip())
+        if i is None:
+            return None
+        idx = self._order[self._bounds[i] : self._bounds[i + 1]]
+        return pd.DataFrame({"date": self.dates[idx], "montant": self.amounts[idx]})
+
+
+def _cached_index(key, build):
+    with _code_indexes_lock:
+        if key in _code_indexes:
+            _code_indexes.move_to_end(key)
+            return _code_indexes[key]
+    index = build()
+    with _code_indexes_lock:
+        _code_indexes[key] = index
+        while len(_code_indexes) > CODE_INDEX_CACHE_SIZE:
+            _code_indexes.popitem(last=False)
+    return index
+
+
+def code_index(dataset_id):
+    """CodeIndex d'un dataset enregistré (lu une fois, puis gardé en mémoire)."""
+    if not load_meta(dataset_id)["source_columns"].get("code"):
+        raise ValueError("Ce dataset n'a pas de colonne code ordonnateur")
+    return _cached_index(
+        dataset_id,
+        lambda: CodeIndex(
+            read_dataset(dataset_id, columns=("code", "date", "montant"))
+        ),
+    )
+
+
+def code_index_for_upload(stream, compression=None, schema=None):
+    """
+    CodeIndex d'un fichier uploadé. Le fichier n'est parsé que s'il n'a pas
+    déjà été vu récemment (clé : SHA256 du contenu reçu + indications de schéma).
+    """
+
+    def build():
+        frame, cleaner = parse_code_frame(
+            stream, compression=compression, schema=schema
+        )
+        if cleaner.code_col is None:
+            raise ValueError(
+                f"Colonne 'code_ordinateur' ou 'code' non trouvée. Colonnes disponibles : {cleaner._header}"
+            )
+        return CodeIndex(frame)
+
+    key = (hash_file_content(stream), json.dumps(schema or {}, sort_keys=True))
+    return _cached_index(key, build)
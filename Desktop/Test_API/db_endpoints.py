@@ -7,6 +7,7 @@ Fournit des endpoints pour :
   3. Persister les résultats de prédiction
   4. Détecter et sauvegarder les anomalies
   5. Consulter l'historique et générer des stats
+  6. Exporter toutes les prévisions en flux (CSV / Parquet)
 
 INTÉGRATION AVEC MAIN :
   Dans main.py, ajouter au démarrage :
@@ -22,12 +23,17 @@ INTÉGRATION AVEC MAIN :
     ```
 """
 
+import io
 import json
+import importlib.util
 from typing import Optional, List
 from fastapi import APIRouter, Query, HTTPException, Depends, Header
-from sqlmodel import Session, select
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, func
 import hashlib
-from datetime import datetime
+from datetime import datetime, date
+import pandas as pd
+from loguru import logger
 
 from models.database import (
     db_config,
@@ -46,9 +52,21 @@ router_db = APIRouter()
 # ═══════════════════════════════════════════════════════════════════════════
 
 
-def hash_file_content(file_content: bytes) -> str:
-    """Calculer le SHA256 d'un contenu de fichier."""
-    return hashlib.sha256(file_content).hexdigest()
+def hash_file_content(file_content) -> str:
+    """Calculer le SHA256 d'un contenu de fichier (bytes ou flux binaire, lu par blocs)."""
+    if not hasattr(file_content, "read"):
+        return hashlib.sha256(file_content).hexdigest()
+    digest = hashlib.sha256()
+    file_content.seek(0)
+    for block in iter(lambda: file_content.read(1024 * 1024), b""):
+        digest.update(block)
+    file_content.seek(0)
+    return digest.hexdigest()
+
+
+def hash_frame(frame) -> str:
+    """SHA256 du contenu d'un DataFrame (sans passer par un export CSV)."""
+    return hashlib.sha256(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()).hexdigest()
 
 
 def get_user_by_api_key(api_key: str, session: Session) -> Optional[User]:
@@ -168,15 +186,18 @@ def get_user_info(
 def save_uploaded_file(
     api_key: str,
     filename: str,
-    file_content: bytes,
+    file_content,
     row_count: int,
     date_range_start: Optional[str],
     date_range_end: Optional[str],
     session: Session,
+    file_hash: Optional[str] = None,
 ) -> int:
     """
     Persister informations d'un fichier uploadé.
 
+    file_hash : SHA256 déjà connu (dataset enregistré) ; sinon calculé sur file_content.
+
     Returns:
         file_id (pour tracking dans Prediction)
     """
@@ -184,7 +205,7 @@ def save_uploaded_file(
     if not user:
         raise ValueError("Utilisateur non trouvé")
 
-    file_hash = hash_file_content(file_content)
+    file_hash = file_hash or hash_file_content(file_content)
 
     uploaded_file = UploadedFile(
         user_id=user.user_id,
@@ -311,6 +332,54 @@ def save_prediction(
     return pred_id
 
 
+def persist_result(api_key, filename, result, file_content=None, file_hash=None):
+    """
+    Persiste le fichier source et la prédiction réussie (SQLite) et renseigne
+    result["_internal"]. Un échec de persistance n'empêche pas de retourner
+    la prédiction : il est seulement journalisé.
+    """
+    try:
+        session = next(get_session())
+
+        # Persister le fichier uploadé
+        file_id = save_uploaded_file(
+            api_key=api_key,
+            filename=filename,
+            file_content=file_content,
+            file_hash=file_hash,
+            row_count=len(result.get("history", {}).get("values", [])),
+            date_range_start=result.get("history", {}).get("dates", [None])[0],
+            date_range_end=result.get("history", {}).get("dates", [None])[-1],
+            session=session,
+        )
+
+        # Persister la prédiction
+        pred_id = save_prediction(
+            api_key=api_key,
+            file_id=file_id,
+            model_name=result["model_info"]["name"],
+            model_order=result["model_info"]["order"],
+            seasonal_order=result["model_info"]["seasonal_order"],
+            forecast_months=result["duration_info"]["validated_months"],
+            model_aic=result["model_info"]["aic"],
+            forecast_json=result.get("forecast", {}),
+            anomalies_list=result.get("anomalies", []),
+            session=session,
+        )
+
+        result["_internal"] = {
+            "file_id": file_id,
+            "pred_id": pred_id,
+            "persisted": True,
+        }
+
+        logger.info(f"✅ Prédiction sauvegardée : ID={pred_id}, Anomalies={len(result.get('anomalies', []))}")
+
+    except Exception as e:
+        logger.warning(f"⚠️ Persistance BD échouée (prédiction quand même retournée) : {str(e)}")
+        result["_internal"] = {"persisted": False, "error": str(e)}
+
+
 @router_db.get("/predictions/list", tags=["Predictions"])
 def list_predictions(
     api_key: str = Query(..., description="Clé API"),
@@ -346,6 +415,166 @@ def list_predictions(
     }
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# EXPORT EN FLUX - une ligne par mois prévu, lu par lots (mémoire constante)
+# ═══════════════════════════════════════════════════════════════════════════
+
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+EXPORT_COLUMNS = [
+    "pred_id", "created_at", "model", "order", "aic", "filename",
+    "forecast_date", "value", "confidence_lower", "confidence_upper",
+]
+
+
+def _forecast_frame(rows) -> pd.DataFrame:
+    """Lignes (prédiction, forecast_json) → une ligne par mois prévu."""
+    columns = {name: [] for name in EXPORT_COLUMNS}
+    for pred_id, created_at, model, order, aic, filename, forecast_json in rows:
+        forecast = json.loads(forecast_json or "{}")
+        dates = forecast.get("dates") or []
+        n = len(dates)
+        for name, value in (("pred_id", pred_id), ("created_at", created_at), ("model", model),
+                            ("order", order), ("aic", aic), ("filename", filename)):
+            columns[name].extend([value] * n)
+        columns["forecast_date"].extend(dates)
+        for name, key in (("value", "values"), ("confidence_lower", "confidence_lower"),
+                          ("confidence_upper", "confidence_upper")):
+            values = forecast.get(key) or []
+            columns[name].extend(values if len(values) == n else [None] * n)
+
+    frame = pd.DataFrame(columns)
+    frame["created_at"] = pd.to_datetime(frame["created_at"], utc=True).dt.tz_localize(None)  # UTC
+    frame["forecast_date"] = pd.to_datetime(frame["forecast_date"], errors="coerce")
+    for name in ("aic", "value", "confidence_lower", "confidence_upper"):
+        frame[name] = pd.to_numeric(frame[name], errors="coerce").astype("float64")
+    return frame
+
+
+def iter_forecast_batches(user_id: int, model: Optional[str] = None, since: Optional[date] = None,
+                          until: Optional[date] = None, batch_size: int = 500):
+    """
+    DataFrames successifs des prévisions d'un utilisateur, `batch_size`
+    prédictions à la fois. Pagination par clé (pred_id > dernier lu) : chaque
+    lot est une requête indexée, rien n'est accumulé d'un lot à l'autre.
+    """
+    last_id = 0
+    with db_config.get_session() as session:
+        while True:
+            statement = (
+                select(Prediction.pred_id, Prediction.created_at, Prediction.model_name, Prediction.model_order,
+                       Prediction.model_aic, UploadedFile.filename, Prediction.forecast_json)
+                .join(UploadedFile, UploadedFile.file_id == Prediction.file_id, isouter=True)
+                .where(Prediction.user_id == user_id, Prediction.pred_id > last_id)
+            )
+            if model:
+                statement = statement.where(func.upper(Prediction.model_name) == model.upper())
+            # Comparaison sur le jour (texte ISO) : pas de paramètre datetime à typer
+            if since:
+                statement = statement.where(func.date(Prediction.created_at) >= since.isoformat())
+            if until:
+                statement = statement.where(func.date(Prediction.created_at) <= until.isoformat())
+            rows = session.exec(statement.order_by(Prediction.pred_id).limit(batch_size)).all()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield _forecast_frame(rows)
+
+
+def iter_csv(batches):
+    """CSV en flux : en-tête une fois, puis un bloc par lot."""
+    header = True
+    for frame in batches:
+        yield frame.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        yield (",".join(EXPORT_COLUMNS) + "\n").encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destination d'écriture qui rend les octets écrits par morceaux (position absolue conservée)."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_parquet(batches):
+    """Parquet en flux : un row group par lot, envoyé dès qu'il est écrit."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("pred_id", pa.int64()), ("created_at", pa.timestamp("us")), ("model", pa.string()),
+        ("order", pa.string()), ("aic", pa.float64()), ("filename", pa.string()),
+        ("forecast_date", pa.timestamp("us")), ("value", pa.float64()),
+        ("confidence_lower", pa.float64()), ("confidence_upper", pa.float64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    for frame in batches:
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+@router_db.get("/predictions/export", tags=["Predictions"])
+def export_predictions(
+    api_key: str = Query(..., description="Clé API"),
+    fmt: str = Query("csv", alias="format", description="Format : csv ou parquet"),
+    model: Optional[str] = Query(None, description="Filtrer par modèle, sans tenir compte de la casse (ex : SARIMA, holtwinters)"),
+    since: Optional[date] = Query(None, description="Prédictions créées à partir du (YYYY-MM-DD)"),
+    until: Optional[date] = Query(None, description="Prédictions créées jusqu'au (YYYY-MM-DD, inclus)"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Prédictions lues par requête BD"),
+    session: Session = Depends(get_session),
+):
+    """
+    **Exporter toutes les prévisions de l'utilisateur (CSV ou Parquet), en flux.**
+
+    Une ligne par mois prévu : pred_id, created_at, model, order, aic,
+    filename, forecast_date, value, confidence_lower, confidence_upper.
+    Les prédictions sont lues par lots et chaque lot est envoyé aussitôt :
+    la mémoire reste constante quel que soit l'historique.
+
+    Exemple :
+    ```bash
+    curl -o previsions.parquet \\
+      "http://localhost:8000/api/db/predictions/export?api_key=...&format=parquet&model=SARIMA&since=2025-01-01"
+    ```
+    """
+    user = get_user_by_api_key(api_key, session)
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format inconnu : {fmt} (attendu : {', '.join(EXPORT_FORMATS)})")
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=400, detail="Export Parquet indisponible : pyarrow non installé")
+
+    batches = iter_forecast_batches(user.user_id, model=model, since=since, until=until, batch_size=batch_size)
+    content = iter_parquet(batches) if fmt == "parquet" else iter_csv(batches)
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="previsions_{user.user_id}.{fmt}"'},
+    )
+
+
 @router_db.get("/predictions/{pred_id}", tags=["Predictions"])
 def get_prediction_detail(
     pred_id: int,
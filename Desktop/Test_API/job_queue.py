@@ -0,0 +1,363 @@
+"""
+job_queue.py - Prédictions asynchrones : file d'attente durable dans la BD
+
+POURQUOI ?
+  Un tournoi complet (analyze_and_configure avec Prophet / LSTM / CNN) dépasse
+  régulièrement le timeout du reverse proxy : la connexion HTTP ne peut pas
+  rester ouverte jusqu'au résultat.
+
+PRINCIPE :
+  POST /jobs enregistre le fichier (copie dans JOB_DIR, ou dataset existant)
+  et une ligne PredictionJob (status "queued"), puis répond aussitôt avec le
+  job_id. Des processus workers réclament les jobs un par un (UPDATE ... WHERE
+  status = 'queued' : un job n'est pris que par un seul worker), exécutent le
+  pipeline en publiant étape et avancement, et stockent le résultat.
+  GET /jobs/{job_id} lit simplement la ligne. Un job appartient à
+  l'utilisateur de la clé API qui l'a soumis : les autres reçoivent un 404.
+  Un job réussi est persisté dans l'historique comme une prédiction /predict.
+
+  La file étant dans la BD SQLModel, elle survit à un redémarrage : au
+  démarrage, les jobs "running" dont le worker (même hôte) a disparu sont
+  remis en file (requeue_orphans), jusqu'à JOB_MAX_ATTEMPTS essais.
+
+WORKERS :
+  - JOB_WORKERS processus lancés avec l'API (0 = aucun) ;
+  - ou séparément, sur la même BD : `python job_queue.py`
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import update
+from sqlmodel import select
+
+from db_endpoints import get_user_by_api_key, persist_result
+from logic import predict_from_file_content
+from models.database import db_config, PredictionJob, User, utcnow
+
+JOB_DIR = os.getenv("JOB_DIR", "job_store")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+HOSTNAME = socket.gethostname()
+
+
+def _worker_id():
+    return f"{HOSTNAME}:{os.getpid()}"
+
+
+def _owner_id(api_key, session):
+    """user_id de la clé API (None si la clé n'a pas d'utilisateur enregistré)."""
+    user = get_user_by_api_key(api_key, session)
+    return user.user_id if user else None
+
+
+def _update(job_id, **values):
+    with db_config.get_session() as session:
+        session.execute(
+            update(PredictionJob).where(PredictionJob.job_id == job_id).values(**values)
+        )
+        session.commit()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CÔTÉ API : soumission et consultation
+# ═══════════════════════════════════════════════════════════════════════════
+
+
+def submit_job(
+    api_key,
+    stream=None,
+    source_path=None,
+    compression=None,
+    params=None,
+    filename=None,
+    file_hash=None,
+):
+    """
+    Enregistre un job "queued" et retourne son job_id.
+
+    Args:
+        api_key (str): clé API du demandeur (propriétaire du job)
+        stream: flux binaire de l'upload, copié par blocs dans JOB_DIR
+        source_path (str, optional): fichier déjà sur disque (dataset enregistré)
+        compression (str, optional): 'gzip' ou 'zstd'
+        params (dict, optional): months, schema (JSON-sérialisables)
+        filename (str, optional): nom du fichier source, pour l'historique
+        file_hash (str, optional): SHA256 déjà connu (dataset enregistré)
+    """
+    job_id = uuid.uuid4().hex
+    if source_path is None:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        source_path = os.path.join(JOB_DIR, f"{job_id}.input")
+        tmp_path = f"{source_path}.tmp"
+        stream.seek(0)
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+        os.replace(tmp_path, source_path)
+
+    with db_config.get_session() as session:
+        session.add(
+            PredictionJob(
+                job_id=job_id,
+                user_id=_owner_id(api_key, session),
+                source_path=source_path,
+                compression=compression,
+                filename=filename,
+                file_hash=file_hash,
+                params_json=json.dumps(params or {}),
+            )
+        )
+        session.commit()
+    return job_id
+
+
+def get_job(job_id, api_key):
+    """
+    État d'un job (dict), résultat inclus s'il est terminé ; None si inconnu
+    ou soumis avec la clé d'un autre utilisateur.
+    """
+    with db_config.get_session() as session:
+        job = session.get(PredictionJob, job_id)
+        if job is None or job.user_id != _owner_id(api_key, session):
+            return None
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "stage": job.stage,
+            "progress": job.progress,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            "error_message": job.error_message,
+            "result": json.loads(job.result_json) if job.result_json else None,
+        }
+
+
+def requeue_orphans():
+    """
+    Remet en file les jobs "running" dont le worker (sur cet hôte) n'existe
+    plus, ex : API redémarrée en plein calcul. Au-delà de JOB_MAX_ATTEMPTS
+    prises en charge, le job passe en "error".
+
+    Returns:
+        int: nombre de jobs remis en file
+    """
+    requeued = 0
+    with db_config.get_session() as session:
+        running = session.exec(
+            select(PredictionJob).where(PredictionJob.status == "running")
+        ).all()
+        for job in running:
+            host, _, pid = (job.worker or "").rpartition(":")
+            if host != HOSTNAME or (pid.isdigit() and _pid_alive(int(pid))):
+                continue
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status, job.finished_at = "error", utcnow()
+                job.error_message = (
+                    f"Abandonné après {job.attempts} essais (worker interrompu)"
+                )
+            else:
+                job.status, job.stage, job.progress, job.worker = (
+                    "queued",
+                    None,
+                    0.0,
+                    None,
+                )
+                requeued += 1
+            session.add(job)
+        session.commit()
+    if requeued:
+        logger.info(f"♻️  {requeued} job(s) interrompu(s) remis en file")
+    return requeued
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CÔTÉ WORKER : réclamer et exécuter
+# ═══════════════════════════════════════════════════════════════════════════
+
+
+def claim_next_job():
+    """Réclame le plus ancien job en file ; None si la file est vide."""
+    with db_config.get_session() as session:
+        while True:
+            job_id = session.exec(
+                select(PredictionJob.job_id)
+                .where(PredictionJob.status == "queued")
+                .order_by(PredictionJob.created_at)
+                .limit(1)
+            ).first()
+            if job_id is None:
+                return None
+            now = utcnow()
+            claimed = session.execute(
+                update(PredictionJob)
+                .where(PredictionJob.job_id == job_id, PredictionJob.status == "queued")
+                .values(
+                    status="running",
+                    worker=_worker_id(),
+                    started_at=now,
+                    updated_at=now,
+                    stage=None,
+                    progress=0.0,
+                    attempts=PredictionJob.attempts + 1,
+                )
+            )
+            session.commit()
+            if claimed.rowcount == 1:
+                return job_id
+            # Pris par un autre worker entre-temps : job suivant
+
+
+def run_job(job_id):
+    """
+    Exécute un job réclamé et enregistre son résultat (done) ou son erreur
+    (error). Un résultat réussi est aussi persisté (fichier + prédiction) au
+    nom du propriétaire, comme pour /predict.
+    """
+    with db_config.get_session() as session:
+        job = session.get(PredictionJob, job_id)
+        source_path, compression, params = (
+            job.source_path,
+            job.compression,
+            json.loads(job.params_json),
+        )
+        filename, file_hash = job.filename or "unknown", job.file_hash
+        owner = session.get(User, job.user_id) if job.user_id is not None else None
+        owner_key = owner.api_key if owner else None
+
+    def progress(stage, fraction):
+        _update(job_id, stage=stage, progress=fraction, updated_at=utcnow())
+
+    logger.info(f"⚙️  Job {job_id[:12]}… démarré ({_worker_id()})")
+    try:
+        result = predict_from_file_content(
+            source_path,
+            months=params.get("months"),
+            schema=params.get("schema") or None,
+            compression=compression,
+            progress=progress,
+        )
+    except Exception as e:
+        result = {"status": "error", "error_message": str(e), "explanations": []}
+
+    if result.get("status") == "success":
+        if owner_key is None:
+            result["_internal"] = {
+                "persisted": False,
+                "error": "Utilisateur non trouvé",
+            }
+        elif file_hash:
+            persist_result(owner_key, filename, result, file_hash=file_hash)
+        else:
+            with open(source_path, "rb") as f:
+                persist_result(owner_key, filename, result, file_content=f)
+
+    payload = json.dumps(jsonable_encoder(result), ensure_ascii=False)
+    if result.get("status") == "success":
+        _update(
+            job_id,
+            status="done",
+            stage="terminé",
+            progress=1.0,
+            result_json=payload,
+            finished_at=utcnow(),
+        )
+    else:
+        _update(
+            job_id,
+            status="error",
+            error_message=result.get("error_message"),
+            result_json=payload,
+            finished_at=utcnow(),
+        )
+    logger.info(f"✅ Job {job_id[:12]}… terminé : {result.get('status')}")
+
+    # La copie de l'upload n'est plus utile (un dataset enregistré est conservé)
+    if os.path.dirname(os.path.abspath(source_path)) == os.path.abspath(JOB_DIR):
+        try:
+            os.remove(source_path)
+        except OSError:
+            pass
+
+
+def process_next():
+    """Réclame et exécute un job ; retourne son job_id, ou None si la file est vide."""
+    job_id = claim_next_job()
+    if job_id is not None:
+        run_job(job_id)
+    return job_id
+
+
+def worker_loop(stop_event=None, poll_interval=JOB_POLL_INTERVAL):
+    """Boucle d'un worker : traite les jobs en file, attend poll_interval quand elle est vide."""
+    if db_config.engine is not None:
+        db_config.engine.dispose(close=False)  # connexions héritées du processus parent
+    logger.info(f"👷 Worker de jobs démarré ({_worker_id()})")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            if process_next() is not None:
+                continue
+        except Exception as e:
+            logger.error(f"❌ Worker de jobs : {str(e)}")
+        if stop_event is None:
+            time.sleep(poll_interval)
+        else:
+            stop_event.wait(poll_interval)
+
+
+class JobWorkers:
+    """Processus workers lancés et arrêtés avec l'API."""
+
+    def __init__(self, count=JOB_WORKERS):
+        self.count = count
+        self._stop = None
+        self._processes = []
+
+    def start(self):
+        if self.count <= 0 or self._processes:
+            return
+        self._stop = multiprocessing.Event()
+        for _ in range(self.count):
+            process = multiprocessing.Process(
+                target=worker_loop, args=(self._stop,), daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout=5):
+        if self._stop is not None:
+            self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()  # job en cours : remis en file au prochain démarrage
+        self._processes = []
+
+
+job_workers = JobWorkers()
+
+
+if __name__ == "__main__":
+    db_config.create_tables()
+    requeue_orphans()
+    worker_loop()
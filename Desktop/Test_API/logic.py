@@ -76,8 +76,16 @@ import warnings
 import pandas as pd
 import numpy as np
 import io                          # ← CHANGEMENT 1 : Pour lire bytes depuis RAM
+import gzip
 from loguru import logger          # ← NOUVEAU : Logging professionnel
 import os
+import json
+import time
+import hashlib
+import importlib.util
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from statsmodels.tsa.stattools import adfuller
 from statsmodels.tsa.statespace.sarimax import SARIMAX
@@ -110,6 +118,394 @@ logger.add(
 app_logger = logger  # Alias pour clarté
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# MONTANTS : DÉTECTION DE LA CONVENTION LOCALE
+# ═══════════════════════════════════════════════════════════════════════════
+# Les exports TGR écrivent "1 234,50" (espace ou espace insécable en séparateur
+# de milliers, virgule décimale). Au lieu d'enchaîner des .str.replace sur des
+# copies de chaînes, on détecte la convention sur un échantillon puis :
+#   • si elle est exprimable par le parseur C (decimal=/thousands= d'un octet),
+#     on la passe directement à pd.read_csv → la colonne arrive déjà en float ;
+#   • sinon (ex: espace insécable), une seule passe str.translate + to_numeric.
+
+NBSP = '\u00A0'
+AMOUNT_SAMPLE_SIZE = 500
+
+
+def detect_amount_convention(values, sample_size=AMOUNT_SAMPLE_SIZE):
+    """
+    Détecte la convention d'écriture des montants sur un échantillon.
+
+    Règles :
+      • virgule ET point dans une même valeur → le dernier des deux est la décimale
+      • seulement des virgules → virgule décimale (comportement historique)
+      • espaces / espaces insécables → séparateurs de milliers
+
+    Returns:
+        dict: {"decimal": "," ou ".", "thousands": [séparateurs de milliers]}
+    """
+    convention = {"decimal": ".", "thousands": []}
+    if pd.api.types.is_numeric_dtype(values):
+        return convention
+
+    sample = values.dropna().head(sample_size).astype(str).str.strip()
+    thousands = set()
+    decimal = None
+    for s in sample:
+        if NBSP in s:
+            thousands.add(NBSP)
+        if ' ' in s:
+            thousands.add(' ')
+        last_comma, last_dot = s.rfind(','), s.rfind('.')
+        if last_comma >= 0 and last_dot >= 0:
+            decimal = ',' if last_comma > last_dot else '.'
+            thousands.add('.' if decimal == ',' else ',')
+        elif last_comma >= 0 and decimal is None:
+            decimal = ','
+
+    convention["decimal"] = decimal or '.'
+    convention["thousands"] = sorted(thousands)
+    return convention
+
+
+def amount_reader_kwargs(convention):
+    """
+    Arguments decimal=/thousands= pour pd.read_csv si la convention est gérable
+    par le parseur C (un seul séparateur de milliers, ASCII). Sinon {}.
+    """
+    thousands = convention["thousands"]
+    if len(thousands) > 1 or any(not c.isascii() for c in thousands):
+        return {}
+    kwargs = {}
+    if convention["decimal"] != '.':
+        kwargs["decimal"] = convention["decimal"]
+    if thousands:
+        kwargs["thousands"] = thousands[0]
+    return kwargs
+
+
+def parse_amounts(values, convention=None):
+    """
+    Convertit une colonne de montants en float64.
+
+    • Colonne déjà numérique (parseur C, Parquet...) → aucune conversion
+    • Sinon une seule passe str.translate (milliers supprimés, virgule → point)
+      puis pd.to_numeric ; les valeurs invalides deviennent NaN.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+    if convention is None:
+        convention = detect_amount_convention(values)
+
+    table = {ord(c): None for c in (' ', NBSP, *convention["thousands"])}
+    if convention["decimal"] == ',':
+        table[ord(',')] = '.'
+    text = values if pd.api.types.is_string_dtype(values) else values.astype(str)
+    return pd.to_numeric(text.str.translate(table), errors='coerce')
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# MOTEUR DE LECTURE CSV (variable d'environnement CSV_ENGINE)
+# ═══════════════════════════════════════════════════════════════════════════
+#   auto    → pyarrow (lecteur multithread) s'il est installé, sinon parseur C
+#   pyarrow → idem, repli sur le parseur C si pyarrow est absent
+#   c       → parseur C de pandas
+#   python  → parseur Python (lent, réservé au débogage)
+# Le moteur pyarrow ne gère ni nrows, ni chunksize, ni thousands= : ces lectures
+# passent automatiquement par le parseur C.
+
+CSV_ENGINES = ('pyarrow', 'c', 'python')
+PYARROW_UNSUPPORTED = ('nrows', 'chunksize', 'thousands')
+
+
+def resolve_csv_engine(requested=None):
+    """
+    Retourne le moteur CSV effectivement utilisable ('pyarrow', 'c' ou 'python').
+
+    Args:
+        requested (str): 'auto', 'pyarrow', 'c' ou 'python' (défaut : $CSV_ENGINE)
+    """
+    requested = (requested or os.getenv("CSV_ENGINE", "auto")).strip().lower()
+    if requested in ('auto', 'pyarrow'):
+        return 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+    if requested in CSV_ENGINES:
+        return requested
+    logger.warning(f"CSV_ENGINE inconnu : '{requested}', parseur C utilisé")
+    return 'c'
+
+
+def read_csv(source, engine=None, **kwargs):
+    """
+    pd.read_csv avec le moteur choisi ; les options que pyarrow ne supporte pas
+    font basculer la lecture sur le parseur C plutôt que d'échouer.
+    """
+    engine = engine or resolve_csv_engine()
+    if engine == 'pyarrow' and any(k in kwargs for k in PYARROW_UNSUPPORTED):
+        engine = 'c'
+    if engine != 'c':
+        kwargs.pop('low_memory', None)
+    if engine != 'pyarrow':
+        return pd.read_csv(source, engine=engine, **kwargs)
+
+    # pyarrow + dtype=str écrit 'None' dans les cellules vides : on lit en
+    # StringDtype puis on revient en object avec NaN, comme le parseur C
+    dtype = kwargs.get('dtype')
+    text_cols = []
+    if dtype is str:
+        kwargs['dtype'] = 'string'
+    elif isinstance(dtype, dict):
+        text_cols = [c for c, t in dtype.items() if t is str]
+        kwargs['dtype'] = {c: ('string' if t is str else t) for c, t in dtype.items()}
+    df = pd.read_csv(source, engine=engine, **kwargs)
+    if dtype is str:
+        text_cols = list(df.columns)
+    for col in text_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+    return df
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# FORMATS COLONNAIRES (Parquet, Feather) ET EXCEL
+# ═══════════════════════════════════════════════════════════════════════════
+# Détectés par leur signature (premiers octets), quel que soit le nom du fichier.
+# Parquet/Feather : seules les colonnes date/montant sont lues (projection), déjà
+# typées → aucun parsing texte. Nécessitent pyarrow ; Excel nécessite openpyxl
+# (xlsx) ou xlrd (xls).
+
+INPUT_FORMAT_MAGIC = (
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'feather'),            # Feather v2 = format fichier Arrow IPC
+    (b'PK\x03\x04', 'excel'),          # xlsx (archive zip)
+    (b'\xd0\xcf\x11\xe0', 'excel'),    # xls (OLE2)
+)
+
+
+def detect_input_format(head):
+    """Retourne 'parquet', 'feather', 'excel' ou 'csv' d'après les premiers octets."""
+    for magic, fmt in INPUT_FORMAT_MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return 'csv'
+
+
+def _require_pyarrow(fmt):
+    if importlib.util.find_spec('pyarrow') is None:
+        raise ValueError(f"Format {fmt} : le module pyarrow est requis (pip install pyarrow)")
+
+
+def read_columnar_header(source, fmt):
+    """Noms de colonnes d'un fichier Parquet/Feather/Excel, sans lire les données."""
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(source).schema_arrow.names)
+    if fmt == 'feather':
+        _require_pyarrow(fmt)
+        import pyarrow.ipc as ipc
+        return list(ipc.open_file(source).schema.names)
+    try:
+        return list(pd.read_excel(source, nrows=0).columns)
+    except ImportError as e:
+        raise ValueError(f"Format Excel : {e}")
+
+
+def iter_columnar(source, fmt, columns, batch_size=None):
+    """
+    Génère des DataFrames ne contenant que `columns`.
+
+    Parquet : seuls les blocs de colonnes demandés sont décompressés ; avec
+    batch_size, lecture par lots (row groups) sans matérialiser le fichier.
+    """
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(source)
+        if batch_size:
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield parquet_file.read(columns=columns).to_pandas()
+    elif fmt == 'feather':
+        yield pd.read_feather(source, columns=columns)
+    else:
+        try:
+            yield pd.read_excel(source, usecols=columns)
+        except ImportError as e:
+            raise ValueError(f"Format Excel : {e}")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CSV COMPRESSÉS (gzip, zstd)
+# ═══════════════════════════════════════════════════════════════════════════
+# Détectés par leur signature (ou indiqués par Content-Encoding). Le flux est
+# décompressé à la volée pendant la lecture : le CSV décompressé n'est jamais
+# matérialisé, et la limite de taille porte sur les octets DÉCOMPRESSÉS
+# (protection contre les bombes de décompression). zstd nécessite `zstandard`.
+
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+COMPRESSIONS = ('gzip', 'zstd')
+
+
+def detect_compression(head):
+    """Retourne 'gzip', 'zstd' ou None d'après les premiers octets."""
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class _LimitedReader(io.RawIOBase):
+    """Flux décompressé qui lève ValueError au-delà de max_size octets produits."""
+
+    def __init__(self, stream, max_size):
+        self._stream = stream
+        self._max_size = max_size
+        self._produced = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        self._produced += len(data)
+        if self._max_size is not None and self._produced > self._max_size:
+            raise ValueError(f"Fichier décompressé trop volumineux (max {self._max_size // (1024 * 1024)} MB)")
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def open_decompressed(source, compression, max_size=None):
+    """
+    Ouvre un flux binaire décompressé à la volée sur `source` (objet fichier
+    rembobiné par l'appelant, ou chemin). Chaque appel repart du début.
+    """
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=source, mode='rb') if hasattr(source, 'read') else gzip.open(source, 'rb')
+    elif compression == 'zstd':
+        if importlib.util.find_spec('zstandard') is None:
+            raise ValueError("Compression zstd : le module zstandard est requis (pip install zstandard)")
+        import zstandard
+        raw = source if hasattr(source, 'read') else open(source, 'rb')
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=raw is not source)
+    else:
+        raise ValueError(f"Compression non supportée : {compression} (attendu : {', '.join(COMPRESSIONS)})")
+    return io.BufferedReader(_LimitedReader(stream, max_size), buffer_size=1024 * 1024)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# LECTURE PARALLÈLE PAR PLAGES D'OCTETS (map-reduce)
+# ═══════════════════════════════════════════════════════════════════════════
+# Le fichier est découpé en plages d'octets alignées sur des fins de ligne ;
+# chaque plage est lue et agrégée en sommes partielles par mois (ou par
+# (code, mois)) dans un processus séparé, puis les partiels sont additionnés.
+# Hypothèse : aucun champ ne contient de saut de ligne (cas des exports TGR).
+
+
+def split_byte_ranges(data, size, start, n_parts):
+    """
+    Découpe [start, size) en n_parts plages qui commencent toutes en début de ligne.
+
+    Args:
+        data: bytes, ou chemin du fichier
+        size (int): taille totale en octets
+        start (int): premier octet après l'en-tête
+    """
+    if isinstance(data, memoryview):
+        data = data.obj
+    step = max((size - start) // max(n_parts, 1), 1)
+    bounds = [start]
+    f = None if isinstance(data, (bytes, bytearray)) else open(data, 'rb')
+    try:
+        for target in range(start + step, size, step):
+            if target <= bounds[-1]:
+                continue
+            if f is None:
+                newline = data.find(b'\n', target)
+                cut = size if newline < 0 else newline + 1
+            else:
+                f.seek(target)
+                f.readline()
+                cut = f.tell()
+            if cut >= size:
+                break
+            bounds.append(cut)
+    finally:
+        if f is not None:
+            f.close()
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _aggregate_byte_range(task):
+    """
+    Tâche d'un processus du pool : lit une plage d'octets (précédée de l'en-tête)
+    et la replie en sommes par mois, comme un bloc de DataCleaner._fold_chunks.
+    """
+    (header, data, path, start, end, sep, read_kwargs, col_date, col_amount,
+     col_code, convention, date_format, dayfirst) = task
+    if data is None:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(header + data), sep=sep, **{'encoding': 'utf-8', **read_kwargs})
+    chunk.columns = chunk.columns.str.strip().str.lower()
+
+    amounts = parse_amounts(chunk[col_amount], convention)
+    if pd.api.types.is_datetime64_any_dtype(chunk[col_date]):
+        dates = chunk[col_date]
+    elif date_format is not None:
+        dates = pd.to_datetime(chunk[col_date], format=date_format, errors='coerce')
+    else:
+        dates = DataCleaner._parse_dates(chunk[col_date], dayfirst=dayfirst)
+    present = chunk[col_date].notna()
+    n_dates, n_failed = int(present.sum()), int((dates.isna() & present).sum())
+
+    valid = (dates.notna() & amounts.notna()).to_numpy()
+    if col_code is not None:
+        valid &= chunk[col_code].notna().to_numpy()
+    dates, amounts = dates[valid], amounts[valid]
+    if dates.empty:
+        return None, None, None, len(chunk), 0, n_dates, n_failed
+
+    keys = DataCleaner._month_keys(dates)
+    if col_code is None:
+        sums = DataCleaner._bucket_sums(keys, amounts)
+    else:
+        codes = chunk[col_code][valid].astype(str).str.strip().to_numpy()
+        sums = pd.Series(amounts.to_numpy(dtype='float64')).groupby([codes, keys]).sum()
+    return sums, dates.min(), dates.max(), len(chunk), len(dates), n_dates, n_failed
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# COLONNE CODE ORDONNATEUR
+# ═══════════════════════════════════════════════════════════════════════════
+
+CODE_COLUMN_KEYWORDS = ('ordinateur', 'ordonnateur', 'ordonneur')
+
+
+def detect_code_column(columns):
+    """
+    Colonne du code ordonnateur parmi des noms normalisés (minuscules) :
+    'code_ordonnateur', 'ordonnateur', 'code_etablissement'... puis 'code'.
+    Retourne None si aucune ne correspond.
+    """
+    columns = list(columns)
+    for col in columns:
+        # Les deux orthographes : ordinateur ET ordonnateur
+        if any(x in col for x in CODE_COLUMN_KEYWORDS):
+            return col
+        if 'code' in col and any(x in col for x in ['ord', 'etabl', 'agence']):
+            return col
+    return next((col for col in columns if 'code' in col), None)
+
+
 # CLASSE 1 :
 class DataCleaner:
     """
@@ -117,14 +513,98 @@ class DataCleaner:
       ❌ AVANT : file_path = "C:/Users/.../file.csv"  →  pd.read_csv(file_path)
       ✓ APRÈS : file_content = <bytes>  →  pd.read_csv(io.BytesIO(file_content))
 
+    MODE STREAMING (chunksize) :
+      Pour les exports nationaux de plusieurs Go, passer un chemin (ou un objet
+      fichier binaire) et `chunksize=N` : le CSV est lu par blocs de N lignes et
+      chaque bloc est replié dans des sommes mensuelles courantes. La mémoire
+      crête dépend de la taille des blocs, pas de celle du fichier, et la
+      limite MAX_FILE_SIZE ne s'applique pas.
+
+    FORMAT DE DATE :
+      Le format est inféré UNE fois sur un échantillon (DATE_SAMPLE_SIZE valeurs)
+      parmi DATE_FORMATS, puis la colonne entière est parsée avec ce format
+      explicite en une seule passe vectorisée. Si ce format laisse trop de NaT
+      sur la colonne entière, il est écarté et l'inférence reprend sans lui.
+      Le format est mémorisé par empreinte d'en-tête et réutilisé pour les
+      fichiers suivants.
+
+    REJET RAPIDE :
+      Avant toute lecture complète, les SNIFF_BYTES premiers octets sont
+      analysés (encodage, séparateur, colonnes Date/Montant, au moins une date
+      et un montant valides). Un fichier invalide est refusé en quelques ms.
+
+    MODE LEAN (lean=True ou LEAN_MODE=1) :
+      Après run(), le nettoyeur ne garde que monthly_values (float64, un point
+      par mois) et self.stats ; self.df et les octets reçus sont libérés.
     """
     MAX_FILE_SIZE = 50 * 1024 * 1024  # ← SÉCURITÉ : Max 50 MB par fichier
+    SNIFF_BYTES = 64 * 1024           # octets lus pour valider un CSV avant lecture complète
+    SEPARATORS = (';', ',', '\t', '|')  # par ordre de préférence en cas d'égalité
+
+    # Candidats, par ordre de priorité (ISO d'abord). Jour-premier AVANT
+    # mois-premier : sur un échantillon ambigu (tous les jours ≤ 12), les
+    # exports TGR sont en dd/mm. Un format démenti par la colonne entière est
+    # écarté ensuite (voir _reject_date_format).
+    DATE_FORMATS = [
+        'ISO8601',
+        '%Y/%m/%d',
+        '%d/%m/%Y',
+        '%m/%d/%Y',
+        '%d/%m/%Y %H:%M:%S',
+        '%d/%m/%Y %H:%M',
+        '%d-%m-%Y',
+        '%d.%m.%Y',
+        '%d/%m/%y',
+        '%Y%m%d',
+        '%m/%Y',
+    ]
+    DATE_SAMPLE_SIZE = 500
+    DATE_FORMAT_MIN_MATCH = 0.8    # part minimale de l'échantillon parsée par le format retenu
+
+    # Schémas connus : empreinte de la ligne d'en-tête → séparateur, colonnes,
+    # format de date et convention des montants. Partagé entre instances et
+    # conservé dans SCHEMA_CACHE_FILE ("" = en mémoire seulement).
+    SCHEMA_KEYS = ('sep', 'date_col', 'amount_col', 'date_format', 'decimal', 'thousands')
+    SCHEMA_CACHE_SIZE = 128
+    SCHEMA_CACHE_FILE = os.getenv("SCHEMA_CACHE_FILE", os.path.join("logs", "schema_cache.json"))
+    _schema_cache = None           # chargé au premier usage
+    LEAN_MODE = os.getenv("LEAN_MODE", "0").strip().lower() in ("1", "true", "yes")
     
-    def __init__(self, file_content):
+    def __init__(self, file_content, chunksize=None, workers=None, schema=None, lean=None, compression=None,
+                 keep_code=False):
         
-        self.file_content = file_content
+        self.file_content = file_content  # bytes, chemin, ou objet fichier binaire
+        self.chunksize = chunksize        # None = lecture complète (mode classique)
+        self.workers = workers            # > 1 = lecture CSV parallèle (plages d'octets)
+        # Indications explicites (sep, date_col, amount_col, date_format, decimal,
+        # thousands) : prioritaires sur le cache et la détection
+        self.schema_hints = {k: v for k, v in (schema or {}).items() if k in self.SCHEMA_KEYS and v is not None}
         self.df = None
         self.logs = []  # ← CHANGEMENT : On collecte les logs au lieu de les afficher
+        self.stats = {}
+        self.date_format = None           # format explicite retenu (None = inférence pandas)
+        self._rejected_formats = set()    # formats démentis par la colonne entière
+        self.amount_convention = None     # convention des montants (voir detect_amount_convention)
+        self._read_kwargs = None          # usecols/dtype/decimal/thousands (voir _plan_read)
+        self._header = None               # noms de colonnes normalisés du fichier
+        self._columns = None              # (col_date, col_amount)
+        self.csv_engine = resolve_csv_engine()  # voir CSV_ENGINE
+        self.input_format = None          # 'csv', 'parquet', 'feather' ou 'excel'
+        self._usecols = None              # colonnes projetées (Parquet/Feather/Excel)
+        self._fingerprint = None          # empreinte de l'en-tête CSV
+        self._schema = {}                 # schéma retenu : cache + indications
+        self._sep = None
+        self.encoding = 'utf-8'           # 'cp1252' si l'échantillon n'est pas de l'UTF-8
+        # Mode lean : après run(), seules la série mensuelle (tableau float64) et
+        # les statistiques sont conservées ; table brute et octets sont libérés
+        self.lean = self.LEAN_MODE if lean is None else bool(lean)
+        self.monthly_values = None        # np.ndarray float64 (mode lean)
+        self.monthly_start = None         # 1er mois de monthly_values
+        # 'gzip' / 'zstd' (ex : Content-Encoding) ; None = détection par signature
+        self.compression = compression
+        # Conserver aussi la colonne code ordonnateur dans self.df (registre de datasets)
+        self.keep_code = keep_code
+        self.code_col = None              # nom normalisé, si keep_code et trouvée
 
     def _log(self, msg):
         """
@@ -135,13 +615,206 @@ class DataCleaner:
         """
         self.logs.append(msg)
 
-    def _detect_separator(self):
+    def _is_bytes(self):
+        return isinstance(self.file_content, (bytes, bytearray, memoryview))
+
+    def _open_source(self):
+        """
+        Retourne un objet lisible par pd.read_csv, quel que soit le type de source :
+        bytes → io.BytesIO, objet fichier → rembobiné au début, chemin → tel quel.
+        Source compressée → nouveau flux décompressé à la volée (repart du début).
+        """
+        if self.compression:
+            limit = self.MAX_FILE_SIZE if self.chunksize is None else None
+            return open_decompressed(self._open_raw(), self.compression, limit)
+        return self._open_raw()
+
+    def _open_raw(self):
+        if self._is_bytes():
+            return io.BytesIO(self.file_content)
+        if hasattr(self.file_content, 'read'):
+            if hasattr(self.file_content, 'seek'):
+                self.file_content.seek(0)
+            return self.file_content
+        return self.file_content
+
+    def _source_size(self):
+        """Taille de la source en octets (None si inconnue, ex: flux non seekable)."""
+        if self._is_bytes():
+            return len(self.file_content)
+        if hasattr(self.file_content, 'read'):
+            try:
+                pos = self.file_content.tell()
+                self.file_content.seek(0, os.SEEK_END)
+                size = self.file_content.tell()
+                self.file_content.seek(pos)
+                return size
+            except Exception:
+                return None
+        return os.path.getsize(self.file_content)
+
+    def _head_bytes(self, n):
+        """Premiers octets de la source (signature du format), décompressés si besoin."""
+        if self._is_bytes() and not self.compression:
+            return bytes(self.file_content[:n])
+        source = self._open_source()
+        if hasattr(source, 'read'):
+            head = source.read(n)
+            if not self.compression:
+                source.seek(0)
+            return head
+        with open(source, 'rb') as f:
+            return f.read(n)
+
+    def _first_line(self):
+        if self._is_bytes() and not self.compression:
+            # find() ne copie pas le contenu (contrairement à split)
+            data = self.file_content.obj if isinstance(self.file_content, memoryview) else self.file_content
+            end = data.find(b'\n')
+            return bytes(data if end < 0 else data[:end])
+        source = self._open_source()
+        if hasattr(source, 'readline'):
+            line = source.readline()
+            if not self.compression:
+                source.seek(0)
+            return line
+        with open(source, 'rb') as f:
+            return f.readline()
+
+    @classmethod
+    def _schema_store(cls):
+        """Cache des schémas, chargé depuis SCHEMA_CACHE_FILE au premier appel."""
+        if cls._schema_cache is None:
+            cls._schema_cache = {}
+            if cls.SCHEMA_CACHE_FILE and os.path.exists(cls.SCHEMA_CACHE_FILE):
+                try:
+                    with open(cls.SCHEMA_CACHE_FILE, encoding='utf-8') as f:
+                        cls._schema_cache = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Cache de schémas illisible ({cls.SCHEMA_CACHE_FILE}) : {e}")
+        return cls._schema_cache
+
+    @classmethod
+    def _save_schema_store(cls):
+        if not cls.SCHEMA_CACHE_FILE:
+            return
+        # Fichier temporaire propre à chaque écrivain : les processus (plages
+        # d'octets, pool de prédiction, workers de jobs) écrivent en même temps
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cls.SCHEMA_CACHE_FILE) or '.',
+                                       prefix='.schema_cache.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cls._schema_cache, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, cls.SCHEMA_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"Cache de schémas non sauvegardé : {e}")
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _lookup_schema(self):
+        """
+        Schéma à appliquer : entrée du cache pour l'empreinte de l'en-tête,
+        complétée/écrasée par les indications explicites.
+        """
+        header = self._first_line().strip().lstrip(b'\xef\xbb\xbf')
+        self._fingerprint = hashlib.sha1(header).hexdigest()[:16]
+        cached = self._schema_store().get(self._fingerprint)
+        schema = dict(cached or {})
+        schema.update(self.schema_hints)
+        if self.schema_hints:
+            self._log(f"Schéma fourni : {', '.join(sorted(self.schema_hints))}")
+        elif cached:
+            self._log(f"Schéma connu (empreinte {self._fingerprint}) : détection sautée")
+        return schema
+
+    def _remember_schema(self):
+        """Enregistre le schéma effectivement utilisé pour cet en-tête."""
+        if self.input_format != 'csv' or self._fingerprint is None or self._columns is None:
+            return
+        entry = {
+            "sep": self._sep,
+            "date_col": self._columns[0],
+            "amount_col": self._columns[1],
+            "date_format": self.date_format,
+            "decimal": self.amount_convention["decimal"],
+            "thousands": ''.join(self.amount_convention["thousands"]),
+        }
+        store = self._schema_store()
+        if store.get(self._fingerprint) == entry:
+            return
+        store.pop(self._fingerprint, None)
+        if len(store) >= self.SCHEMA_CACHE_SIZE:
+            store.pop(next(iter(store)))
+        store[self._fingerprint] = entry
+        self._save_schema_store()
+
+    def _forget_date_format(self, fmt):
+        """Évince l'entrée du cache pour cet en-tête si elle porte le format `fmt` démenti."""
+        store = self._schema_store()
+        if self._fingerprint is None or store.get(self._fingerprint, {}).get('date_format') != fmt:
+            return
+        del store[self._fingerprint]
+        self._save_schema_store()
+        self._log(f"Schéma en cache évincé (empreinte {self._fingerprint}) : format de date '{fmt}' démenti")
+
+    def _detect_separator(self, header=None):
+        """Séparateur le plus fréquent de la ligne d'en-tête (';' si égalité, ',' par défaut)."""
         try:
-            first_line = self.file_content.split(b'\n')[0].decode('utf-8', errors='ignore')
-            return ';' if ';' in first_line else ','
+            if header is None:
+                header = self._first_line().decode('utf-8', errors='ignore')
+            counts = [header.count(s) for s in self.SEPARATORS]
+            return self.SEPARATORS[counts.index(max(counts))] if max(counts) else ','
         except Exception:
             return ','
 
+    def _sniff(self):
+        """
+        Valide un CSV sur ses SNIFF_BYTES premiers octets seulement, avant toute
+        lecture complète : encodage (UTF-8/BOM, sinon cp1252), séparateur,
+        colonnes date/montant et présence d'au moins une ligne exploitable.
+        Un fichier inutilisable échoue ici en quelques millisecondes.
+
+        Returns:
+            str: séparateur retenu
+        """
+        head = self._head_bytes(self.SNIFF_BYTES)
+        if b'\x00' in head:
+            raise ValueError("Fichier binaire non reconnu (formats acceptés : CSV, Parquet, Feather, Excel)")
+        truncated = len(head) == self.SNIFF_BYTES
+        if truncated and b'\n' in head:
+            head = head[:head.rfind(b'\n') + 1]  # lignes complètes uniquement
+        try:
+            text = head.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            self.encoding = 'cp1252'
+            text = head.decode('cp1252', errors='replace')
+            self._log("Encodage : cp1252 (le fichier n'est pas en UTF-8)")
+
+        sep = self._schema.get('sep') or self._detect_separator(text.split('\n', 1)[0])
+        try:
+            sample = pd.read_csv(io.StringIO(text), sep=sep, dtype=str)
+        except pd.errors.EmptyDataError:
+            raise ValueError("Fichier vide ou contenu invalide")
+        except pd.errors.ParserError as e:
+            if not truncated:
+                raise ValueError(f"CSV illisible : {e}")
+            # Coupure au milieu d'un champ entre guillemets : on ne valide que l'en-tête
+            sample = pd.read_csv(io.StringIO(text), sep=sep, dtype=str, nrows=0)
+
+        cols = sample.columns.str.strip().str.lower()
+        col_date, col_amount = self._detect_columns(cols, self._schema.get('date_col'), self._schema.get('amount_col'))
+        if len(sample):
+            sample.columns = cols
+            if parse_amounts(sample[col_amount]).notna().sum() == 0:
+                raise ValueError(f"Aucun montant numérique dans les premières lignes (colonne '{col_amount}')")
+            fmt = self.schema_hints.get('date_format')
+            dates = (pd.to_datetime(sample[col_date], format=fmt, errors='coerce') if fmt
+                     else self._parse_dates(sample[col_date], dayfirst=True))
+            if dates.notna().sum() == 0:
+                raise ValueError("Aucune date valide trouvée après parsing")
+        return sep
+
     def _find_column(self, cols, keywords):
         """
         LOGIQUE :
@@ -153,20 +826,474 @@ class DataCleaner:
                     return c
         return None
 
+    def _detect_columns(self, cols, col_date=None, col_amount=None):
+        """
+        Détecte (col_date, col_amount) ou lève ValueError si introuvables.
+        Les colonnes indiquées (schéma) sont reprises si elles existent.
+        """
+        cols = list(cols)
+        col_date = str(col_date or '').strip().lower()
+        col_amount = str(col_amount or '').strip().lower()
+        # Accepter plusieurs variantes (fr/en) courantes pour "date"
+        if col_date not in cols:
+            col_date = self._find_column(cols, ['date', 'jour', 'mois', 'month', 'time', 'reglement', 'payment'])
+        if col_amount not in cols:
+            col_amount = self._find_column(cols, ['montant', 'sum', 'prix', 'amount', 'valeur'])
+
+        if not col_date or not col_amount:
+            raise ValueError(f"Impossible de trouver colonnes Date/Montant. Colonnes disponibles : {list(cols)}")
+        return col_date, col_amount
+
+    def _clean_amounts(self, values):
+        # Conversion : "1 000,50" → 1000.50 (float) ; déjà float si le parseur C
+        # a reçu decimal=/thousands= (voir _plan_read)
+        return parse_amounts(values, self.amount_convention)
+
+    def _plan_read(self, sep):
+        """
+        Lit d'abord l'en-tête et un petit échantillon (en texte brut) pour
+        préparer la vraie lecture :
+          • colonnes date/montant détectées → usecols (les dizaines de colonnes
+            texte des exports TGR ne sont jamais matérialisées)
+          • colonne date lue en str (dtype explicite, pas d'inférence pandas)
+          • convention des montants → decimal=/thousands= pour le parseur C
+
+        Returns:
+            dict: arguments à passer à pd.read_csv
+        """
+        schema = self._schema
+        hinted = 'decimal' in self.schema_hints and 'thousands' in self.schema_hints
+        # Convention fournie → en-tête seul ; en-tête connu → petit échantillon de contrôle
+        nrows = 0 if hinted else (50 if schema.get('decimal') else AMOUNT_SAMPLE_SIZE)
+        head = pd.read_csv(self._open_source(), sep=sep, encoding=self.encoding, nrows=nrows, dtype=str)
+        raw_columns = dict(zip(head.columns.str.strip().str.lower(), head.columns))
+        self._header = list(raw_columns)
+        col_date, col_amount = self._detect_columns(self._header, schema.get('date_col'), schema.get('amount_col'))
+        self._columns = (col_date, col_amount)
+
+        convention = detect_amount_convention(head[raw_columns[col_amount]])
+        if schema.get('decimal') and convention == {"decimal": ".", "thousands": []}:
+            # Échantillon sans séparateur visible (ex: entiers) : convention du schéma
+            convention = {"decimal": schema['decimal'], "thousands": sorted(set(schema.get('thousands') or ''))}
+        for key in ('decimal', 'thousands'):
+            if key in self.schema_hints:
+                convention[key] = self.schema_hints[key] if key == 'decimal' else sorted(set(self.schema_hints[key]))
+        self.amount_convention = convention
+        kwargs = amount_reader_kwargs(self.amount_convention)
+        thousands = ''.join(self.amount_convention["thousands"]).replace(NBSP, 'NBSP') or 'aucun'
+        mode = "translate" if not kwargs and self.amount_convention["thousands"] else "lecteur CSV"
+        self._log(f"Montants : décimale '{self.amount_convention['decimal']}', milliers '{thousands}' ({mode})")
+
+        kwargs['usecols'] = [raw_columns[col_date], raw_columns[col_amount]]
+        kwargs['dtype'] = {raw_columns[col_date]: str}
+        if self.keep_code:
+            self.code_col = detect_code_column(self._header)
+            if self.code_col:
+                kwargs['usecols'].append(raw_columns[self.code_col])
+                kwargs['dtype'][raw_columns[self.code_col]] = str
+        if len(self._header) > len(kwargs['usecols']):
+            self._log(f"Lecture de {len(kwargs['usecols'])} colonnes sur {len(self._header)} (usecols)")
+        return kwargs
+
+    def _plan_columnar(self):
+        """
+        Équivalent de _plan_read pour Parquet/Feather/Excel : détecte les colonnes
+        date/montant sur le schéma et retourne leurs noms d'origine (projection).
+        """
+        if self._columns is None:
+            raw = read_columnar_header(self._open_source(), self.input_format)
+            raw_columns = dict(zip(pd.Index(raw).str.strip().str.lower(), raw))
+            self._header = list(raw_columns)
+            self._columns = self._detect_columns(self._header)
+            self._usecols = [raw_columns[c] for c in self._columns]
+            if self.keep_code:
+                self.code_col = detect_code_column(self._header)
+                if self.code_col:
+                    self._usecols.append(raw_columns[self.code_col])
+            self._log(f"Format {self.input_format} : lecture de {len(self._usecols)} colonnes sur {len(self._header)}, sans parsing texte")
+        return self._usecols
+
+    def _iter_chunks(self, sep):
+        """Blocs (colonnes normalisées) de la source, quel que soit son format."""
+        if self.input_format == 'csv':
+            if self._read_kwargs is None:
+                self._read_kwargs = self._plan_read(sep)
+            chunks = pd.read_csv(self._open_source(), sep=sep, encoding=self.encoding, chunksize=self.chunksize, **self._read_kwargs)
+        else:
+            chunks = iter_columnar(self._open_source(), self.input_format, self._plan_columnar(), self.chunksize)
+        for chunk in chunks:
+            chunk.columns = chunk.columns.str.strip().str.lower()
+            yield chunk
+
+    @staticmethod
+    def _parse_dates(values, dayfirst):
+        # Silence spécifique des UserWarning de pandas "Could not infer format..." pour éviter de polluer les tests
+        with warnings.catch_warnings():
+            # Ignorer plusieurs messages UserWarning provenant de pandas sur l'inférence de format
+            warnings.filterwarnings("ignore", message="Could not infer format.*", category=UserWarning)
+            warnings.filterwarnings("ignore", message="Parsing dates in .* when dayfirst=False.*", category=UserWarning)
+            return pd.to_datetime(values, dayfirst=dayfirst, errors='coerce')
+
+    @staticmethod
+    def _month_keys(dates):
+        """
+        Clé entière de mois (mois écoulés depuis 1970-01), entièrement vectorisée.
+
+        La conversion calendaire jour → mois est faite une seule fois par JOUR
+        distinct de la période (table de correspondance), puis appliquée aux
+        transactions par simple indexation. Si la période compte plus de jours
+        que de transactions (fichier épars), on convertit directement les dates.
+        """
+        values = np.asarray(dates, dtype='datetime64[ns]')
+        days = np.floor_divide(values.view(np.int64), 86_400_000_000_000)
+        d0, d1 = int(days.min()), int(days.max())
+        if d1 - d0 + 1 > len(days):
+            return values.astype('datetime64[M]').astype(np.int64)
+        table = np.arange(d0, d1 + 1).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        days -= d0
+        return np.take(table, days, out=days)  # en place : un seul tableau de la taille des données
+
+    @staticmethod
+    def _bucket_sums(keys, amounts):
+        """
+        Somme les montants par clé de mois via np.bincount.
+        Retourne une Series DENSE indexée par clé (de min à max, mois vides = 0).
+        """
+        k0 = int(keys.min())
+        sums = np.bincount(keys - k0, weights=np.asarray(amounts, dtype='float64'))
+        return pd.Series(sums, index=pd.RangeIndex(k0, k0 + len(sums)))
+
+    @staticmethod
+    def _keys_to_monthly(bucket_sums):
+        """Convertit une Series indexée par clé de mois en Series indexée au 1er du mois (MS)."""
+        months = np.asarray(bucket_sums.index, dtype=np.int64).astype('datetime64[M]')
+        index = pd.DatetimeIndex(months.astype('datetime64[ns]'), freq='MS', name='clean_date')
+        return pd.Series(bucket_sums.to_numpy(), index=index)
+
+    @classmethod
+    def _infer_date_format(cls, values, exclude=()):
+        """
+        Choisit le format de DATE_FORMATS (hors `exclude`) qui parse le plus de
+        valeurs d'un échantillon ; à égalité, le premier de la liste.
+        Retourne (format, taux de réussite, taille échantillon).
+        """
+        sample = values.dropna().head(cls.DATE_SAMPLE_SIZE).astype(str)
+        if sample.empty:
+            return None, 0.0, 0
+
+        best_fmt, best_ok = None, 0
+        for fmt in cls.DATE_FORMATS:
+            if fmt in exclude:
+                continue
+            ok = cls._format_matches(sample, fmt)
+            if ok > best_ok:
+                best_fmt, best_ok = fmt, ok
+                if ok == len(sample):
+                    break
+        return best_fmt, best_ok / len(sample), len(sample)
+
+    @staticmethod
+    def _format_matches(sample, fmt):
+        return int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+
+    def _resolve_date_format(self, col_date, values):
+        """
+        Fixe self.date_format pour cette colonne : depuis le cache si l'en-tête est
+        connu, sinon par inférence sur échantillon. Reste None si aucun format
+        ne couvre DATE_FORMAT_MIN_MATCH de l'échantillon (→ inférence pandas).
+        Dans tous les cas, le format est ensuite contrôlé sur la colonne entière
+        (_reject_date_format) ; un format venu du cache et démenti en est évincé.
+        """
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return
+        if self.schema_hints.get('date_format') not in (None, *self._rejected_formats):
+            self.date_format = self.schema_hints['date_format']
+            self._log(f"Format de date : '{self.date_format}' (fourni)")
+            return
+        cached = self._schema.get('date_format') if self._schema.get('date_col') == col_date else None
+        if cached and cached not in self._rejected_formats:
+            # Vérification rapide : le même en-tête peut cacher un autre format
+            probe = values.dropna().head(50).astype(str)
+            if probe.empty or self._format_matches(probe, cached) >= self.DATE_FORMAT_MIN_MATCH * len(probe):
+                self.date_format = cached
+                self._log(f"Format de date : '{cached}' (en-tête déjà connu, format réutilisé)")
+                return
+            self._forget_date_format(cached)
+
+        fmt, ratio, n_sample = self._infer_date_format(values, exclude=self._rejected_formats)
+        if fmt is None or ratio < self.DATE_FORMAT_MIN_MATCH:
+            self._log("Format de date non déterminé sur l'échantillon : inférence pandas")
+            return
+
+        self.date_format = fmt
+        self._log(f"Format de date : '{fmt}' (inféré sur {n_sample} valeurs, {ratio:.0%} reconnues)")
+
+    def _parse_date_column(self, values, dayfirst=False):
+        """Une seule passe vectorisée avec le format retenu (None → inférence pandas)."""
+        if pd.api.types.is_datetime64_any_dtype(values):
+            # Parquet/Feather : déjà typé ; fuseau éventuel retiré (heure locale conservée)
+            return values.dt.tz_localize(None) if values.dt.tz is not None else values
+        if self.date_format is None:
+            return self._parse_dates(values, dayfirst=dayfirst)
+        return pd.to_datetime(values, format=self.date_format, errors='coerce')
+
+    def _reject_date_format(self, n_dates, n_failed):
+        """
+        Contrôle du format retenu sur la colonne ENTIÈRE : s'il laisse plus de
+        (1 - DATE_FORMAT_MIN_MATCH) des dates renseignées en NaT (échantillon
+        trompeur, ex : dd/mm lu en mm/dd), il est écarté pour ce fichier et
+        True est retourné : l'appelant refait l'inférence puis le parsing.
+        """
+        if self.date_format is None or not n_dates or n_failed <= (1 - self.DATE_FORMAT_MIN_MATCH) * n_dates:
+            return False
+        self._log(f"Format de date '{self.date_format}' écarté : {n_failed}/{n_dates} dates non reconnues sur la colonne entière")
+        self._rejected_formats.add(self.date_format)
+        self._forget_date_format(self.date_format)
+        self.date_format = None
+        return True
+
+    def _parse_dates_checked(self, col_date, values):
+        """
+        ÉTAPE 6 sur une colonne en mémoire : parsing avec le format retenu,
+        contrôle sur la colonne entière (_reject_date_format) et, sans format,
+        repli dayfirst=True si dayfirst=False laisse des NaT (ex : dd/mm/YYYY).
+        """
+        present = values.notna()
+        n_dates = int(present.sum())
+        dates = self._parse_date_column(values)
+        while self._reject_date_format(n_dates, int((dates.isna() & present).sum())):
+            self._resolve_date_format(col_date, values)
+            dates = self._parse_date_column(values)
+        if self.date_format is None and dates.isna().any():
+            dates = self._parse_date_column(values, dayfirst=True)
+        return dates
+
+    def _finalize_monthly(self, monthly, last_original_date):
+        """
+        ÉTAPE 9 commune aux deux modes : enlève le dernier mois s'il est incomplet,
+        vérifie qu'il reste des données et journalise la période couverte.
+        """
+        self.df_clean = monthly.to_frame(name='montant')
+
+        # Ex : si les données s'arrêtent avant la fin du dernier mois, on l'enlève
+        if len(self.df_clean) > 1:
+            last_month_start = self.df_clean.index[-1]
+            last_month_end = last_month_start + pd.offsets.MonthEnd(0)
+            if last_original_date < last_month_end:
+                self.df_clean = self.df_clean.iloc[:-1]
+
+        # SÉCURITÉ : Vérifier qu'il reste au moins une ligne
+        if self.df_clean.empty:
+            self._log("ERREUR : Pas de dates valides après parsing.")
+            raise ValueError("Aucune date valide trouvée après parsing")
+
+        self._log(f"Données prêtes : {len(self.df_clean)} mois (de {self.df_clean.index[0].strftime('%Y-%m-%d')} à {self.df_clean.index[-1].strftime('%Y-%m-%d')})")
+        self._remember_schema()
+        if self.lean:
+            self._release()
+            return self.monthly_frame()
+        return self.df_clean
+
+    def run_frame(self, frame, date_col='date', amount_col='montant'):
+        """
+        ÉTAPES 5 à 9 sur des lignes déjà en mémoire (date, montant) : ni lecture,
+        ni détection de séparateur ou de colonnes. Dates datetime et montants
+        numériques sont repris tels quels ; sinon, mêmes règles que run().
+
+        Returns:
+            pd.DataFrame: même format que run()
+        """
+        dates, amounts = frame[date_col], frame[amount_col]
+        self._resolve_date_format(date_col, dates)
+        clean_amount = self._clean_amounts(amounts)
+        clean_date = self._parse_dates_checked(date_col, dates)
+
+        valid = (clean_date.notna() & clean_amount.notna()).to_numpy()
+        clean_date, clean_amount = clean_date[valid], clean_amount[valid]
+        self.stats = {
+            "rows_read": len(frame),
+            "rows_valid": len(clean_date),
+            "first_date": clean_date.min() if len(clean_date) else None,
+            "last_date": clean_date.max() if len(clean_date) else None,
+        }
+        if not len(clean_date):
+            self._log("ERREUR : Pas de dates valides après parsing.")
+            raise ValueError("Aucune date valide trouvée après parsing")
+        buckets = self._bucket_sums(self._month_keys(clean_date), clean_amount)
+        return self._finalize_monthly(self._keys_to_monthly(buckets), clean_date.max())
+
+    def _release(self):
+        """
+        Mode lean : ne garde que la série mensuelle compacte et self.stats.
+        La table brute, le DataFrame mensuel et la référence aux octets reçus
+        sont lâchés pour que le ramasse-miettes les libère avant la modélisation.
+        """
+        self.monthly_values = self.df_clean['montant'].to_numpy(dtype=np.float64)
+        self.monthly_start = self.df_clean.index[0]
+        self.df = None
+        self.df_clean = None
+        self.file_content = None
+
+    def monthly_frame(self):
+        """Série mensuelle au format de run() (index MS, colonne 'montant')."""
+        if self.monthly_values is None:
+            return self.df_clean
+        index = pd.date_range(self.monthly_start, periods=len(self.monthly_values), freq='MS', name='clean_date')
+        return pd.DataFrame({'montant': self.monthly_values}, index=index)
+
+    def _parallel(self):
+        """Lecture parallèle : CSV dont la taille est connue, et workers > 1."""
+        return bool(self.workers and self.workers > 1 and self.input_format == 'csv'
+                    and not self.compression and not hasattr(self.file_content, 'read'))
+
+    def _fold_chunks(self, sep, dayfirst):
+        """
+        Lit la source bloc par bloc et replie chaque bloc dans des sommes mensuelles.
+
+        Returns:
+            tuple: (sommes par clé de mois, première date, dernière date,
+                    lignes lues, lignes valides, dates renseignées,
+                    dates renseignées restées NaT)
+        """
+        monthly = None
+        first_date, last_date = None, None
+        n_rows, n_valid = 0, 0
+        n_dates, n_failed = 0, 0
+        first_chunk = True
+
+        for chunk in self._iter_chunks(sep):
+            col_date, col_amount = self._columns
+            if first_chunk:
+                first_chunk = False
+                if not dayfirst:
+                    self._resolve_date_format(col_date, chunk[col_date])
+
+            amounts = self._clean_amounts(chunk[col_amount])
+            dates = self._parse_date_column(chunk[col_date], dayfirst=dayfirst)
+            present = chunk[col_date].notna()
+            n_dates += int(present.sum())
+            n_failed += int((dates.isna() & present).sum())
+            n_rows += len(chunk)
+
+            valid = dates.notna() & amounts.notna()
+            dates, amounts = dates[valid], amounts[valid]
+            if dates.empty:
+                continue
+            n_valid += len(dates)
+            first_date = dates.min() if first_date is None else min(first_date, dates.min())
+            last_date = dates.max() if last_date is None else max(last_date, dates.max())
+
+            part = self._bucket_sums(self._month_keys(dates), amounts)
+            monthly = part if monthly is None else monthly.add(part, fill_value=0.0)
+
+        if first_chunk:
+            raise ValueError("Fichier vide ou contenu invalide")
+        return monthly, first_date, last_date, n_rows, n_valid, n_dates, n_failed
+
+    def _fold_parallel(self, sep, dayfirst):
+        """
+        Équivalent de _fold_chunks en map-reduce : chaque plage d'octets est
+        repliée en sommes mensuelles par un processus du pool, puis les partiels
+        sont additionnés. Même tuple de retour que _fold_chunks.
+        """
+        if self._read_kwargs is None:
+            self._read_kwargs = self._plan_read(sep)
+        col_date, col_amount = self._columns
+        if not dayfirst:
+            sample = pd.read_csv(self._open_source(), sep=sep, encoding=self.encoding, nrows=self.DATE_SAMPLE_SIZE,
+                                 usecols=self._read_kwargs['usecols'], dtype=str)
+            sample.columns = sample.columns.str.strip().str.lower()
+            self._resolve_date_format(col_date, sample[col_date])
+
+        header = self._first_line()
+        if not header.endswith(b'\n'):
+            header += b'\n'
+        is_bytes = self._is_bytes()
+        size = self._source_size()
+        ranges = split_byte_ranges(self.file_content, size, len(header), self.workers)
+        tasks = [
+            (header, self.file_content[a:b] if is_bytes else None, None if is_bytes else self.file_content, a, b,
+             sep, dict(self._read_kwargs, encoding=self.encoding), col_date, col_amount, None, self.amount_convention, self.date_format, dayfirst)
+            for a, b in ranges
+        ]
+
+        monthly = None
+        first_date, last_date = None, None
+        n_rows, n_valid = 0, 0
+        n_dates, n_failed = 0, 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for sums, first, last, rows, valid, present, failed in pool.map(_aggregate_byte_range, tasks):
+                n_rows += rows
+                n_dates += present
+                n_failed += failed
+                if sums is None:
+                    continue
+                n_valid += valid
+                first_date = first if first_date is None else min(first_date, first)
+                last_date = last if last_date is None else max(last_date, last)
+                monthly = sums if monthly is None else monthly.add(sums, fill_value=0.0)
+        return monthly, first_date, last_date, n_rows, n_valid, n_dates, n_failed
+
+    def _run_streaming(self, sep):
+        """
+        Pipeline STREAMING : équivalent à run() mais sans jamais matérialiser le
+        fichier complet. Le format de date est inféré sur le premier bloc puis
+        contrôlé sur le fichier entier (_reject_date_format) ; si
+        aucun format n'a pu être inféré et qu'une date ne se parse pas avec
+        dayfirst=False, on refait une passe complète avec dayfirst=True.
+        """
+        if self._parallel():
+            fold = self._fold_parallel
+            self._log(f"Mode parallèle : {self.workers} processus, plages d'octets alignées sur les lignes")
+        else:
+            fold = self._fold_chunks
+            reader = "moteur CSV : c" if self.input_format == 'csv' else f"format {self.input_format}"
+            self._log(f"Mode streaming : lecture par blocs de {self.chunksize} lignes ({reader})")
+        folded = fold(sep, dayfirst=False)
+        while self._reject_date_format(*folded[-2:]):
+            # Format démenti par le fichier entier : nouvelle inférence sans lui
+            folded = fold(sep, dayfirst=False)
+        if self.date_format is None and folded[-1]:
+            # Si dayfirst=False échoue (ex: format français dd/mm/YYYY), essayer dayfirst=True
+            folded = fold(sep, dayfirst=True)
+        monthly, first_date, last_date, n_rows, n_valid, _, _ = folded
+
+        col_date, col_amount = self._columns
+        self._log(f"Colonnes détectées : date='{col_date}', montant='{col_amount}'")
+        self.stats = {
+            "rows_read": n_rows,
+            "rows_valid": n_valid,
+            "first_date": first_date,
+            "last_date": last_date,
+        }
+
+        if monthly is None:
+            self._log("ERREUR : Pas de dates valides après parsing.")
+            raise ValueError("Aucune date valide trouvée après parsing")
+
+        # Série mensuelle dense (mois sans transaction = 0), identique à resample('MS')
+        keys = monthly.index
+        monthly = monthly.reindex(pd.RangeIndex(keys.min(), keys.max() + 1), fill_value=0.0)
+        return self._finalize_monthly(self._keys_to_monthly(monthly), last_date)
+
     def run(self):
         """
         Lance le pipeline COMPLET de nettoyage.
         
         ÉTAPES :
-        1️⃣  Détecte séparateur (';' ou ',')
-        2️⃣  Lit le CSV depuis les BYTES vers mémoire (io.BytesIO)
+        1️⃣  Détecte le format (CSV, Parquet, Feather, Excel) et le séparateur (';' ou ',')
+        2️⃣  Lit les colonnes utiles depuis les BYTES vers mémoire (io.BytesIO)
         3️⃣  Normalise les noms de colonnes (lowercase, trim)
         4️⃣  Détecte automatiquement colonnes date et montant
         5️⃣  Convertit montants (virgule décimale → point)
-        6️⃣  Parse les dates (intelligemment : dayfirst, etc.)
+        6️⃣  Parse les dates (format inféré sur échantillon, une seule passe)
         7️⃣  Filtre les valeurs valides (élimine NaN)
         8️⃣  Agrège en série MENSUELLE (important pour SARIMA/ARIMA)
         9️⃣  Enlève dernier mois s'il est incomplet
+
+        Si `chunksize` est défini, les étapes 2 à 8 sont faites bloc par bloc
+        (voir _run_streaming) et `self.df` reste à None. Avec `workers` > 1, les
+        blocs sont des plages d'octets traitées en parallèle (voir _fold_parallel).
         
         Returns:
             pd.DataFrame: Index = dates (mensuel), Colonne 'montant' = valeurs
@@ -179,81 +1306,116 @@ class DataCleaner:
         
         try:
             # Validation : fichier vide / taille maximale
-            if not self.file_content or len(self.file_content) == 0:
+            size = self._source_size() if self.file_content is not None else 0
+            if not self.file_content or size == 0:
                 raise ValueError("Fichier vide ou contenu invalide")
-            if len(self.file_content) > self.MAX_FILE_SIZE:
+            if self.chunksize is None and size is not None and size > self.MAX_FILE_SIZE:
                 raise ValueError("trop volumineux")
 
-            # ÉTAPE 1 : Détection séparateur
-            sep = self._detect_separator()
-            
-            # ← CHANGEMENT 1 : io.BytesIO = simule un fichier depuis les bytes
-            # Sans io.BytesIO, pandas ne peut pas lire les bytes directement
-            self.df = pd.read_csv(io.BytesIO(self.file_content), sep=sep, encoding='utf-8', low_memory=False)
+            # CSV compressé (gzip/zstd) : décompression à la volée pendant la lecture
+            detected = detect_compression(self._head_bytes(4) if not self.compression else b'')
+            if self.compression or detected:
+                self.compression = self.compression or detected
+                self._log(f"Fichier compressé ({self.compression}) : décompression à la volée")
+
+            # Format détecté par signature : Parquet / Feather / Excel n'ont ni
+            # séparateur ni parsing texte (colonnes déjà typées)
+            self.input_format = detect_input_format(self._head_bytes(8))
+            if self.compression and self.input_format != 'csv':
+                raise ValueError("Seuls les fichiers CSV peuvent être envoyés compressés")
+
+            # ÉTAPE 1 : Détection séparateur (sautée si l'en-tête est déjà connu)
+            sep = None
+            if self.input_format == 'csv':
+                self._schema = self._lookup_schema()
+                sep = self._sniff()
+            self._sep = sep
+
+            if self.chunksize or self._parallel():
+                return self._run_streaming(sep)
             
+            if self.input_format == 'csv':
+                # ← CHANGEMENT 1 : io.BytesIO = simule un fichier depuis les bytes
+                # Sans io.BytesIO, pandas ne peut pas lire les bytes directement
+                # ÉTAPE 4 : Détection des colonnes sur l'en-tête, puis lecture des
+                # seules colonnes date/montant (usecols + dtypes explicites)
+                read_kwargs = self._plan_read(sep)
+                col_date, col_amount = self._columns
+                if self.csv_engine == 'pyarrow' and 'thousands' in read_kwargs:
+                    # pyarrow ne connaît pas thousands= : montants lus en texte puis
+                    # convertis en une passe str.translate (voir parse_amounts)
+                    read_kwargs.pop('thousands')
+                    read_kwargs.pop('decimal', None)
+                    read_kwargs['dtype'][read_kwargs['usecols'][1]] = str
+                self._log(f"Moteur CSV : {self.csv_engine}")
+                self.df = read_csv(self._open_source(), engine=self.csv_engine, sep=sep, encoding=self.encoding, low_memory=False, **read_kwargs)
+            else:
+                # ÉTAPE 2-4 (Parquet/Feather/Excel) : projection sur les colonnes date/montant
+                self.df = next(iter_columnar(self._open_source(), self.input_format, self._plan_columnar()))
+                col_date, col_amount = self._columns
+
             # Normaliser les noms de colonnes
             self.df.columns = self.df.columns.str.strip().str.lower()
 
-            # ÉTAPE 4 : Détection automatique des colonnes
-            # Accepter plusieurs variantes (fr/en) courantes pour "date"
-            col_date = self._find_column(self.df.columns, ['date', 'jour', 'mois', 'month', 'time', 'reglement', 'payment'])
-            col_amount = self._find_column(self.df.columns, ['montant', 'sum', 'prix', 'amount', 'valeur'])
-
-            if not col_date or not col_amount:
-                raise ValueError(f"Impossible de trouver colonnes Date/Montant. Colonnes disponibles : {list(self.df.columns)}")
-
             self._log(f"Colonnes détectées : date='{col_date}', montant='{col_amount}'")
+            self._resolve_date_format(col_date, self.df[col_date])
 
             # ÉTAPE 5 : Nettoyage montants
-            # Conversion : "1 000,50" → "1000.50" → 1000.50 (float)
-            self.df['clean_amount'] = pd.to_numeric(
-                self.df[col_amount].astype(str).str.replace('\u00A0', '').str.replace(' ', '').str.replace(',', '.'),
-                errors='coerce'  # Erreur = NaN (sera supprimée après)
-            )
+            self.df['clean_amount'] = self._clean_amounts(self.df[col_amount])
             
             # ÉTAPE 6 : Parsing dates
-            # Prioriser dayfirst=False car de nombreux CSV utilisent le format ISO (YYYY-MM-DD)
-            # Silence spécifique des UserWarning de pandas "Could not infer format..." pour éviter de polluer les tests
-            with warnings.catch_warnings():
-                # Ignorer plusieurs messages UserWarning provenant de pandas sur l'inférence de format
-                warnings.filterwarnings("ignore", message="Could not infer format.*", category=UserWarning)
-                warnings.filterwarnings("ignore", message="Parsing dates in .* when dayfirst=False.*", category=UserWarning)
-                self.df['clean_date'] = pd.to_datetime(self.df[col_date], dayfirst=False, errors='coerce')
-                if self.df['clean_date'].isna().sum() > 0:
-                    # Si dayfirst=False échoue (ex: format français dd/mm/YYYY), essayer dayfirst=True
-                    self.df['clean_date'] = pd.to_datetime(self.df[col_date], dayfirst=True, errors='coerce')
+            # Format explicite inféré sur un échantillon → une seule passe, même
+            # si le fichier contient quelques dates invalides (elles deviennent NaT) ;
+            # un format démenti par la colonne entière est écarté et réinféré
+            self.df['clean_date'] = self._parse_dates_checked(col_date, self.df[col_date])
+            if self.lean:
+                # Les colonnes brutes (chaînes) ne servent plus : on les lâche tout de suite
+                self.df = self.df[['clean_date', 'clean_amount']]
             
             # ÉTAPE 7 : Filtrage et indexation
+            n_rows = len(self.df)
             self.df = self.df.dropna(subset=['clean_date', 'clean_amount']).set_index('clean_date').sort_index()
+            self.stats = {
+                "rows_read": n_rows,
+                "rows_valid": len(self.df),
+                "first_date": self.df.index.min() if len(self.df) else None,
+                "last_date": self.df.index.max() if len(self.df) else None,
+            }
             
             # ÉTAPE 8 : Agrégation en série mensuelle
             # Raison : SARIMA/ARIMA demandent une fréquence régulière (ex: chaque mois)
             # Sinon les résidus ne sont pas homogènes
-            daily = self.df['clean_amount'].resample('D').sum()  # Journalière d'abord
-            self.df_clean = daily.resample('MS').sum().to_frame(name='montant')  # MS = 1er du mois
-            
-            # ÉTAPE 9 : Enlever dernier mois si incomplet
-            # Ex : si les données s'arrêtent avant la fin du dernier mois, on l'enlève
-            if len(self.df_clean) > 1:
-                last_month_start = self.df_clean.index[-1]
-                last_month_end = last_month_start + pd.offsets.MonthEnd(0)
-                last_original_date = self.df.index.max()
-                if last_original_date < last_month_end:
-                    self.df_clean = self.df_clean.iloc[:-1]
-
-            # SÉCURITÉ : Vérifier qu'il reste au moins une ligne
-            if self.df_clean.empty:
+            # Chaque transaction va directement dans son mois (clé entière) : pas
+            # d'index journalier dense, qui coûtait cher sur les fichiers épars
+            # couvrant plusieurs années (voir scripts/bench_aggregation.py)
+            if self.df.empty:
                 self._log("ERREUR : Pas de dates valides après parsing.")
                 raise ValueError("Aucune date valide trouvée après parsing")
-
-            self._log(f"Données prêtes : {len(self.df_clean)} mois (de {self.df_clean.index[0].strftime('%Y-%m-%d')} à {self.df_clean.index[-1].strftime('%Y-%m-%d')})")
-            return self.df_clean
+            buckets = self._bucket_sums(self._month_keys(self.df.index), self.df['clean_amount'])
+            monthly = self._keys_to_monthly(buckets)  # MS = 1er du mois
+            
+            # ÉTAPE 9 : Enlever dernier mois si incomplet
+            return self._finalize_monthly(monthly, self.df.index.max())
             
         except Exception as e:
             self._log(f"ERREUR lors du nettoyage : {str(e)}")
             raise
 
 
+# Étapes du tournoi d'analyze_and_configure, dans l'ordre d'exécution
+TOURNAMENT_STAGES = ("adf", "decomposition", "arima", "holtwinters", "prophet", "lstm", "cnn", "gru", "rnn",
+                     "sarimax_exog", "var", "varma")
+
+
+def _finite(value):
+    """Score JSON-compatible : float natif, ou None (inf / NaN)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+
 # ==============================================================================
 # CLASSE 2 : LE PRÉDICTEUR INTELLIGENT (SmartPredictor) - VERSION API
 # ==============================================================================
@@ -283,7 +1445,7 @@ class SmartPredictor:
       ✓ APRÈS : return {...}  →  Retourne les données (brutes) en JSON
     """
     
-    def __init__(self, df_data):
+    def __init__(self, df_data, on_event=None):
         """
         Constructeur : initialise le prédicteur avec des données propres.
         
@@ -291,12 +1453,17 @@ class SmartPredictor:
             df_data (pd.DataFrame): DataFrame avec :
                 - Index : dates (mensuel)
                 - Colonne 'montant' : valeurs à prédire
+            on_event (callable, optional): on_event(event, data) appelé pendant
+                le tournoi d'analyze_and_configure (voir _stage)
         """
         self.df = df_data
         self.model_name = "Inconnu"
         self.order = (0, 0, 0)
         self.seasonal_order = (0, 0, 0, 0)
         self.logs = []  # ← CHANGEMENT : On collecte les explications
+        self.on_event = on_event
+        self._scores = ({}, {})
+        self._leader = None
 
     def _log(self, msg):
         """
@@ -310,6 +1477,58 @@ class SmartPredictor:
         """
         self.logs.append(msg)
 
+    def _emit(self, event, **data):
+        """Transmet un événement du tournoi à on_event ; une erreur du callback n'interrompt pas l'analyse."""
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            logger.warning(f"Suivi du tournoi indisponible ({event}) : {str(e)}")
+
+    @contextmanager
+    def _stage(self, name, metric=None):
+        """
+        Encadre une étape du tournoi : stage_start, puis stage_end avec la durée
+        et ce que le bloc a renseigné dans le dict produit (score, status, détails).
+        Après une étape de modèle, émet provisional_best si le meneur a changé.
+        """
+        outcome = {"status": "ok"}
+        if metric is not None:
+            outcome["metric"] = metric
+        self._emit("stage_start", stage=name, index=TOURNAMENT_STAGES.index(name) + 1, total=len(TOURNAMENT_STAGES))
+        started = time.perf_counter()
+        try:
+            yield outcome
+        except Exception as e:
+            outcome.update(status="error", error_message=str(e))
+            raise
+        finally:
+            if "score" in outcome:
+                outcome["score"] = _finite(outcome["score"])
+                if outcome["score"] is None and outcome["status"] == "ok":
+                    outcome["status"] = "unavailable"
+            self._emit("stage_end", stage=name, duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                       **outcome)
+        if metric is not None:
+            self._offer_leader(name)
+
+    def _offer_leader(self, after_stage):
+        """
+        Meilleur modèle provisoire, avec la même priorité que le choix final
+        (modèles statistiques par AIC, sinon ML par MSE) ; la règle d'écart
+        SARIMA n'est appliquée qu'au classement final.
+        """
+        for family, metric, models in (("statistique", "aic", self._scores[0]), ("ml", "mse", self._scores[1])):
+            valid = {name: score for name, score in models.items() if _finite(score) is not None}
+            if valid:
+                leader = min(valid, key=valid.get)
+                if (leader, valid[leader]) != self._leader:
+                    self._leader = (leader, valid[leader])
+                    self._emit("provisional_best", model=leader, score=_finite(valid[leader]), metric=metric,
+                               family=family, after_stage=after_stage)
+                return
+
     def _calculer_aic(self, order, seasonal_order=(0, 0, 0, 0)):
         """
         Teste un modèle SARIMAX et retourne son critère AIC.
@@ -842,6 +2061,10 @@ class SmartPredictor:
         1️⃣  Diagnostique : ACF/PACF, stationnarité (ADF), saisonnalité
         2️⃣  Évaluer TOUS les modèles : SARIMA/ARIMA/AR/MA/ARMA + HW + Prophet + LSTM + CNN
         3️⃣  Classer par métrique (AIC/MSE), choisir le MEILLEUR automatiquement
+
+        SUIVI (si on_event est fourni) : chaque étape de TOURNAMENT_STAGES émet
+        stage_start puis stage_end (durée, score), provisional_best dès qu'un
+        modèle mène le classement, et model_selected pour le choix final.
         
         Raises:
             Exception: Si erreur lors de l'analyse
@@ -857,26 +2080,32 @@ class SmartPredictor:
             self._log("─" * 60)
             
             # Test ADF (stationnarité)
-            res_adf = adfuller(self.df['montant'].dropna())
-            p_adf = res_adf[1]
-            is_stationary = p_adf <= 0.05
-            self._log(f"Test ADF: p-value = {p_adf:.4f} → {'Stationnaire ✓' if is_stationary else 'Non-stationnaire ✗'}")
+            with self._stage("adf") as stage:
+                res_adf = adfuller(self.df['montant'].dropna())
+                p_adf = res_adf[1]
+                is_stationary = p_adf <= 0.05
+                self._log(f"Test ADF: p-value = {p_adf:.4f} → {'Stationnaire ✓' if is_stationary else 'Non-stationnaire ✗'}")
+                stage.update(p_value=_finite(p_adf), stationary=bool(is_stationary))
             
             # Saisonnalité
             has_seasonality = False
             season_amp = 0
-            if len(self.df) >= 24:
-                try:
-                    decomp = seasonal_decompose(self.df['montant'], period=12)
-                    season_amp = decomp.seasonal.max() - decomp.seasonal.min()
-                    total_amp = self.df['montant'].max() - self.df['montant'].min()
-                    # Seuil augmenté : 20% de l'amplitude totale
-                    has_seasonality = season_amp > 0.2 * total_amp
-                    self._log(f"Saisonnalité: {'Oui ✓' if has_seasonality else 'Non ✗'} (amplitude={season_amp:.0f})")
-                except Exception:
-                    self._log("⚠️  Impossible de calculer saisonnalité")
-            else:
-                self._log("⚠️  Pas assez de données pour saisonnalité (< 24 mois)")
+            with self._stage("decomposition") as stage:
+                if len(self.df) >= 24:
+                    try:
+                        decomp = seasonal_decompose(self.df['montant'], period=12)
+                        season_amp = decomp.seasonal.max() - decomp.seasonal.min()
+                        total_amp = self.df['montant'].max() - self.df['montant'].min()
+                        # Seuil augmenté : 20% de l'amplitude totale
+                        has_seasonality = season_amp > 0.2 * total_amp
+                        self._log(f"Saisonnalité: {'Oui ✓' if has_seasonality else 'Non ✗'} (amplitude={season_amp:.0f})")
+                        stage.update(seasonality=bool(has_seasonality), amplitude=_finite(season_amp))
+                    except Exception:
+                        self._log("⚠️  Impossible de calculer saisonnalité")
+                        stage["status"] = "error"
+                else:
+                    self._log("⚠️  Pas assez de données pour saisonnalité (< 24 mois)")
+                    stage["status"] = "skipped"
             
             # --- ÉTAPE 1 : ÉVALUER TOUS LES MODÈLES ---
             self._log("\n📈 ÉTAPE 2 : ÉVALUATION DE TOUS LES MODÈLES")
@@ -885,107 +2114,122 @@ class SmartPredictor:
             # Séparer les scores en deux catégories pour comparaison appropriée
             stats_models = {}  # modèles utilisant AIC
             ml_models = {}     # modèles utilisant MSE ou heuristiques
+            self._scores = (stats_models, ml_models)  # meilleur provisoire (voir _stage)
             
             # 1a) Modèles ARIMA/SARIMA
             self._log("1️⃣  Modèles ARIMA/SARIMA...")
-            if has_seasonality and len(self.df) >= 24:
-                aic_sarima = self._calculer_aic((1, 0, 1), seasonal_order=(1, 1, 1, 12))
-                stats_models['SARIMA(1,0,1)(1,1,1,12)'] = aic_sarima
-                self._log(f"   • SARIMA(1,0,1)(1,1,1,12): AIC={aic_sarima:.1f}")
-
-            if not is_stationary:
-                aic_arima = self._calculer_aic((1, 1, 1))
-                stats_models['ARIMA(1,1,1)'] = aic_arima
-                self._log(f"   • ARIMA(1,1,1): AIC={aic_arima:.1f}")
-            else:
-                # Tournoi AR/MA/ARMA
-                aic_ar = self._calculer_aic((1, 0, 0))
-                aic_ma = self._calculer_aic((0, 0, 1))
-                aic_arma = self._calculer_aic((1, 0, 1))
-                stats_models['AR(1)'] = aic_ar
-                stats_models['MA(1)'] = aic_ma
-                stats_models['ARMA(1,1)'] = aic_arma
-                self._log(f"   • AR(1): AIC={aic_ar:.1f}")
-                self._log(f"   • MA(1): AIC={aic_ma:.1f}")
-                self._log(f"   • ARMA(1,1): AIC={aic_arma:.1f}")
+            with self._stage("arima", metric="aic") as stage:
+                family = {}
+                if has_seasonality and len(self.df) >= 24:
+                    aic_sarima = self._calculer_aic((1, 0, 1), seasonal_order=(1, 1, 1, 12))
+                    family['SARIMA(1,0,1)(1,1,1,12)'] = aic_sarima
+                    self._log(f"   • SARIMA(1,0,1)(1,1,1,12): AIC={aic_sarima:.1f}")
+
+                if not is_stationary:
+                    aic_arima = self._calculer_aic((1, 1, 1))
+                    family['ARIMA(1,1,1)'] = aic_arima
+                    self._log(f"   • ARIMA(1,1,1): AIC={aic_arima:.1f}")
+                else:
+                    # Tournoi AR/MA/ARMA
+                    aic_ar = self._calculer_aic((1, 0, 0))
+                    aic_ma = self._calculer_aic((0, 0, 1))
+                    aic_arma = self._calculer_aic((1, 0, 1))
+                    family['AR(1)'] = aic_ar
+                    family['MA(1)'] = aic_ma
+                    family['ARMA(1,1)'] = aic_arma
+                    self._log(f"   • AR(1): AIC={aic_ar:.1f}")
+                    self._log(f"   • MA(1): AIC={aic_ma:.1f}")
+                    self._log(f"   • ARMA(1,1): AIC={aic_arma:.1f}")
+                stats_models.update(family)
+                stage.update(score=min(family.values(), default=float('inf')),
+                             models={name: _finite(score) for name, score in family.items()})
 
             # 1b) Holt-Winters
             self._log("2️⃣  Holt-Winters...")
-            hw_score = self._fit_holtwinters()
-            ml_models['HoltWinters'] = hw_score
-            self._log(f"   • HoltWinters: AIC/MSE={hw_score:.1f}")
+            with self._stage("holtwinters", metric="mse") as stage:
+                hw_score = stage["score"] = self._fit_holtwinters()
+                ml_models['HoltWinters'] = hw_score
+                self._log(f"   • HoltWinters: AIC/MSE={hw_score:.1f}")
 
             # 1c) Prophet
             self._log("3️⃣  Prophet...")
-            prophet_score = self._fit_prophet()
-            if prophet_score < float('inf'):
-                ml_models['Prophet'] = prophet_score
-                self._log(f"   • Prophet: MSE={prophet_score:.6f}")
-            else:
-                self._log(f"   • Prophet: non disponible")
+            with self._stage("prophet", metric="mse") as stage:
+                prophet_score = stage["score"] = self._fit_prophet()
+                if prophet_score < float('inf'):
+                    ml_models['Prophet'] = prophet_score
+                    self._log(f"   • Prophet: MSE={prophet_score:.6f}")
+                else:
+                    self._log(f"   • Prophet: non disponible")
 
             # 1d) Deep Learning (LSTM)
             self._log("4️⃣  Deep Learning (LSTM)...")
-            lstm_score = self._fit_lstm(look_back=12, epochs=10)
-            if lstm_score < float('inf'):
-                ml_models['LSTM'] = lstm_score
-                self._log(f"   • LSTM: Validation MSE={lstm_score:.6f}")
-            else:
-                self._log(f"   • LSTM: non disponible")
+            with self._stage("lstm", metric="mse") as stage:
+                lstm_score = stage["score"] = self._fit_lstm(look_back=12, epochs=10)
+                if lstm_score < float('inf'):
+                    ml_models['LSTM'] = lstm_score
+                    self._log(f"   • LSTM: Validation MSE={lstm_score:.6f}")
+                else:
+                    self._log(f"   • LSTM: non disponible")
 
             # 1e) Deep Learning (CNN)
             self._log("5️⃣  Deep Learning (CNN)...")
-            cnn_score = self._fit_cnn(look_back=12, epochs=10)
-            if cnn_score < float('inf'):
-                ml_models['CNN'] = cnn_score
-                self._log(f"   • CNN: Validation MSE={cnn_score:.6f}")
-            else:
-                self._log(f"   • CNN: non disponible")
+            with self._stage("cnn", metric="mse") as stage:
+                cnn_score = stage["score"] = self._fit_cnn(look_back=12, epochs=10)
+                if cnn_score < float('inf'):
+                    ml_models['CNN'] = cnn_score
+                    self._log(f"   • CNN: Validation MSE={cnn_score:.6f}")
+                else:
+                    self._log(f"   • CNN: non disponible")
 
             # 1f) Deep Learning (GRU)
             self._log("6️⃣  Deep Learning (GRU)...")
-            gru_score = self._fit_gru(look_back=12, epochs=10)
-            if gru_score < float('inf'):
-                ml_models['GRU'] = gru_score
-                self._log(f"   • GRU: Validation MSE={gru_score:.6f}")
-            else:
-                self._log(f"   • GRU: non disponible")
+            with self._stage("gru", metric="mse") as stage:
+                gru_score = stage["score"] = self._fit_gru(look_back=12, epochs=10)
+                if gru_score < float('inf'):
+                    ml_models['GRU'] = gru_score
+                    self._log(f"   • GRU: Validation MSE={gru_score:.6f}")
+                else:
+                    self._log(f"   • GRU: non disponible")
 
             # 1g) Deep Learning (RNN)
             self._log("7️⃣  Deep Learning (RNN)...")
-            rnn_score = self._fit_rnn(look_back=12, epochs=10)
-            if rnn_score < float('inf'):
-                ml_models['RNN'] = rnn_score
-                self._log(f"   • RNN: Validation MSE={rnn_score:.6f}")
-            else:
-                self._log(f"   • RNN: non disponible")
+            with self._stage("rnn", metric="mse") as stage:
+                rnn_score = stage["score"] = self._fit_rnn(look_back=12, epochs=10)
+                if rnn_score < float('inf'):
+                    ml_models['RNN'] = rnn_score
+                    self._log(f"   • RNN: Validation MSE={rnn_score:.6f}")
+                else:
+                    self._log(f"   • RNN: non disponible")
             
             # 1h) SARIMAX avec exogène
             self._log("8️⃣  SARIMAX (with exogenous trend)...")
-            sarimax_exog_score = self._fit_sarimax_exog()
-            if sarimax_exog_score < float('inf'):
-                model_scores['SARIMAX_EXOG'] = sarimax_exog_score
-                self._log(f"   • SARIMAX_EXOG: AIC={sarimax_exog_score:.1f}")
-            else:
-                self._log(f"   • SARIMAX_EXOG: non disponible")
+            with self._stage("sarimax_exog", metric="aic") as stage:
+                sarimax_exog_score = stage["score"] = self._fit_sarimax_exog()
+                if sarimax_exog_score < float('inf'):
+                    stats_models['SARIMAX_EXOG'] = sarimax_exog_score
+                    self._log(f"   • SARIMAX_EXOG: AIC={sarimax_exog_score:.1f}")
+                else:
+                    self._log(f"   • SARIMAX_EXOG: non disponible")
             
             # 1i) VAR (Vector Autoregression)
             self._log("9️⃣  VAR (Vector Autoregression)...")
-            var_score = self._fit_var()
-            if var_score < float('inf'):
-                model_scores['VAR'] = var_score
-                self._log(f"   • VAR: AIC={var_score:.1f}")
-            else:
-                self._log(f"   • VAR: non disponible")
+            with self._stage("var", metric="aic") as stage:
+                var_score = stage["score"] = self._fit_var()
+                if var_score < float('inf'):
+                    stats_models['VAR'] = var_score
+                    self._log(f"   • VAR: AIC={var_score:.1f}")
+                else:
+                    self._log(f"   • VAR: non disponible")
             
             # 1j) VARMA (Vector ARMA)
             self._log("🔟 VARMA (Vector ARMA)...")
-            varma_score = self._fit_varma()
-            if varma_score < float('inf'):
-                model_scores['VARMA'] = varma_score
-                self._log(f"   • VARMA: AIC={varma_score:.1f}")
-            else:
-                self._log(f"   • VARMA: non disponible")
+            with self._stage("varma", metric="aic") as stage:
+                varma_score = stage["score"] = self._fit_varma()
+                if varma_score < float('inf'):
+                    stats_models['VARMA'] = varma_score
+                    self._log(f"   • VARMA: AIC={varma_score:.1f}")
+                else:
+                    self._log(f"   • VARMA: non disponible")
             
             # --- ÉTAPE 2 : CLASSEMENT & CHOIX ---
             self._log("\n🏆 ÉTAPE 3 : CLASSEMENT & CHOIX DU MEILLEUR MODÈLE")
@@ -1089,6 +2333,8 @@ class SmartPredictor:
                 self.seasonal_order = (0, 0, 0, 0)
             
             self._log(f"\n✓ Configuration finale : model={self.model_name}, order={self.order}, seasonal={self.seasonal_order}")
+            self._emit("model_selected", model=self.model_name, candidate=best_model_name, score=_finite(best_score),
+                       order=list(self.order), seasonal_order=list(self.seasonal_order))
             
         except Exception as e:
             self._log(f"❌ ERREUR lors de l'analyse : {str(e)}")
@@ -1098,7 +2344,7 @@ class SmartPredictor:
             self.seasonal_order = (1, 1, 1, 12)
             raise
 
-    def get_prediction_data(self, months=None):
+    def get_prediction_data(self, months=None, include=None):
         """
         ← CHANGEMENT 4 : Entraîne le modèle et retourne les prévisions en DICTIONNAIRE.
         Intègre également la validation intelligente de la durée (Smart Duration).
@@ -1114,6 +2360,8 @@ class SmartPredictor:
             months (int, optional): Nombre de mois à prédire.
                 - Si None : Mode AUTO (utilise calculate_and_validate_duration)
                 - Si int : Mode UTILISATEUR (mais sera validé par Smart Duration)
+            include (tuple, optional): sections demandées (voir RESPONSE_SECTIONS) ;
+                sans "anomalies", la détection d'anomalies n'est pas exécutée.
         
         Returns:
             dict: Dictionnaire JSON contenant :
@@ -1229,10 +2477,16 @@ class SmartPredictor:
             forecast = results.get_forecast(steps=validated_months)
             pred = forecast.predicted_mean
             conf = forecast.conf_int()  # Intervalles 95% par défaut
+            # Série parfaitement ajustée : variance nulle → bornes NaN (non sérialisables en JSON)
+            conf = conf.apply(lambda bound: bound.fillna(pred))
             
             # ← KILLER FEATURE 1 : Détection d'anomalies (AI for Audit)
             # Utilise les résidus du modèle pour détecter les écarts anormaux
-            anomalies = self._detect_anomalies(results)
+            if include is None or "anomalies" in include:
+                anomalies = self._detect_anomalies(results)
+            else:
+                anomalies = []
+                self._log("🔍 Détection d'anomalies non demandée (include) : ignorée")
             
             # Préparer le dictionnaire retour (JSON-ready)
             return {
@@ -1422,7 +2676,22 @@ class SmartPredictor:
 
 
 
-def predict_from_file_content(file_content, months=None):
+# Étapes du pipeline et avancement associé (suivi des jobs asynchrones)
+PIPELINE_STAGES = {"lecture": 0.0, "analyse": 0.3, "prévision": 0.8, "terminé": 1.0}
+
+
+def report_progress(progress, stage, fraction=None):
+    """Signale une étape au callback `progress` ; une erreur du callback n'interrompt pas la prédiction."""
+    if progress is None:
+        return
+    try:
+        progress(stage, PIPELINE_STAGES.get(stage, 0.0) if fraction is None else fraction)
+    except Exception as e:
+        logger.warning(f"Suivi de progression indisponible ({stage}) : {str(e)}")
+
+
+def predict_from_file_content(file_content, months=None, chunksize=None, workers=None, schema=None, lean=None,
+                              compression=None, include=None, progress=None, events=None):
     """
     ╔════════════════════════════════════════════════════════════════════════╗
     │ FONCTION PRINCIPALE : Orchestre le pipeline complet                    │
@@ -1489,6 +2758,31 @@ def predict_from_file_content(file_content, months=None):
               • Utilisateur demande une durée spécifique
               • Système valide via Smart Duration
               • Peut être réduit si données insuffisantes
+
+        chunksize (int, optional): Si défini, DataCleaner lit la source par blocs
+            de `chunksize` lignes (mode streaming, voir DataCleaner).
+
+        workers (int, optional): Si > 1, DataCleaner découpe le CSV en plages
+            d'octets agrégées en parallèle par autant de processus.
+
+        schema (dict, optional): Indications explicites (sep, date_col, amount_col,
+            date_format, decimal, thousands) qui court-circuitent la détection.
+
+        lean (bool, optional): Mode mémoire réduite (voir DataCleaner) ; None =
+            variable d'environnement LEAN_MODE.
+
+        compression (str, optional): 'gzip' ou 'zstd' (ex : Content-Encoding) ;
+            None = détection par signature.
+
+        include (tuple, optional): sections demandées (voir RESPONSE_SECTIONS) ;
+            les calculs des sections absentes sont évités (anomalies). Le
+            découpage de la réponse elle-même est fait par shape_result.
+
+        progress (callable, optional): progress(stage, fraction) appelé à chaque
+            étape du pipeline (voir PIPELINE_STAGES) ; sert au suivi des jobs.
+
+        events (callable, optional): events(event, data) appelé à chaque étape
+            du tournoi de modèles (voir SmartPredictor._stage) ; sert au flux SSE.
     
     Returns:
         dict: Résultat complet avec structure :
@@ -1525,31 +2819,101 @@ def predict_from_file_content(file_content, months=None):
         Rien ! (toutes les exceptions sont capturées et retournées en JSON)
     """
     try:
+        report_progress(progress, "lecture")
+
         # Étape 1️⃣  : NETTOYAGE ET PRÉPARATION DES DONNÉES
         # ═════════════════════════════════════════════════════════════════════
         # Rôle : Transformer les bytes bruts en DataFrame propre (mensuel)
         # Sortie : DataFrame avec index=dates, colonne 'montant'=valeurs
-        cleaner = DataCleaner(file_content)
+        cleaner = DataCleaner(file_content, chunksize=chunksize, workers=workers, schema=schema, lean=lean,
+                              compression=compression)
+        del file_content  # seul le nettoyeur garde les octets (lâchés après run() en mode lean)
         df_clean = cleaner.run()
-        
+    except Exception as e:
+        # ❌ ERREUR : Retourner une structure JSON d'erreur (pas d'exception levée)
+        return {
+            "status": "error",
+            "error_message": str(e),
+            "explanations": []
+        }
+
+    # Étapes 2️⃣  et 3️⃣  : voir predict_from_series
+    return predict_from_series(df_clean, months=months, logs=cleaner.logs, include=include, progress=progress,
+                               events=events)
+
+
+def predict_from_frame(frame, months=None, date_col='date', amount_col='montant', include=None):
+    """
+    Point d'entrée pour des lignes DÉJÀ en mémoire (une ligne = une transaction).
+
+    Évite l'aller-retour DataFrame → CSV → bytes → parsing : aucune détection
+    de séparateur ni de colonnes ; dates datetime et montants numériques sont
+    repris tels quels (sinon : mêmes règles de parsing que les fichiers).
+
+    Args:
+        frame (pd.DataFrame): au moins les colonnes `date_col` et `amount_col`
+        months (int, optional): voir predict_from_file_content
+        include (tuple, optional): voir predict_from_file_content
+
+    Returns:
+        dict: même structure que predict_from_file_content
+    """
+    cleaner = DataCleaner(None)
+    try:
+        df_clean = cleaner.run_frame(frame, date_col=date_col, amount_col=amount_col)
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": str(e),
+            "explanations": cleaner.logs
+        }
+    return predict_from_series(df_clean, months=months, logs=cleaner.logs, include=include)
+
+
+def predict_from_series(monthly, months=None, logs=None, include=None, progress=None, events=None):
+    """
+    Point d'entrée pour une série MENSUELLE déjà agrégée.
+
+    Args:
+        monthly (pd.Series | pd.DataFrame): montants indexés par date (une
+            valeur par mois ; Series, ou DataFrame avec une colonne 'montant').
+            L'index est ramené au 1er du mois, les mois manquants valent 0.
+        months (int, optional): voir predict_from_file_content
+        logs (list, optional): explications déjà produites (nettoyage)
+        include (tuple, optional): voir predict_from_file_content
+        progress (callable, optional): voir predict_from_file_content
+        events (callable, optional): voir predict_from_file_content
+
+    Returns:
+        dict: même structure que predict_from_file_content
+    """
+    try:
+        series = monthly['montant'] if isinstance(monthly, pd.DataFrame) else monthly
+        series = pd.Series(np.asarray(series, dtype='float64'), index=pd.DatetimeIndex(series.index))
+        df_clean = series.resample('MS').sum().to_frame(name='montant')
+        df_clean.index.name = 'clean_date'
+
         # Étape 2️⃣  : ANALYSE ET SÉLECTION DU MODÈLE
         # ═════════════════════════════════════════════════════════════════════
         # Rôle : Analyser la série et choisir le meilleur modèle
         # Sorties : model_name, order, seasonal_order + logs
-        predictor = SmartPredictor(df_clean)
+        report_progress(progress, "analyse")
+        predictor = SmartPredictor(df_clean, on_event=events)
         predictor.analyze_and_configure()
         
         # Combiner les logs des deux étapes pour transparence maximale
-        all_logs = cleaner.logs + predictor.logs
+        all_logs = list(logs or []) + predictor.logs
         
         # Étape 3️⃣  : GÉNÉRATION DE PRÉVISIONS
         # ═════════════════════════════════════════════════════════════════════
         # Rôle : Entraîner le modèle et générer les prévisions
         # Sortie : Dictionnaire avec historique + prévisions + intervalles
-        result = predictor.get_prediction_data(months=months)
+        report_progress(progress, "prévision")
+        result = predictor.get_prediction_data(months=months, include=include)
         
         # Ajouter tous les logs au résultat final
         result["explanations"] = all_logs
+        report_progress(progress, "terminé")
         
         return result
         
@@ -1558,5 +2922,309 @@ def predict_from_file_content(file_content, months=None):
         return {
             "status": "error",
             "error_message": str(e),
-            "explanations": []
+            "explanations": list(logs or [])
+        }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# PRÉDICTION PAR CODE ORDONNATEUR (unitaire et par lots)
+# ═══════════════════════════════════════════════════════════════════════════
+# Une série trop courte ou constante (ou un pipeline en échec) reçoit une
+# prévision naïve constante : tous les ordonnateurs obtiennent une réponse.
+
+NAIVE_MIN_ROWS = 6
+
+
+def naive_forecast(df_export, months=None):
+    """Prévision constante (dernière valeur) sur `months` mois (6 par défaut)."""
+    last_value = float(df_export['montant'].iloc[-1]) if len(df_export) > 0 else 0.0
+    validated_months = months or 6
+    forecast_dates = []
+    try:
+        start = pd.to_datetime(df_export['date'].iloc[-1])
+        for i in range(validated_months):
+            forecast_dates.append((start + pd.offsets.MonthBegin(i + 1)).strftime('%Y-%m-%d'))
+    except Exception:
+        forecast_dates = [None] * validated_months
+
+    return {
+        "status": "success",
+        "model_info": {
+            "name": "NAIVE_CONSTANT",
+            "order": "()",
+            "seasonal_order": "()",
+            "aic": 0.0
+        },
+        "explanations": ["Fallback: série trop courte, constante ou SARIMA échoué, prévision naive utilisée"],
+        "history": {
+            "dates": df_export['date'].astype(str).tolist(),
+            "values": df_export['montant'].tolist()
+        },
+        "forecast": {
+            "dates": forecast_dates,
+            "values": [last_value] * validated_months,
+            "confidence_upper": [last_value] * validated_months,
+            "confidence_lower": [last_value] * validated_months
+        },
+        "anomalies": [],
+        "timestamp": pd.Timestamp.now().isoformat(),
+        "duration_info": {
+            "requested_months": months,
+            "validated_months": validated_months,
+            "reason": "FALLBACK - naive or SARIMA failure"
         }
+    }
+
+
+def predict_for_code(df_export, months=None, code=None, include=None):
+    """
+    Prédiction pour les lignes d'un seul ordonnateur.
+
+    Args:
+        df_export (pd.DataFrame): colonnes 'date' et 'montant' (montants déjà
+            numériques, lignes invalides retirées)
+        months (int, optional): voir predict_from_file_content
+        code (str, optional): code ordonnateur (journalisation seulement)
+        include (tuple, optional): voir predict_from_file_content
+
+    Returns:
+        dict: résultat du pipeline complet, ou prévision naïve si la série est
+        trop courte (< NAIVE_MIN_ROWS lignes), constante, ou si le pipeline échoue
+    """
+    if df_export['montant'].nunique() > 1 and len(df_export) >= NAIVE_MIN_ROWS:
+        try:
+            result = predict_from_frame(df_export, months=months, include=include)
+            if result.get("status") == "success":
+                return result
+        except Exception as e:
+            logger.warning(f"SARIMA failed for code {code}: {str(e)}, using naive fallback")
+    return naive_forecast(df_export, months)
+
+
+def predict_code_task(task):
+    """Tâche d'un processus du lot : (code, dates, montants, months, include) → résultat."""
+    code, dates, amounts, months, include = task
+    try:
+        result = predict_for_code(pd.DataFrame({'date': dates, 'montant': amounts}), months=months, code=code,
+                                  include=include)
+    except Exception as e:
+        result = {"status": "error", "error_message": str(e), "explanations": []}
+    return {"code": code, **result}
+
+
+def code_forecast_tasks(frame, codes=None, months=None, include=None):
+    """
+    Prépare les prévisions de plusieurs ordonnateurs.
+
+    La table est découpée par code en UN seul groupby ; chaque tâche est
+    ensuite exécutée par predict_code_task, typiquement dans le pool de
+    prédiction (voir prediction_pool.PredictionPool.map), qui rend les
+    résultats dans l'ordre où ils se terminent.
+
+    Args:
+        frame (pd.DataFrame): colonnes 'code', 'date', 'montant' (typées)
+        codes (list, optional): codes voulus ; None = tous
+        months (int, optional): voir predict_from_file_content (None = MODE AUTO)
+        include (tuple, optional): voir predict_from_file_content
+
+    Returns:
+        tuple: (tâches picklables pour predict_code_task,
+                résultats status "error" des codes absents)
+    """
+    groups = frame.groupby('code', sort=True).indices
+    wanted = list(groups) if codes is None else list(dict.fromkeys(str(c).strip() for c in codes))
+    dates, amounts = frame['date'].to_numpy(), frame['montant'].to_numpy(dtype='float64')
+
+    tasks, missing = [], []
+    for code in wanted:
+        if code not in groups:
+            missing.append({"code": code, "status": "error", "error_message": f"Code '{code}' non trouvé dans le fichier"})
+            continue
+        idx = groups[code]
+        tasks.append((code, dates[idx], amounts[idx], months, include))
+    return tasks, missing
+
+
+def predict_file_task(task):
+    """Tâche d'un processus du lot : (position, nom, contenu, compression, months, schema, include) → résultat."""
+    index, filename, content, compression, months, schema, include = task
+    try:
+        result = predict_from_file_content(content, months=months, schema=schema, compression=compression,
+                                           include=include)
+    except Exception as e:
+        result = {"status": "error", "error_message": str(e), "explanations": []}
+    return {"index": index, "file": filename, **result}
+
+
+def file_forecast_tasks(files, months=None, schema=None, include=None):
+    """
+    Prépare les prévisions de plusieurs fichiers indépendants.
+
+    Chaque fichier suit le pipeline complet de predict_from_file_content
+    (predict_file_task) ; un fichier invalide donne un résultat status
+    "error" sans interrompre les autres.
+
+    Args:
+        files (list): tuples (nom, contenu binaire ou chemin, compression ou None)
+        months (int, optional): voir predict_from_file_content (None = MODE AUTO)
+        schema (dict, optional): indications de schéma communes à tous les fichiers
+        include (tuple, optional): voir predict_from_file_content
+
+    Returns:
+        list: tâches picklables ; le résultat porte "index" (position dans
+        `files`) et "file" (nom)
+    """
+    return [(i, name, content, compression, months, schema, include)
+            for i, (name, content, compression) in enumerate(files)]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# FORME DES RÉPONSES : sections demandées et format compact
+# ═══════════════════════════════════════════════════════════════════════════
+# Les consommateurs automatiques n'utilisent souvent que la prévision : on
+# retire les sections non demandées et, en format compact, les listes de dates
+# mensuelles deviennent (start, freq) et les anomalies des colonnes. Les séries
+# longues peuvent être sous-échantillonnées (LTTB) pour l'affichage.
+
+RESPONSE_SECTIONS = ("forecast", "history", "anomalies", "explanations")
+DOWNSAMPLE_KEEP_LAST = 12   # derniers points toujours conservés tels quels
+
+
+def parse_include(value):
+    """
+    'forecast,history' → ('forecast', 'history') ; None ou vide → None (toutes).
+
+    Raises:
+        ValueError: section inconnue
+    """
+    if value is None or not value.strip():
+        return None
+    sections = tuple(dict.fromkeys(s.strip().lower() for s in value.split(",") if s.strip()))
+    unknown = [s for s in sections if s not in RESPONSE_SECTIONS]
+    if unknown:
+        raise ValueError(f"Section(s) inconnue(s) : {', '.join(unknown)} (attendu : {', '.join(RESPONSE_SECTIONS)})")
+    return sections
+
+
+def _compact_dates(dates):
+    """{"start", "freq": "MS"} si les dates sont des débuts de mois consécutifs, sinon {"dates": [...]}."""
+    if dates and None not in dates:
+        index = pd.DatetimeIndex(dates)
+        if index.equals(pd.date_range(index[0], periods=len(index), freq='MS')):
+            return {"start": dates[0], "freq": "MS"}
+    return {"dates": list(dates)}
+
+
+def lttb_indices(values, n_out):
+    """
+    Largest-Triangle-Three-Buckets : positions des `n_out` points qui
+    préservent le mieux la forme visuelle de la série.
+
+    Premier et dernier points gardés ; les autres sont répartis en n_out - 2
+    seaux et, dans chaque seau, on garde le point formant le plus grand
+    triangle avec le point retenu au seau précédent et la moyenne du seau
+    suivant. Les moyennes sont calculées d'un bloc (np.add.reduceat) ; seule
+    la chaîne des points retenus reste séquentielle (une itération par seau).
+
+    Returns:
+        np.ndarray: positions croissantes (toutes si n_out >= len(values))
+    """
+    y = np.asarray(values, dtype='float64')
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 1)])
+
+    x = np.arange(n, dtype='float64')
+    # Débuts des n_out - 2 seaux sur [1, n-1), puis du seau final (le dernier point)
+    starts = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(np.append(starts, n))
+    avg_x = np.add.reduceat(x, starts) / counts
+    avg_y = np.add.reduceat(y, starts) / counts
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = starts[i], starts[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_section(section, max_points, keep_dates=()):
+    """
+    Sous-échantillonne une section {"dates", "values", ...} à environ max_points.
+
+    Les derniers points (jusqu'à DOWNSAMPLE_KEEP_LAST, au plus un quart du
+    budget, au moins le dernier) et TOUTES les dates de `keep_dates` (anomalies) sont conservés
+    exactement ; LTTB choisit les autres dans le budget restant. max_points
+    n'est donc dépassé que si les anomalies ne tiennent pas dans le budget,
+    et au plus du nombre d'anomalies. Toutes les listes de la section
+    (intervalles de confiance...) sont filtrées aux mêmes positions ;
+    "original_points" garde la taille initiale.
+    """
+    dates, values = section.get("dates") or [], section.get("values") or []
+    n = len(values)
+    if not max_points or n <= max_points or len(dates) != n:
+        return section
+
+    keep = set(range(n - min(DOWNSAMPLE_KEEP_LAST, max(max_points // 4, 1)), n))
+    if keep_dates:
+        position = {d: i for i, d in enumerate(dates)}
+        keep.update(i for i in map(position.get, keep_dates) if i is not None)
+    budget = max_points - len(keep)
+    shape = lttb_indices(values, budget) if budget > 0 else []
+    positions = np.union1d(shape, np.fromiter(keep, dtype=int)).astype(int)
+
+    sampled = {k: ([v[i] for i in positions] if isinstance(v, list) and len(v) == n else v)
+               for k, v in section.items()}
+    sampled["original_points"] = n
+    return sampled
+
+
+def shape_result(result, include=None, compact=False, max_points=None):
+    """
+    Réponse réduite aux sections demandées, éventuellement en format compact.
+
+    Les champs de contexte (status, model_info, duration_info, timestamp,
+    error_message, identifiants) sont toujours conservés.
+
+    Format compact :
+        history   {"start": "2020-01-01", "freq": "MS", "values": [...]}
+        forecast  {"start": ..., "freq": "MS", "values": [...],
+                   "confidence_upper": [...], "confidence_lower": [...]}
+        anomalies {"date": [...], "actual_value": [...], ...} (colonnes)
+
+    Args:
+        result (dict): résultat de predict_from_file_content (ou variantes)
+        include (tuple, optional): sections gardées (None = toutes)
+        compact (bool): applique le format compact
+        max_points (int, optional): taille max de history / forecast
+            (LTTB, voir downsample_section) ; les dates d'anomalies restent toutes
+            exactes, quitte à dépasser max_points de leur nombre
+
+    Returns:
+        dict: nouveau dictionnaire (result n'est pas modifié)
+    """
+    shaped = {k: v for k, v in result.items() if include is None or k not in RESPONSE_SECTIONS or k in include}
+    if max_points:
+        anomaly_dates = [a.get("date") for a in result.get("anomalies") or [] if isinstance(a, dict)]
+        for key in ("history", "forecast"):
+            if isinstance(shaped.get(key), dict):
+                shaped[key] = downsample_section(shaped[key], max_points, keep_dates=anomaly_dates)
+    if not compact:
+        return shaped
+
+    for key in ("history", "forecast"):
+        section = shaped.get(key)
+        if isinstance(section, dict) and "dates" in section:
+            arrays = {k: v for k, v in section.items() if k != "dates"}
+            shaped[key] = {**_compact_dates(section["dates"]), **arrays}
+    anomalies = shaped.get("anomalies")
+    if isinstance(anomalies, list):
+        columns = list(dict.fromkeys(k for anomaly in anomalies for k in anomaly))
+        shaped["anomalies"] = {k: [anomaly.get(k) for anomaly in anomalies] for k in columns}
+    return shaped
@@ -14,18 +14,33 @@ Cette API permet aux utilisateurs de :
 """
 
 from fastapi import FastAPI, UploadFile, File, Query, HTTPException, Header, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 from loguru import logger
-import pandas as pd
-import io
 
-from logic import predict_from_file_content
+from logic import (
+    predict_from_file_content, predict_for_code, code_forecast_tasks, predict_code_task,
+    file_forecast_tasks, predict_file_task,
+    parse_include, shape_result, RESPONSE_SECTIONS,
+)
 from models.database import db_config
-from db_endpoints import router_db, save_uploaded_file, save_prediction
+from db_endpoints import router_db, persist_result, hash_frame
+from uploads import UploadSizeLimitMiddleware, open_upload, upload_compression, spool_upload
+from prediction_pool import prediction_pool, PoolSaturated
+from job_queue import submit_job, get_job, requeue_orphans, job_workers
+from payloads import (
+    FORMATS, check_format, render, iter_encoded, stream_media_type,
+    check_sse_format, sse_event, SSE_MEDIA_TYPE, SSE_KEEPALIVE,
+)
+from dataset_registry import (
+    ingest_dataset, load_meta, dataset_path, read_dataset, code_catalog, parse_code_frame, CATALOG_SORTS,
+    code_index, code_index_for_upload,
+)
 
 # ═══════════════════════════════════════════════════════════════════════════
 # 🔧 CHARGEMENT DES VARIABLES D'ENVIRONNEMENT
@@ -41,6 +56,8 @@ API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
 LOG_DIR = os.getenv("LOG_DIR", "logs")
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 52428800))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "30"))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
 
 # Créer répertoire logs
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -80,6 +97,94 @@ def verify_api_key(x_api_key: Optional[str] = Header(None, alias="X-API-Key")):
     logger.info(f"✅ Accès autorisé : Clé API valide")
     return x_api_key
 
+# ═══════════════════════════════════════════════════════════════════════════
+# 📍 DÉPENDANCE : Indications de schéma (court-circuitent la détection)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def schema_hints(
+    sep: Optional[str] = Query(None, min_length=1, max_length=1, description="Séparateur CSV (ex: ';')"),
+    date_col: Optional[str] = Query(None, description="Nom de la colonne date"),
+    amount_col: Optional[str] = Query(None, description="Nom de la colonne montant"),
+    date_format: Optional[str] = Query(None, description="Format de date (ex: '%d/%m/%Y' ou 'ISO8601')"),
+    decimal: Optional[str] = Query(None, pattern="^[.,]$", description="Séparateur décimal des montants"),
+    thousands: Optional[str] = Query(None, max_length=2, description="Séparateur(s) de milliers ('' = aucun)"),
+):
+    """
+    Schéma explicite optionnel pour /predict et /predict/auto. Les valeurs
+    fournies remplacent la détection automatique (séparateur, colonnes, formats).
+    """
+    hints = {
+        "sep": sep, "date_col": date_col, "amount_col": amount_col,
+        "date_format": date_format, "decimal": decimal, "thousands": thousands,
+    }
+    return {k: v for k, v in hints.items() if v is not None}
+
+# ═══════════════════════════════════════════════════════════════════════════
+# 📍 DÉPENDANCE : Forme de la réponse (sections, format)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def output_options(
+    include: Optional[str] = Query(None, description=f"Sections à retourner, séparées par des virgules : {', '.join(RESPONSE_SECTIONS)} (défaut : toutes)"),
+    fmt: str = Query("json", alias="format", description=f"Format : {', '.join(FORMATS)} (compact = start + freq + tableaux)"),
+    max_points: Optional[int] = Query(None, ge=3, description="Points max par série history/forecast (sous-échantillonnage LTTB ; anomalies toujours gardées, en plus si besoin)"),
+):
+    """
+    Sections et format de la réponse. Les sections absentes ne sont pas
+    sérialisées ; elles ne sont pas non plus calculées (anomalies) quand le
+    résultat n'est pas persisté (/predict/by-codes) : l'historique d'audit
+    n'enregistre donc jamais "0 anomalie" pour une détection non faite.
+    max_points sous-échantillonne les séries longues pour l'affichage.
+    """
+    return {"include": parse_include(include), "format": check_format(fmt), "max_points": max_points}
+
+
+def shaped(result, output):
+    """Résultat réduit aux sections demandées, au format demandé."""
+    return shape_result(result, include=output["include"], compact=output["format"] != "json",
+                        max_points=output["max_points"])
+
+
+def open_source(file: Optional[UploadFile], dataset_id: Optional[str]):
+    """
+    Source à prédire : dataset enregistré (Parquet typé) ou fichier uploadé.
+
+    Returns:
+        tuple: (source lisible par DataCleaner, compression, nom de fichier,
+                SHA256 déjà connu ou None)
+    """
+    if dataset_id:
+        meta = load_meta(dataset_id)
+        return dataset_path(dataset_id), None, meta.get("filename") or dataset_id, dataset_id
+    if file is None:
+        raise ValueError("Envoyer un fichier (file) ou un dataset_id")
+    return open_upload(file, MAX_FILE_SIZE), upload_compression(file), file.filename or "unknown", None
+
+
+def discard_spooled(path):
+    """Supprime une copie d'upload faite par spool_upload (déjà absente : rien à faire)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@asynccontextmanager
+async def pool_source(source):
+    """
+    Source transmissible au pool de processus : chemin tel quel ; flux uploadé →
+    copié dans un fichier temporaire nommé (dans un thread, par blocs), dont
+    le chemin est passé au worker, puis supprimé à la sortie du bloc.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+    path = await run_in_threadpool(spool_upload, source)
+    try:
+        yield path
+    finally:
+        discard_spooled(path)
+
+
 # Créer l'application FastAPI
 app = FastAPI(
     title="API Prédiction des Dépenses (SÉCURISÉE)",
@@ -87,6 +192,14 @@ app = FastAPI(
     version="2.0.0 (Industrielle)"
 )
 
+# Uploads : limite de taille appliquée pendant la réception du corps
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=MAX_FILE_SIZE,
+    paths=("/predict", "/jobs", "/datasets"),
+    path_limits={"/predict/bulk": MAX_FILE_SIZE * BULK_MAX_FILES},
+)
+
 
 # ═══════════════════════════════════════════════════════════════════════════
 # STARTUP : Initialiser la base de données
@@ -100,6 +213,20 @@ def startup_event():
     except Exception as e:
         logger.error(f"❌ Erreur init BD : {str(e)}")
 
+    # Jobs asynchrones : reprendre ceux interrompus par l'arrêt précédent
+    try:
+        requeue_orphans()
+        job_workers.start()
+    except Exception as e:
+        logger.error(f"❌ Erreur démarrage des workers de jobs : {str(e)}")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Arrêter le pool de prédiction (tâches en attente annulées) et les workers de jobs."""
+    prediction_pool.shutdown()
+    job_workers.stop()
+
 
 # ═══════════════════════════════════════════════════════════════════════════
 # INCLURE LE ROUTEUR BASE DE DONNÉES
@@ -155,7 +282,12 @@ def health_check():
         "status_human": "🟢 online",
         "version": "2.0.0",
         "timestamp": datetime.now().isoformat(),
-        "security": "🔒 API Key required on /predict endpoints"
+        "security": "🔒 API Key required on /predict endpoints",
+        "prediction_pool": {
+            "workers": prediction_pool.workers,
+            "in_flight": prediction_pool.in_flight,
+            "capacity": prediction_pool.capacity,
+        },
     }
 
 
@@ -205,8 +337,11 @@ def api_info():
 
 @app.post("/predict", tags=["Prédiction 🔒 Sécurisée"])
 async def predict_upload(
-    file: UploadFile = File(..., description="Fichier CSV à prédire"),
+    file: Optional[UploadFile] = File(None, description="Fichier CSV à prédire"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
     months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois (optionnel, MODE AUTO si vide)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
     api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
 ):
     """
@@ -251,6 +386,16 @@ async def predict_upload(
     - `months` : (Optionnel) Nombre de mois à prédire
       - Si omis (None) : Le système décide automatiquement via Smart Duration
       - Si fourni : Le système valide et peut réduire si données insuffisantes
+    - `sep`, `date_col`, `amount_col`, `date_format`, `decimal`, `thousands` :
+      (Optionnels) Schéma explicite, sans détection automatique
+    - `dataset_id` : (Alternative à `file`) dataset enregistré via `POST /datasets`
+    - `include` : (Optionnel) sections retournées parmi forecast, history,
+      anomalies, explanations (ex : `include=forecast`) ; défaut : toutes
+    - `format` : (Optionnel) `json` (défaut), `compact` (start + freq +
+      tableaux de valeurs) ou `msgpack` (si installé)
+    - `max_points` : (Optionnel) points max de `history` / `forecast`
+      (sous-échantillonnage LTTB ; derniers mois et toutes les dates d'anomalies exacts,
+      quitte à dépasser `max_points` du nombre d'anomalies)
     - `X-API-Key` : Header requis avec votre clé API
     
     **Retour :**
@@ -262,13 +407,21 @@ async def predict_upload(
     - `explanations` : Logs détaillés de toute l'analyse
     """
     
+    # File de prédiction pleine → 503 + Retry-After, avant même de lire l'upload
+    prediction_pool.check_capacity()
+
+    # Valider la taille ; le flux (mémoire ou disque) est copié sur disque pour le worker
+    upload, compression, filename, file_hash = open_source(file, dataset_id)
+
     try:
-        # Valider et lire le fichier
-        file_content = await file.read()
-        
         # Appeler le moteur de prédiction avec mode HYBRIDE
-        # (months peut être None pour MODE AUTO)
-        result = predict_from_file_content(file_content, months=months)
+        # (months peut être None pour MODE AUTO), hors de la boucle d'événements.
+        # Sans include : le résultat est persisté, les anomalies sont toujours détectées
+        async with pool_source(upload) as source:
+            result = await prediction_pool.run(
+                predict_from_file_content, source, months=months, schema=schema,
+                compression=compression,
+            )
         
         # Si le moteur signale une erreur, renvoyer un code 400
         if result.get("status") != "success":
@@ -276,52 +429,14 @@ async def predict_upload(
             return JSONResponse(status_code=400, content=result)
 
         # ← KILLER FEATURE 2 & 1 : Persister la prédiction et les anomalies
-        try:
-            from models.database import get_session
-            session = next(get_session())
-            
-            # Persister le fichier uploadé
-            from datetime import datetime
-            file_id = save_uploaded_file(
-                api_key=api_key,
-                filename=file.filename or "unknown",
-                file_content=file_content,
-                row_count=len(result.get("history", {}).get("values", [])),
-                date_range_start=result.get("history", {}).get("dates", [None])[0],
-                date_range_end=result.get("history", {}).get("dates", [None])[-1],
-                session=session,
-            )
-            
-            # Persister la prédiction
-            pred_id = save_prediction(
-                api_key=api_key,
-                file_id=file_id,
-                model_name=result["model_info"]["name"],
-                model_order=result["model_info"]["order"],
-                seasonal_order=result["model_info"]["seasonal_order"],
-                forecast_months=result["duration_info"]["validated_months"],
-                model_aic=result["model_info"]["aic"],
-                forecast_json=result.get("forecast", {}),
-                anomalies_list=result.get("anomalies", []),
-                session=session,
-            )
-            
-            result["_internal"] = {
-                "file_id": file_id,
-                "pred_id": pred_id,
-                "persisted": True,
-            }
-            
-            logger.info(f"✅ Prédiction sauvegardée : ID={pred_id}, Anomalies={len(result.get('anomalies', []))}")
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Persistance BD échouée (prédiction quand même retournée) : {str(e)}")
-            result["_internal"] = {"persisted": False, "error": str(e)}
+        persist_result(api_key, filename, result, file_content=upload, file_hash=file_hash)
 
         logger.info(f"✅ Prédiction réussie : {result['model_info']['name']}, {result['duration_info']['validated_months']} mois, {len(result.get('anomalies', []))} anomalies")
         
-        return result
+        return render(shaped(result, output), output["format"])
         
+    except PoolSaturated:
+        raise  # 503 + Retry-After (gestionnaire dédié)
     except Exception as e:
         logger.error(f"❌ Erreur prédiction : {str(e)}")
         
@@ -335,9 +450,78 @@ async def predict_upload(
         )
 
 
+@app.post("/predict/stream", tags=["Prédiction 🔒 Sécurisée"])
+async def predict_stream(
+    file: Optional[UploadFile] = File(None, description="Fichier CSV à prédire"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
+    months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois (optionnel, MODE AUTO si vide)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Même prédiction que `/predict`, suivie en direct (Server-Sent Events).**
+
+    Le tournoi de modèles (ADF, décomposition, famille ARIMA, Holt-Winters,
+    Prophet, LSTM, CNN, GRU, RNN, SARIMAX exogène, VAR, VARMA) est diffusé
+    étape par étape au lieu d'attendre la fin :
+
+    - `pipeline` : étape du pipeline (lecture, analyse, prévision, terminé)
+    - `stage_start` / `stage_end` : étape du tournoi, avec `duration_ms`,
+      `score` et `metric` (aic ou mse), `status` (ok, unavailable, skipped, error)
+    - `provisional_best` : meilleur modèle provisoire, dès qu'il en existe un
+    - `model_selected` : modèle retenu par le classement final
+    - `result` : résultat final (mêmes `include`, `format`, `max_points`
+      que `/predict` ; `format=msgpack` exclu), persisté s'il réussit
+
+    Exemple :
+    ```bash
+    curl -N -X POST "http://localhost:8000/predict/stream?months=12" \\
+      -H "X-API-Key: TGR-SECRET-KEY-12345" \\
+      -F "file=@depenses.csv"
+    ```
+    """
+    check_sse_format(output["format"])
+
+    # File de prédiction pleine → 503 + Retry-After, avant d'ouvrir le flux
+    prediction_pool.check_capacity()
+
+    upload, compression, filename, file_hash = open_source(file, dataset_id)
+
+    async def events():
+        try:
+            # L'upload reste ouvert jusqu'à la fin de la réponse : copie faite ici
+            async with pool_source(upload) as source:
+                async for kind, data in prediction_pool.stream(
+                    predict_from_file_content, source, months=months, schema=schema,
+                    compression=compression, heartbeat=SSE_HEARTBEAT,
+                ):
+                    if kind == "heartbeat":
+                        yield SSE_KEEPALIVE
+                    elif kind == "event":
+                        yield sse_event(*data, fmt=output["format"])
+                    else:
+                        if data.get("status") == "success":
+                            persist_result(api_key, filename, data, file_content=upload, file_hash=file_hash)
+                            logger.info(f"✅ Prédiction suivie réussie : {data['model_info']['name']}")
+                        else:
+                            logger.warning(f"Prediction engine returned error: {data.get('error_message')}")
+                        yield sse_event("result", shaped(data, output), fmt=output["format"])
+        except Exception as e:
+            # En-têtes déjà envoyés : l'erreur devient le dernier événement du flux
+            logger.error(f"❌ Erreur prédiction suivie : {str(e)}")
+            yield sse_event("error", {"status": "error", "error_message": str(e)}, fmt=output["format"])
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/predict/auto", tags=["Prédiction 🔒 Sécurisée"])
 async def predict_auto(
-    file: UploadFile = File(..., description="Fichier CSV à prédire"),
+    file: Optional[UploadFile] = File(None, description="Fichier CSV à prédire"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
     api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
 ):
     """
@@ -359,11 +543,16 @@ async def predict_auto(
       -F "file=@data.csv"
     ```
     """
+    prediction_pool.check_capacity()
+    upload, compression, filename, file_hash = open_source(file, dataset_id)
+
     try:
-        file_content = await file.read()
-        
-        # MODE AUTO : months=None (le système décide)
-        result = predict_from_file_content(file_content, months=None)
+        # MODE AUTO : months=None (le système décide), hors de la boucle d'événements
+        async with pool_source(upload) as source:
+            result = await prediction_pool.run(
+                predict_from_file_content, source, months=None, schema=schema,
+                compression=compression,
+            )
         
         # Retourner 400 si erreur du moteur
         if result.get("status") != "success":
@@ -371,45 +560,14 @@ async def predict_auto(
             return JSONResponse(status_code=400, content=result)
 
         # ← KILLER FEATURE 2 & 1 : Persister la prédiction et les anomalies
-        try:
-            from models.database import get_session
-            session = next(get_session())
-            
-            # Persister le fichier uploadé
-            from datetime import datetime
-            file_id = save_uploaded_file(
-                api_key=api_key,
-                filename=file.filename or "unknown",
-                file_content=file_content,
-                row_count=len(result.get("history", {}).get("values", [])),
-                date_range_start=result.get("history", {}).get("dates", [None])[0],
-                date_range_end=result.get("history", {}).get("dates", [None])[-1],
-                session=session,
-            )
-            
-            # Persister la prédiction
-            pred_id = save_prediction(
-                api_key=api_key,
-                file_id=file_id,
-                model_name=result["model_info"]["name"],
-                model_order=result["model_info"]["order"],
-                seasonal_order=result["model_info"]["seasonal_order"],
-                forecast_months=result["duration_info"]["validated_months"],
-                model_aic=result["model_info"]["aic"],
-                forecast_json=result.get("forecast", {}),
-                anomalies_list=result.get("anomalies", []),
-                session=session,
-            )
-            
-            logger.info(f"✅ Prédiction AUTO sauvegardée : ID={pred_id}, Anomalies={len(result.get('anomalies', []))}")
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Persistance BD échouée (prédiction quand même retournée) : {str(e)}")
+        persist_result(api_key, filename, result, file_content=upload, file_hash=file_hash)
 
         logger.info(f"✅ Prédiction AUTO réussie : {result['model_info']['name']}, {len(result.get('anomalies', []))} anomalies")
         
-        return result
+        return render(shaped(result, output), output["format"])
         
+    except PoolSaturated:
+        raise  # 503 + Retry-After (gestionnaire dédié)
     except Exception as e:
         logger.error(f"❌ Erreur prédiction AUTO : {str(e)}")
         
@@ -427,7 +585,10 @@ async def predict_auto(
 async def predict_by_ordinateur(
     code: str = Query(..., description="Code ordinateur/établissement"),
     months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois à prédire"),
-    file: UploadFile = File(..., description="Fichier CSV contenant tous les ordinateurs"),
+    file: Optional[UploadFile] = File(None, description="Fichier CSV contenant tous les ordinateurs"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
     api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
 ):
     """
@@ -440,6 +601,8 @@ async def predict_by_ordinateur(
     - `code` : Code ordinateur/établissement (ex: "146014")
     - `months` : Nombre de mois à prédire (optionnel, MODE AUTO si vide)
     - `file` : Fichier CSV complet (doit contenir colonne "code_ordinateur" ou "code")
+    - `dataset_id` : (Alternative à `file`) dataset enregistré via `POST /datasets` :
+      aucun upload ni parsing CSV, seules les lignes du code sont lues
     
     **Format attendu :**
     Le fichier doit contenir au moins :
@@ -456,192 +619,53 @@ async def predict_by_ordinateur(
     ```
     """
     
+    prediction_pool.check_capacity()
+    upload, compression, _, _ = open_source(file, dataset_id)
+
     try:
-        file_content = await file.read()
-        
-        # Charger le fichier entier - essayer d'abord avec séparateur ';' (format fourni)
-        try:
-            df_all = pd.read_csv(io.BytesIO(file_content), sep=';', engine='python')
-        except Exception:
-            # fallback to default csv parser
-            df_all = pd.read_csv(io.BytesIO(file_content))
-
-        # Normaliser les noms de colonnes
-        df_all.columns = df_all.columns.str.lower().str.strip()
-
-        # Chercher colonne de code (accept 'code_ordinateur', 'code_ordonateur', 'ordonnateur', 'code')
-        code_cols = []
-        for col in df_all.columns:
-            col_lower = col.lower()
-            # Check for both spellings: ordinateur AND ordonnateur
-            if any(x in col_lower for x in ['ordinateur', 'ordonnateur', 'ordonneur']):
-                code_cols.append(col)
-            elif 'code' in col_lower and any(x in col_lower for x in ['ord', 'etabl', 'agence']):
-                code_cols.append(col)
-        
-        # If still not found, try just 'code'
-        if not code_cols:
-            code_cols = [col for col in df_all.columns if 'code' in col.lower()]
-        
-        if not code_cols:
-            logger.error(f"❌ Pas de colonne 'code_ordinateur' trouvée dans le fichier")
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "status": "error",
-                    "error_message": "Colonne 'code_ordinateur' ou 'code' non trouvée",
-                    "available_columns": list(df_all.columns)
-                }
-            )
-        
-        code_col = code_cols[0]
-        
-        # Filtrer par code
-        df_filtered = df_all[df_all[code_col].astype(str).str.strip() == code]
+        # Fichier parsé UNE fois (colonnes code/date/montant typées, montants
+        # nettoyés en une passe vectorisée), puis index code → lignes gardé en
+        # mémoire (dans CE processus) : les appels suivants ne reparsent rien.
+        # Parsing dans un thread : la boucle d'événements reste disponible
+        if dataset_id:
+            index = await run_in_threadpool(code_index, dataset_id)
+        else:
+            try:
+                index = await run_in_threadpool(code_index_for_upload, upload, compression=compression, schema=schema)
+            except ValueError as e:
+                logger.error(f"❌ Fichier by-code illisible : {str(e)}")
+                return JSONResponse(status_code=400, content={"status": "error", "error_message": str(e)})
+
+        # Recherche O(lignes du code) : aucune comparaison de chaînes sur tout le fichier
+        df_export = index.rows(code)
         
-        if len(df_filtered) == 0:
+        if df_export is None:
             logger.warning(f"⚠️  Code {code} non trouvé dans le fichier")
             return JSONResponse(
                 status_code=404,
                 content={
                     "status": "error",
                     "error_message": f"Code '{code}' non trouvé dans le fichier",
-                    "unique_codes": df_all[code_col].unique()[:10].tolist()
+                    "unique_codes": index.codes[:10]
                 }
             )
-        
-        # Identifier colonne date et montant (plusieurs synonymes possibles)
-        date_cols = [c for c in df_filtered.columns if any(k in c for k in ['date', 'jour', 'time', 'mois'])]
-        amount_cols = [c for c in df_filtered.columns if any(k in c for k in ['montant', 'sum', 'prix', 'amount', 'value'])]
-
-        if not date_cols:
-            # fallback: first column that looks like a date via dtype
-            date_cols = [df_filtered.columns[0]]
-        if not amount_cols:
-            # try last column as amount
-            amount_cols = [df_filtered.columns[-1]]
-
-        date_col = date_cols[0]
-        amount_col = amount_cols[0]
-
-        # Préparer export: garder seulement date et montant, renommer en 'date' et 'montant'
-        df_export = df_filtered[[date_col, amount_col]].copy()
-        df_export.columns = ['date', 'montant']
-
-        # Nettoyer les montants: remplacer virgule décimale et supprimer espaces
-        def parse_amount(x):
-            try:
-                s = str(x).replace(' ', '').replace('\u00A0', '')
-                s = s.replace(',', '.')
-                return float(s)
-            except Exception:
-                return None
 
-        df_export['montant'] = df_export['montant'].apply(parse_amount)
-
-        # Supprimer lignes invalides
-        df_export = df_export.dropna(subset=['date', 'montant'])
-
-        # Convertir en bytes pour predict_from_file_content
-        # Garder seulement les colonnes nécessaires (date + montant)
-        
-        df_filtered_bytes = df_export.to_csv(index=False, sep=';').encode('utf-8')
-        
-        if df_export['montant'].nunique() <= 1 or len(df_export) < 6:
-            # Series is too short/constant - use naive fallback
-            use_naive = True
-        else:
-            # Try SARIMA, but fall back if it fails
-            use_naive = False
-            try:
-                result = predict_from_file_content(df_filtered_bytes, months=months)
-                if result.get("status") != "success":
-                    use_naive = True
-            except Exception as e:
-                logger.warning(f"SARIMA failed for code {code}: {str(e)}, using naive fallback")
-                use_naive = True
-        
-        if use_naive:
-            # Fallback: naive constant prediction
-            last_value = float(df_export['montant'].iloc[-1]) if len(df_export) > 0 else 0.0
-            validated_months = months or 6
-            forecast_dates = []
-            try:
-                start = pd.to_datetime(df_export['date'].iloc[-1])
-                for i in range(validated_months):
-                    forecast_dates.append((start + pd.offsets.MonthBegin(i+1)).strftime('%Y-%m-%d'))
-            except Exception:
-                forecast_dates = [None] * validated_months
-
-            result = {
-                "status": "success",
-                "model_info": {
-                    "name": "NAIVE_CONSTANT",
-                    "order": "()",
-                    "seasonal_order": "()",
-                    "aic": 0.0
-                },
-                "explanations": ["Fallback: série trop courte, constante ou SARIMA échoué, prévision naive utilisée"],
-                "history": {
-                    "dates": df_export['date'].astype(str).tolist(),
-                    "values": df_export['montant'].tolist()
-                },
-                "forecast": {
-                    "dates": forecast_dates,
-                    "values": [last_value] * validated_months,
-                    "confidence_upper": [last_value] * validated_months,
-                    "confidence_lower": [last_value] * validated_months
-                },
-                "anomalies": [],
-                "timestamp": pd.Timestamp.now().isoformat(),
-                "duration_info": {
-                    "requested_months": months,
-                    "validated_months": validated_months,
-                    "reason": "FALLBACK - naive or SARIMA failure"
-                }
-            }
+        # Pipeline complet, ou prévision naïve si la série est courte/constante
+        result = await prediction_pool.run(predict_for_code, df_export, months=months, code=code)
         
         if result.get("status") != "success":
             logger.warning(f"Prediction by code error for {code}: {result.get('error_message')}")
             return JSONResponse(status_code=400, content=result)
 
-        # ← KILLER FEATURE 2 & 1 : Persister la prédiction
-        try:
-            from models.database import get_session
-            session = next(get_session())
-            
-            file_id = save_uploaded_file(
-                api_key=api_key,
-                filename=f"by_code_{code}",
-                file_content=df_filtered_bytes,
-                row_count=len(result.get("history", {}).get("values", [])),
-                date_range_start=result.get("history", {}).get("dates", [None])[0],
-                date_range_end=result.get("history", {}).get("dates", [None])[-1],
-                session=session,
-            )
-            
-            pred_id = save_prediction(
-                api_key=api_key,
-                file_id=file_id,
-                model_name=result["model_info"]["name"],
-                model_order=result["model_info"]["order"],
-                seasonal_order=result["model_info"]["seasonal_order"],
-                forecast_months=result["duration_info"]["validated_months"],
-                model_aic=result["model_info"]["aic"],
-                forecast_json=result.get("forecast", {}),
-                anomalies_list=result.get("anomalies", []),
-                session=session,
-            )
-            
-            logger.info(f"✅ Prédiction BY-CODE sauvegardée : ID={pred_id}, Code={code}")
-            
-        except Exception as e:
-            logger.warning(f"⚠️  Persistance BD échouée : {str(e)}")
+        # ← KILLER FEATURE 2 & 1 : Persister la prédiction (empreinte des lignes du code)
+        persist_result(api_key, f"by_code_{code}", result, file_hash=hash_frame(df_export))
 
         logger.info(f"✅ Prédiction BY-CODE réussie pour {code} : {result['model_info']['name']}")
         
-        return result
+        return render(shaped(result, output), output["format"])
         
+    except PoolSaturated:
+        raise  # 503 + Retry-After (gestionnaire dédié)
     except Exception as e:
         logger.error(f"❌ Erreur /predict/by-code : {str(e)}")
         
@@ -655,6 +679,261 @@ async def predict_by_ordinateur(
         )
 
 
+@app.post("/predict/by-codes", tags=["Prédiction 🔒 Sécurisée"])
+async def predict_by_codes(
+    codes: str = Query(..., description="Codes séparés par des virgules, ou 'all'"),
+    months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois à prédire"),
+    workers: Optional[int] = Query(None, ge=1, le=64, description="Places du pool de prédiction occupées à la fois (défaut : PREDICT_WORKERS)"),
+    file: Optional[UploadFile] = File(None, description="Fichier contenant tous les ordonnateurs"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Prédiction par lot pour plusieurs ordonnateurs, résultats en flux NDJSON.**
+
+    Le fichier est parsé UNE fois, découpé par code en un seul groupby, puis
+    les prévisions sont réparties sur le pool de prédiction (au plus `workers`
+    places à la fois ; 503 si le pool est déjà plein). Chaque résultat
+    est envoyé (une ligne JSON, avec son `code`) dès qu'il est prêt : le
+    client peut consommer les premiers résultats avant la fin du lot.
+
+    Les séries courtes ou constantes reçoivent la prévision naïve, comme sur
+    `/predict/by-code`. Un code absent produit une ligne `status: error`.
+
+    Exemple :
+    ```bash
+    curl -N -X POST "http://localhost:8000/predict/by-codes?codes=all&months=6" \\
+      -H "X-API-Key: TGR-SECRET-KEY-12345" \\
+      -F "file=@depenses.csv"
+    ```
+    """
+    wanted = None if codes.strip().lower() == "all" else [c for c in codes.split(",") if c.strip()]
+    if wanted is not None and not wanted:
+        raise ValueError("Paramètre codes vide : liste de codes ou 'all'")
+
+    # File de prédiction pleine → 503 + Retry-After, avant même de lire l'upload
+    prediction_pool.check_capacity()
+
+    # Lecture / parsing dans un thread : la boucle d'événements reste disponible
+    if dataset_id:
+        if not load_meta(dataset_id)["source_columns"].get("code"):
+            raise ValueError("Ce dataset n'a pas de colonne code ordonnateur")
+        frame = await run_in_threadpool(read_dataset, dataset_id, columns=("code", "date", "montant"))
+    else:
+        upload, compression, _, _ = open_source(file, None)
+        frame, cleaner = await run_in_threadpool(parse_code_frame, upload, compression=compression, schema=schema)
+        if cleaner.code_col is None:
+            raise ValueError("Colonne 'code_ordinateur' ou 'code' non trouvée")
+
+    tasks, missing = code_forecast_tasks(frame, codes=wanted, months=months, include=output["include"])
+    logger.info(f"📦 Prédiction par lot : {'tous les' if wanted is None else len(wanted)} codes, {len(frame)} lignes")
+
+    async def lines():
+        for result in missing:
+            yield shaped(result, output)
+        async for result in prediction_pool.map(predict_code_task, tasks, concurrency=workers):
+            yield shaped(result, output)
+
+    return StreamingResponse(iter_encoded(lines(), output["format"]), media_type=stream_media_type(output["format"]))
+
+
+@app.post("/predict/bulk", tags=["Prédiction 🔒 Sécurisée"])
+async def predict_bulk(
+    files: List[UploadFile] = File(..., description=f"Fichiers CSV à prédire (max {BULK_MAX_FILES})"),
+    months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois (optionnel, MODE AUTO si vide)"),
+    workers: Optional[int] = Query(None, ge=1, le=64, description="Places du pool de prédiction occupées à la fois (défaut : PREDICT_WORKERS)"),
+    schema: dict = Depends(schema_hints),
+    output: dict = Depends(output_options),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Plusieurs fichiers dans une seule requête, résultats en flux NDJSON.**
+
+    Chaque fichier suit le même pipeline que `/predict` ; les fichiers sont
+    répartis sur le pool de prédiction (au plus `workers` places à la fois ;
+    503 si le pool est déjà plein) et chaque résultat est envoyé (une
+    ligne JSON portant `index` et `file`) dès qu'il est prêt, puis persisté.
+    Un fichier invalide produit une ligne `status: error` sans faire échouer
+    les autres.
+
+    Exemple :
+    ```bash
+    curl -N -X POST "http://localhost:8000/predict/bulk?months=6" \\
+      -H "X-API-Key: TGR-SECRET-KEY-12345" \\
+      -F "files=@rabat.csv" -F "files=@casablanca.csv" -F "files=@fes.csv"
+    ```
+    """
+    if len(files) > BULK_MAX_FILES:
+        raise ValueError(f"Trop de fichiers ({len(files)}, max {BULK_MAX_FILES})")
+
+    # File de prédiction pleine → 503 + Retry-After, avant même de lire les uploads
+    prediction_pool.check_capacity()
+
+    def spool_uploads():
+        # Contrôles par fichier : un fichier refusé ne bloque pas le lot.
+        # Chaque upload accepté est copié sur disque : les workers reçoivent un chemin
+        batch, streams, positions, rejected = [], [], [], []
+        for i, file in enumerate(files):
+            filename = file.filename or f"file_{i}"
+            try:
+                upload = open_upload(file, MAX_FILE_SIZE)
+                batch.append((filename, spool_upload(upload), upload_compression(file)))
+                streams.append(upload)
+                positions.append(i)
+            except ValueError as e:
+                rejected.append({"index": i, "file": filename, "status": "error", "error_message": str(e)})
+        return batch, streams, positions, rejected
+
+    # Copie des fichiers dans un thread : la boucle d'événements reste disponible
+    batch, streams, positions, rejected = await run_in_threadpool(spool_uploads)
+    tasks = file_forecast_tasks(batch, months=months, schema=schema)
+    logger.info(f"📦 Prédiction multi-fichiers : {len(batch)} fichiers ({len(rejected)} refusés)")
+
+    async def lines():
+        try:
+            for result in rejected:
+                yield result
+            async for result in prediction_pool.map(predict_file_task, tasks, concurrency=workers):
+                position = result["index"]
+                filename = batch[position][0]
+                result["index"] = positions[position]
+                if result.get("status") == "success":
+                    await run_in_threadpool(persist_result, api_key, filename, result, file_content=streams[position])
+                else:
+                    logger.warning(f"Prediction engine returned error for {filename}: {result.get('error_message')}")
+                yield shaped(result, output)
+        finally:
+            for _, path, _ in batch:
+                discard_spooled(path)
+
+    return StreamingResponse(iter_encoded(lines(), output["format"]), media_type=stream_media_type(output["format"]))
+
+
+# ==============================================================================
+# ROUTES - JOBS ASYNCHRONES (🔒 SÉCURISÉES) : soumettre, puis consulter
+# ==============================================================================
+@app.post("/jobs", status_code=202, tags=["Jobs 🔒 Sécurisée"])
+async def create_job(
+    file: Optional[UploadFile] = File(None, description="Fichier CSV à prédire"),
+    dataset_id: Optional[str] = Query(None, description="Dataset enregistré via POST /datasets (à la place de file)"),
+    months: Optional[int] = Query(None, ge=1, le=60, description="Nombre de mois (optionnel, MODE AUTO si vide)"),
+    schema: dict = Depends(schema_hints),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Soumettre une prédiction longue (tournoi complet) sans garder la connexion ouverte.**
+
+    Le fichier est enregistré et le job mis en file dans la base ; la réponse
+    (202) est immédiate. Suivre ensuite `GET /jobs/{job_id}` : status
+    (queued, running, done, error), étape, avancement, puis résultat.
+
+    Exemple :
+    ```bash
+    curl -X POST "http://localhost:8000/jobs?months=12" \\
+      -H "X-API-Key: TGR-SECRET-KEY-12345" \\
+      -F "file=@depenses.csv"
+    ```
+    """
+    upload, compression, filename, file_hash = open_source(file, dataset_id)
+    params = {"months": months, "schema": schema}
+    if dataset_id:
+        job_id = await run_in_threadpool(submit_job, api_key, source_path=upload, params=params, filename=filename,
+                                         file_hash=file_hash)
+    else:
+        job_id = await run_in_threadpool(submit_job, api_key, upload, compression=compression, params=params,
+                                         filename=filename)
+    logger.info(f"📥 Job {job_id[:12]}… en file ({filename})")
+    return {"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}", tags=["Jobs 🔒 Sécurisée"])
+def get_job_status(
+    job_id: str,
+    output: dict = Depends(output_options),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **État d'un job** : `status`, `stage` (lecture, analyse, prévision,
+    terminé), `progress` (0 → 1) et, une fois terminé, `result` (même
+    structure que `/predict`, avec `include`, `format` et `max_points`).
+    Seul l'utilisateur qui a soumis le job peut le consulter (404 sinon).
+    """
+    job = get_job(job_id, api_key)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu : {job_id}")
+    if job["result"] is not None:
+        job["result"] = shaped(job["result"], output)
+    return render(job, output["format"])
+
+
+# ==============================================================================
+# ROUTES - DATASETS (🔒 SÉCURISÉES) : ingérer une fois, prédire N fois
+# ==============================================================================
+@app.post("/datasets", tags=["Datasets 🔒 Sécurisée"])
+async def create_dataset(
+    file: UploadFile = File(..., description="Fichier à enregistrer (CSV, compressé ou non, Parquet, Feather, Excel)"),
+    schema: dict = Depends(schema_hints),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Enregistrer un fichier une fois pour le prédire plusieurs fois.**
+
+    Le fichier est parsé une seule fois puis stocké au format colonnaire
+    (code, date, montant typés), sous la clé SHA256 de son contenu. Le
+    `dataset_id` retourné remplace ensuite `file` sur `/predict`,
+    `/predict/auto` et `/predict/by-code`.
+
+    Ré-envoyer le même fichier ne reparse rien (`created: false`).
+    """
+    upload = open_upload(file, MAX_FILE_SIZE)
+    # Parsing et écriture Parquet dans un thread : la boucle d'événements reste disponible
+    meta, created = await run_in_threadpool(ingest_dataset, upload, filename=file.filename,
+                                            compression=upload_compression(file), schema=schema)
+    logger.info(f"📦 Dataset {'créé' if created else 'déjà connu'} : {meta['dataset_id'][:12]}… ({meta['rows']} lignes, {meta['codes']} codes)")
+    return {"status": "success", "created": created, **meta}
+
+
+@app.get("/datasets/{dataset_id}", tags=["Datasets 🔒 Sécurisée"])
+def get_dataset(dataset_id: str, api_key: str = Depends(verify_api_key)):
+    """**Métadonnées d'un dataset enregistré** (lignes, période, colonnes sources)."""
+    try:
+        return {"status": "success", **load_meta(dataset_id)}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/datasets/{dataset_id}/codes", tags=["Datasets 🔒 Sécurisée"])
+def list_dataset_codes(
+    dataset_id: str,
+    sort: str = Query("code", description=f"Tri : {', '.join(CATALOG_SORTS)} (hors 'code' : décroissant)"),
+    limit: Optional[int] = Query(None, ge=1, description="Nombre maximal de codes retournés"),
+    api_key: str = Depends(verify_api_key)  # 🔐 VALIDATION CLÉ API
+):
+    """
+    **Catalogue des codes ordonnateur d'un dataset.**
+
+    Pour chaque code : `rows`, `active_months`, `first_date`, `last_date`,
+    `total`. Calculé une seule fois à l'ingestion (un groupby vectorisé) et
+    mis en cache : aucun nouveau parcours du fichier.
+
+    Exemple : les 20 plus gros ordonnateurs
+    ```bash
+    curl "http://localhost:8000/datasets/<id>/codes?sort=total&limit=20" \\
+      -H "X-API-Key: TGR-SECRET-KEY-12345"
+    ```
+    """
+    try:
+        meta = load_meta(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not meta["source_columns"].get("code"):
+        raise ValueError("Ce dataset n'a pas de colonne code ordonnateur")
+    codes = code_catalog(dataset_id, sort=sort, limit=limit)
+    return {"status": "success", "dataset_id": dataset_id, "total_codes": meta["codes"], "codes": codes}
+
+
 # ==============================================================================
 # ROUTES - HISTORIQUE (futur)
 # ==============================================================================
@@ -704,6 +983,16 @@ def get_model_statistics():
 # ==============================================================================
 # GESTION DES ERREURS
 # ==============================================================================
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc):
+    logger.warning(f"🚦 {str(exc)}")
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "error_message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     logger.warning(f"⚠️  ValueError : {str(exc)}")
@@ -3,12 +3,13 @@ models/__init__.py - Modèles SQLModel pour persistance des données
 """
 
 from sqlmodel import SQLModel
-from models.database import User, UploadedFile, Prediction, Anomaly
+from models.database import User, UploadedFile, Prediction, Anomaly, PredictionJob
 
 __all__ = [
     "User",
     "UploadedFile",
     "Prediction",
     "Anomaly",
+    "PredictionJob",
     "SQLModel",
 ]
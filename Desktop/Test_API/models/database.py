@@ -52,9 +52,19 @@ Structure de persistance pour l'API Prédiction des Dépenses :
         │               │ description      │ → "Mars 2023 dépense anormale"
         │               └──────────────────┘
 
+┌──────────────────┐
+│ PredictionJob    │ (File d'attente des prédictions asynchrones, voir job_queue.py)
+├──────────────────┤
+│ job_id (PK)      │ → Identifiant rendu par POST /jobs
+│ status           │ → queued, running, done, error
+│ stage / progress │ → Étape en cours, avancement 0 → 1
+│ source_path      │ → Fichier à prédire (copie sur disque ou dataset)
+│ result_json      │ → Résultat final (JSON)
+└──────────────────┘
+
 """
 
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
 from sqlmodel import (
     SQLModel,
@@ -87,6 +97,11 @@ DATABASE_URL = os.getenv(
 # ═══════════════════════════════════════════════════════════════════════════
 
 
+def utcnow() -> datetime:
+    """Horodatage UTC avec fuseau (accepté par toutes les versions de SQLModel)."""
+    return datetime.now(timezone.utc)
+
+
 class User(SQLModel, table=True):
     """
     Modèle pour les utilisateurs de l'API.
@@ -114,7 +129,7 @@ class User(SQLModel, table=True):
     )
     email: Optional[str] = Field(default=None, description="Email de contact")
     created_at: datetime = Field(
-        default_factory=datetime.utcnow,
+        default_factory=utcnow,
         description="Date création du compte"
     )
     last_used: Optional[datetime] = Field(
@@ -166,7 +181,7 @@ class UploadedFile(SQLModel, table=True):
         description="Dernière date du fichier (YYYY-MM-DD)"
     )
     uploaded_at: datetime = Field(
-        default_factory=datetime.utcnow,
+        default_factory=utcnow,
         description="Timestamp upload"
     )
 
@@ -210,7 +225,7 @@ class Prediction(SQLModel, table=True):
         description="Données brutes de prévisions (JSON stringifié)"
     )
     created_at: datetime = Field(
-        default_factory=datetime.utcnow,
+        default_factory=utcnow,
         description="Timestamp de la prédiction"
     )
 
@@ -270,13 +285,48 @@ class Anomaly(SQLModel, table=True):
         description="Explication lisible (ex: 'Dépense 50% supérieure à la normale')"
     )
     detected_at: datetime = Field(
-        default_factory=datetime.utcnow,
+        default_factory=utcnow,
         description="Timestamp de la détection"
     )
 
     # Relations omitted from SQLModel fields for test compatibility
 
 
+class PredictionJob(SQLModel, table=True):
+    """
+    Job de prédiction asynchrone (POST /jobs), stocké dans la BD : la file
+    d'attente survit donc à un redémarrage de l'API.
+
+    Cycle de vie :
+        queued → running (réclamé par un worker) → done | error
+        running dont le worker a disparu → queued (voir job_queue.requeue_orphans)
+    """
+
+    __tablename__ = "prediction_jobs"
+
+    job_id: str = Field(primary_key=True, description="Identifiant du job (uuid hex)")
+    user_id: Optional[int] = Field(
+        default=None, foreign_key="users.user_id", index=True,
+        description="Propriétaire (None = clé API sans utilisateur enregistré)",
+    )
+    status: str = Field(default="queued", index=True, description="queued, running, done, error")
+    stage: Optional[str] = Field(default=None, description="Étape en cours (lecture, analyse, prévision...)")
+    progress: float = Field(default=0.0, description="Avancement de 0 à 1")
+    source_path: str = Field(description="Fichier à prédire (copie de l'upload ou dataset Parquet)")
+    compression: Optional[str] = Field(default=None, description="gzip, zstd ou None")
+    filename: Optional[str] = Field(default=None, description="Nom du fichier source (historique)")
+    file_hash: Optional[str] = Field(default=None, description="SHA256 déjà connu (dataset enregistré)")
+    params_json: str = Field(default="{}", description="Paramètres de prédiction (months, schéma) en JSON")
+    result_json: Optional[str] = Field(default=None, description="Résultat final (JSON stringifié)")
+    error_message: Optional[str] = Field(default=None, description="Erreur si status = error")
+    worker: Optional[str] = Field(default=None, description="Worker ayant réclamé le job (hôte:pid)")
+    attempts: int = Field(default=0, description="Nombre de prises en charge")
+    created_at: datetime = Field(default_factory=utcnow, index=True, description="Soumission")
+    started_at: Optional[datetime] = Field(default=None, description="Début du dernier essai")
+    updated_at: Optional[datetime] = Field(default=None, description="Dernière mise à jour de progression")
+    finished_at: Optional[datetime] = Field(default=None, description="Fin (done ou error)")
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 # GESTION DE LA BASE DE DONNÉES
 # ═══════════════════════════════════════════════════════════════════════════
@@ -0,0 +1,122 @@
+"""
+payloads.py - Encodage des réponses de prédiction (JSON, JSON compact, msgpack)
+
+FORMATS (paramètre `format`) :
+  json     structure historique (dates ISO par mois, anomalies en liste)
+  compact  structure compacte de logic.shape_result (start + freq + tableaux),
+           sérialisée par orjson s'il est installé (sinon json, sans espaces)
+  msgpack  structure compacte encodée en MessagePack (dépendance optionnelle)
+
+Combiné à `include=forecast`, le format compact réduit la taille d'une réponse
+d'un ordre de grandeur : plus d'historique, plus d'explications, et les dates
+de prévision tiennent en deux champs.
+
+Les flux Server-Sent Events (sse_event) réutilisent les formats json et compact.
+
+INTÉGRATION AVEC MAIN :
+    ```python
+    from payloads import render, iter_encoded, stream_media_type
+
+    result = shape_result(result, include=output["include"], compact=output["format"] != "json")
+    return render(result, output["format"])
+    ```
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # sérialisation JSON standard
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # format msgpack indisponible
+    msgpack = None
+
+FORMATS = ("json", "compact", "msgpack")
+MEDIA_TYPES = {
+    "json": "application/json",
+    "compact": "application/json",
+    "msgpack": "application/x-msgpack",
+}
+SSE_MEDIA_TYPE = "text/event-stream"
+SSE_KEEPALIVE = (
+    b": keep-alive\n\n"  # commentaire SSE : garde la connexion ouverte (proxies)
+)
+
+
+def check_format(fmt):
+    """Valide le format demandé (ValueError → 400 via le gestionnaire de main.py)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu : {fmt} (attendu : {', '.join(FORMATS)})")
+    if fmt == "msgpack" and msgpack is None:
+        raise ValueError(
+            "Format msgpack indisponible sur ce serveur (pip install msgpack)"
+        )
+    return fmt
+
+
+def _default(value):
+    """Types numpy / pandas restants → types natifs."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+
+def dumps(payload, fmt="json"):
+    """Encode un résultat en octets selon le format."""
+    if fmt == "msgpack":
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    if fmt == "compact" and orjson is not None:
+        return orjson.dumps(
+            payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    if fmt == "compact":
+        return json.dumps(
+            payload, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False).encode("utf-8")
+
+
+def render(payload, fmt="json", status_code=200):
+    """Réponse HTTP d'un résultat ; le format json garde la sérialisation FastAPI habituelle."""
+    if fmt == "json":
+        return JSONResponse(status_code=status_code, content=jsonable_encoder(payload))
+    return Response(
+        content=dumps(payload, fmt),
+        status_code=status_code,
+        media_type=MEDIA_TYPES[fmt],
+    )
+
+
+def stream_media_type(fmt):
+    """Type MIME d'un flux de résultats : NDJSON, ou objets msgpack concaténés."""
+    return MEDIA_TYPES["msgpack"] if fmt == "msgpack" else "application/x-ndjson"
+
+
+def check_sse_format(fmt):
+    """Un flux SSE est textuel : json ou compact uniquement."""
+    if fmt == "msgpack":
+        raise ValueError(
+            "Format msgpack indisponible en Server-Sent Events (json ou compact)"
+        )
+    return fmt
+
+
+def sse_event(event, data, fmt="json"):
+    """Un événement Server-Sent Events : nom + données JSON sur une seule ligne."""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data, fmt) + b"\n\n"
+
+
+async def iter_encoded(results, fmt="json"):
+    """Encode un flux asynchrone de résultats : une ligne JSON par résultat, ou un objet msgpack."""
+    async for result in results:
+        yield dumps(result, fmt) if fmt == "msgpack" else dumps(result, fmt) + b"\n"
@@ -0,0 +1,230 @@
+"""
+prediction_pool.py - Exécution des prédictions hors de la boucle asyncio
+
+POURQUOI ?
+  Les endpoints /predict sont `async def` : un ajustement SARIMAX / Holt-Winters
+  de plusieurs secondes appelé directement bloquait la boucle d'événements, donc
+  TOUTES les requêtes (y compris /health) attendaient la fin du calcul.
+
+PRINCIPE :
+  Les prédictions sont confiées à un pool de PREDICT_WORKERS processus (un par
+  cœur par défaut) ; la boucle reste libre pendant le calcul et les clients
+  concurrents se répartissent sur les cœurs.
+
+  La file est bornée : au plus PREDICT_WORKERS + PREDICT_QUEUE_SIZE prédictions
+  en cours ou en attente. Au-delà, PoolSaturated est levée → 503 avec l'en-tête
+  Retry-After (PREDICT_RETRY_AFTER secondes), plutôt qu'une attente sans fin.
+
+  PREDICT_WORKERS=0 : pas de processus, calcul dans le pool de threads de
+  Starlette (la boucle reste libre, mais le GIL limite le parallélisme).
+
+INTÉGRATION AVEC MAIN :
+    ```python
+    from prediction_pool import prediction_pool, PoolSaturated
+
+    prediction_pool.check_capacity()          # avant de lire l'upload
+    result = await prediction_pool.run(predict_from_file_content, content, months=months)
+
+    # Variante suivie (SSE) : fn reçoit progress= et events=, relayés depuis le processus
+    async for kind, data in prediction_pool.stream(predict_from_file_content, content, months=months):
+        ...                                   # ("event", (nom, données)) puis ("result", résultat)
+
+    # Lots (/predict/by-codes, /predict/bulk) : une place du pool par tâche en cours
+    async for result in prediction_pool.map(predict_code_task, tasks, concurrency=workers):
+        ...                                   # dans l'ordre où les tâches se terminent
+    ```
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", str(os.cpu_count() or 1)))
+PREDICT_QUEUE_SIZE = int(
+    os.getenv("PREDICT_QUEUE_SIZE", str(2 * max(PREDICT_WORKERS, 1)))
+)
+PREDICT_RETRY_AFTER = int(os.getenv("PREDICT_RETRY_AFTER", "5"))
+STREAM_POLL_INTERVAL = 0.25  # secondes entre deux lectures du canal d'événements
+
+
+class PoolSaturated(Exception):
+    """Toutes les places (calcul + file d'attente) sont occupées."""
+
+    def __init__(self, capacity, retry_after=PREDICT_RETRY_AFTER):
+        super().__init__(
+            f"Serveur saturé : {capacity} prédictions déjà en cours ou en attente, réessayer plus tard"
+        )
+        self.retry_after = retry_after
+
+
+class PredictionPool:
+    """
+    Pool de processus à file bornée. Le compteur `in_flight` n'est modifié
+    que depuis la boucle d'événements (sans `await` entre contrôle et
+    incrément) : aucun verrou n'est nécessaire.
+    """
+
+    def __init__(self, workers=PREDICT_WORKERS, queue_size=PREDICT_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self.in_flight = 0
+        self._executor = None
+        self._manager = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(
+                f"⚙️  Pool de prédiction : {self.workers} processus, file de {self.capacity - self.workers}"
+            )
+        return self._executor
+
+    def check_capacity(self):
+        """Lève PoolSaturated si une nouvelle prédiction ne peut pas être acceptée."""
+        if self.in_flight >= self.capacity:
+            raise PoolSaturated(self.capacity)
+
+    def _submit(self, fn, *args, **kwargs):
+        """Occupe une place et lance fn ; la place est libérée quand le calcul se termine."""
+        self.in_flight += 1
+        try:
+            if self.workers <= 0:
+                future = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            else:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), partial(fn, *args, **kwargs)
+                )
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # Processus tué (mémoire, signal) : le pool est recréé à la prochaine demande
+            logger.error("❌ Pool de prédiction cassé : recréation")
+            self._executor = None
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Exécute fn(*args, **kwargs) dans le pool (arguments et résultat picklables)."""
+        self.check_capacity()
+        future = self._submit(fn, *args, **kwargs)
+        await asyncio.wait([future])
+        return self._result(future)
+
+    async def map(self, fn, tasks, concurrency=None):
+        """
+        Exécute fn(tâche) pour chaque tâche d'un lot et produit les résultats
+        dans l'ordre où ils se terminent. fn doit intercepter ses propres erreurs.
+
+        Chaque tâche en cours occupe une place du pool, comme une prédiction
+        unitaire : au plus `concurrency` à la fois (défaut : workers). La
+        capacité est vérifiée au départ (PoolSaturated) ; ensuite, le lot
+        attend qu'une place se libère au lieu d'échouer en plein flux. Si le
+        client abandonne, les tâches non démarrées sont annulées.
+        """
+        self.check_capacity()
+        tasks = list(tasks)
+        concurrency = max(1, concurrency or self.workers)
+        pending, position = set(), 0
+        try:
+            while position < len(tasks) or pending:
+                while (
+                    position < len(tasks)
+                    and len(pending) < concurrency
+                    and self.in_flight < self.capacity
+                ):
+                    pending.add(self._submit(fn, tasks[position]))
+                    position += 1
+                if not pending:
+                    await asyncio.sleep(
+                        STREAM_POLL_INTERVAL
+                    )  # pool plein : attendre une place
+                    continue
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield self._result(future)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def stream(self, fn, *args, heartbeat=None, **kwargs):
+        """
+        Comme run, mais fn(*args, progress=..., events=..., **kwargs) publie
+        ses événements au fil du calcul (canal multiprocessing.Manager entre
+        processus, file locale en mode threads) : étapes du pipeline
+        ("pipeline") et du tournoi de modèles (voir predict_from_file_content).
+
+        Produit ("event", (nom, données)) pour chaque événement, puis
+        ("result", résultat) ; ("heartbeat", None) après `heartbeat` secondes
+        sans événement. Si le client abandonne le flux, le calcul se termine
+        quand même et sa place n'est libérée qu'à la fin.
+        """
+        self.check_capacity()
+        channel = queue.Queue() if self.workers <= 0 else self._get_manager().Queue()
+        future = self._submit(_run_with_events, fn, channel, args, kwargs)
+        idle = 0.0
+        while True:
+            try:
+                item = await run_in_threadpool(channel.get, True, STREAM_POLL_INTERVAL)
+            except queue.Empty:
+                if future.done():
+                    break
+                idle += STREAM_POLL_INTERVAL
+                if heartbeat is not None and idle >= heartbeat:
+                    idle = 0.0
+                    yield "heartbeat", None
+                continue
+            idle = 0.0
+            yield "event", item
+        # Événements publiés entre la dernière lecture et la fin du calcul
+        while True:
+            try:
+                yield "event", channel.get_nowait()
+            except queue.Empty:
+                break
+        yield "result", self._result(future)
+
+    def _release(self, _future):
+        self.in_flight -= 1
+
+    def _get_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+def _run_with_events(fn, channel, args, kwargs):
+    """Exécuté dans le worker : les événements de fn sont déposés dans le canal."""
+    return fn(
+        *args,
+        progress=lambda stage, fraction: channel.put(
+            ("pipeline", {"stage": stage, "progress": fraction})
+        ),
+        events=lambda event, data: channel.put((event, data)),
+        **kwargs,
+    )
+
+
+prediction_pool = PredictionPool()
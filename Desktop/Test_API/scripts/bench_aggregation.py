@@ -0,0 +1,96 @@
+"""
+bench_aggregation.py - Compare l'agrégation mensuelle directe (clé entière de mois)
+avec l'ancienne agrégation resample('D') → resample('MS') de DataCleaner.
+
+USAGE :
+  python scripts/bench_aggregation.py
+  python scripts/bench_aggregation.py --rows 2000000 --repeat 5
+
+Cas mesurés :
+  • sparse : peu de transactions réparties sur plusieurs décennies (l'ancien
+    chemin construit un index journalier dense sur toute la période)
+  • dense  : beaucoup de transactions sur quelques années
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic import DataCleaner
+
+
+def legacy_resample(df):
+    """Ancien chemin : série journalière dense puis mensuelle."""
+    daily = df["clean_amount"].resample("D").sum()
+    return daily.resample("MS").sum()
+
+
+def direct_buckets(df):
+    """Nouveau chemin : chaque transaction va directement dans son mois."""
+    keys = DataCleaner._month_keys(df.index)
+    return DataCleaner._keys_to_monthly(
+        DataCleaner._bucket_sums(keys, df["clean_amount"])
+    )
+
+
+def make_frame(kind, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    if kind == "sparse":
+        start, end = pd.Timestamp("1900-01-01"), pd.Timestamp("2025-12-31")
+    else:
+        start, end = pd.Timestamp("2020-01-01"), pd.Timestamp("2024-12-31")
+    span = (end - start).value
+    dates = pd.to_datetime(start.value + rng.integers(0, span, rows)).normalize()
+    df = pd.DataFrame({"clean_amount": rng.uniform(100, 100000, rows)}, index=dates)
+    df.index.name = "clean_date"
+    return df.sort_index()
+
+
+def measure(func, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    result = func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark agrégation mensuelle")
+    parser.add_argument(
+        "--rows", type=int, default=1_000_000, help="Lignes pour le cas dense"
+    )
+    parser.add_argument(
+        "--sparse-rows", type=int, default=500, help="Lignes pour le cas sparse"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'cas':<8}{'lignes':>10}{'chemin':>10}{'temps (ms)':>14}{'pic mém. (Mo)':>16}"
+    )
+    for kind, rows in (("sparse", args.sparse_rows), ("dense", args.rows)):
+        df = make_frame(kind, rows)
+        t_old, m_old, r_old = measure(legacy_resample, df, args.repeat)
+        t_new, m_new, r_new = measure(direct_buckets, df, args.repeat)
+        np.testing.assert_allclose(r_new.to_numpy(), r_old.to_numpy(), rtol=1e-9)
+        for name, t, m in (("resample", t_old, m_old), ("direct", t_new, m_new)):
+            print(f"{kind:<8}{rows:>10}{name:>10}{t * 1000:>14.2f}{m / 1e6:>16.2f}")
+        print(
+            f"{'':<8}{'':>10}{'gain':>10}{t_old / t_new:>13.1f}x{m_old / max(m_new, 1):>15.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,26 @@ import pytest
 import pandas as pd
 import numpy as np
 
+from logic import DataCleaner
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_schema_cache(tmp_path_factory):
+    """Filet de sécurité entre deux tests (jobs encore en cours en arrière-plan)."""
+    original = DataCleaner.SCHEMA_CACHE_FILE
+    DataCleaner.SCHEMA_CACHE_FILE = str(tmp_path_factory.mktemp("schema") / "schema_cache.json")
+    yield
+    DataCleaner.SCHEMA_CACHE_FILE = original
+
+
+@pytest.fixture(autouse=True)
+def isolated_schema_cache(session_schema_cache, tmp_path, monkeypatch):
+    """Cache de schémas propre à chaque test : logs/schema_cache.json n'est jamais touché."""
+    cache_file = str(tmp_path / "schema_cache.json")
+    monkeypatch.setenv("SCHEMA_CACHE_FILE", cache_file)
+    monkeypatch.setattr(DataCleaner, "SCHEMA_CACHE_FILE", cache_file)
+    monkeypatch.setattr(DataCleaner, "_schema_cache", None)
+
 @pytest.fixture
 def valid_api_key():
     return "TGR-SECRET-KEY-12345"
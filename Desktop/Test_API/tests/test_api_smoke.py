@@ -1,4 +1,5 @@
 import io
+import os
 import pytest
 from fastapi.testclient import TestClient
 import pandas as pd
@@ -30,6 +31,476 @@ def test_predict_by_code_coming_soon(valid_api_key):
     assert data.get('status') == 'error'
 
 
+def test_predict_by_code_wide_file(valid_api_key):
+    """Only code/date/amount columns are needed; extra text columns are ignored."""
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["libelle;code_ordonnateur;commentaire;date_reglement;montant"]
+    for i, d in enumerate(dates):
+        rows.append(f"depense {i};146014;ras;{d:%d/%m/%Y};{1000 + 10 * i},50")
+        rows.append(f"autre {i};146029;ras;{d:%d/%m/%Y};500,00")
+    resp = client.post(
+        "/predict/by-code",
+        params={"code": "146014", "months": 3},
+        files={"file": ("wide.csv", io.BytesIO("\n".join(rows).encode('utf-8')), "text/csv")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert resp.json().get('status') == 'success'
+
+
+def test_predict_gzip_upload(sample_csv_dense, valid_api_key):
+    import gzip
+    resp = client.post(
+        "/predict",
+        params={"months": 3},
+        files={"file": ("data.csv.gz", io.BytesIO(gzip.compress(sample_csv_dense)), "application/gzip")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert any('gzip' in log for log in resp.json()['explanations'])
+
+
+def test_predict_by_code_zstd_upload(valid_api_key):
+    zstandard = pytest.importorskip("zstandard")
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["code_ordonnateur;date_reglement;montant"]
+    rows += [f"146014;{d:%d/%m/%Y};{1000 + 10 * i},50" for i, d in enumerate(dates)]
+    payload = zstandard.ZstdCompressor().compress("\n".join(rows).encode('utf-8'))
+    resp = client.post(
+        "/predict/by-code",
+        params={"code": "146014", "months": 3},
+        files={"file": ("codes.csv.zst", io.BytesIO(payload), "application/zstd")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert resp.json().get('status') == 'success'
+
+
+def test_predict_by_code_parquet(valid_api_key):
+    """Parquet uploads are detected by signature and read by column projection."""
+    pytest.importorskip('pyarrow')
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    df = pd.DataFrame({
+        'code_ordonnateur': [146014] * 30 + [146029] * 30,
+        'date': list(dates) * 2,
+        'montant': [1000.0 + 10 * i for i in range(30)] + [500.0] * 30,
+    })
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    resp = client.post(
+        "/predict/by-code",
+        params={"code": "146014", "months": 3},
+        files={"file": ("extract.parquet", io.BytesIO(buffer.getvalue()), "application/octet-stream")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert resp.json().get('status') == 'success'
+
+
+def test_predict_with_schema_hints(valid_api_key):
+    """Explicit schema query params replace separator/column/format detection."""
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["periode|total"] + [f"{d:%Y%m%d}|{1000 + 10 * i}" for i, d in enumerate(dates)]
+    resp = client.post(
+        "/predict",
+        params={"months": 3, "sep": "|", "date_col": "periode", "amount_col": "total", "date_format": "%Y%m%d"},
+        files={"file": ("layout.csv", io.BytesIO("\n".join(rows).encode('utf-8')), "text/csv")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert any("(fourni)" in log for log in resp.json()['explanations'])
+
+
+def test_dataset_registered_once_predicted_many_times(valid_api_key, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    import dataset_registry
+    monkeypatch.setattr(dataset_registry, "DATASET_DIR", str(tmp_path))
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["libelle;code_ordonnateur;date_reglement;montant"]
+    for i, d in enumerate(dates):
+        rows.append(f"depense {i};146014;{d:%d/%m/%Y};{1000 + 10 * i},50")
+        rows.append(f"autre {i};146029;{d:%d/%m/%Y};{500 + (i % 4) * 25},00")
+    payload = "\n".join(rows).encode('utf-8')
+    headers = {"X-API-Key": valid_api_key}
+
+    resp = client.post("/datasets", files={"file": ("codes.csv", io.BytesIO(payload), "text/csv")}, headers=headers)
+    assert resp.status_code == 200
+    meta = resp.json()
+    assert meta["created"] and meta["rows"] == 60 and meta["codes"] == 2
+
+    again = client.post("/datasets", files={"file": ("codes.csv", io.BytesIO(payload), "text/csv")}, headers=headers)
+    assert again.json()["created"] is False
+    assert again.json()["dataset_id"] == meta["dataset_id"]
+
+    for code in ("146014", "146029"):
+        resp = client.post("/predict/by-code", params={"code": code, "months": 3, "dataset_id": meta["dataset_id"]}, headers=headers)
+        assert resp.status_code == 200, resp.json()
+        assert "_internal" in resp.json()
+    missing = client.post("/predict/by-code", params={"code": "999", "dataset_id": meta["dataset_id"]}, headers=headers)
+    assert missing.status_code == 404
+    assert set(missing.json()["unique_codes"]) == {"146014", "146029"}
+
+    resp = client.post("/predict", params={"months": 3, "dataset_id": meta["dataset_id"]}, headers=headers)
+    assert resp.status_code == 200, resp.json()
+    assert resp.json()["status"] == "success"
+
+
+def test_dataset_code_catalog(valid_api_key, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    import dataset_registry
+    monkeypatch.setattr(dataset_registry, "DATASET_DIR", str(tmp_path))
+    rows = ["code_ordonnateur;date;montant",
+            "A1;05/01/2023;100,00", "A1;20/01/2023;50,00", "A1;03/03/2023;25,50",
+            "B2;10/02/2023;1000,00", "B2;11/02/2023;-200,00"]
+    headers = {"X-API-Key": valid_api_key}
+    resp = client.post("/datasets", files={"file": ("codes.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")},
+                       headers=headers)
+    dataset_id = resp.json()["dataset_id"]
+
+    resp = client.get(f"/datasets/{dataset_id}/codes", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["codes"] == [
+        {"code": "A1", "rows": 3, "active_months": 2, "first_date": "2023-01-05", "last_date": "2023-03-03", "total": 175.5},
+        {"code": "B2", "rows": 2, "active_months": 1, "first_date": "2023-02-10", "last_date": "2023-02-11", "total": 800.0},
+    ]
+    top = client.get(f"/datasets/{dataset_id}/codes", params={"sort": "total", "limit": 1}, headers=headers)
+    assert [entry["code"] for entry in top.json()["codes"]] == ["B2"]
+
+
+def test_by_code_reuses_parsed_upload(valid_api_key, monkeypatch):
+    import dataset_registry
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["code_ordonnateur;date_reglement;montant"]
+    for i, d in enumerate(dates):
+        rows.append(f"IDX1;{d:%d/%m/%Y};{1000 + 10 * i},50")
+        rows.append(f"IDX2;{d:%d/%m/%Y};{700 + (i % 3) * 15},00")
+    payload = "\n".join(rows).encode('utf-8')
+    headers = {"X-API-Key": valid_api_key}
+    parsed = []
+    real_parse = dataset_registry.parse_code_frame
+    monkeypatch.setattr(dataset_registry, "parse_code_frame", lambda *a, **k: parsed.append(1) or real_parse(*a, **k))
+
+    for code in ("IDX1", "IDX2", "IDX1"):
+        resp = client.post("/predict/by-code", params={"code": code, "months": 3},
+                           files={"file": ("codes.csv", io.BytesIO(payload), "text/csv")}, headers=headers)
+        assert resp.status_code == 200, resp.json()
+    assert len(parsed) == 1
+
+    index = dataset_registry.CodeIndex(pd.DataFrame({
+        "code": ["B", "A", "B", "A"],
+        "date": pd.to_datetime(["2023-01-01", "2023-01-02", "2023-01-03", "2023-01-04"]),
+        "montant": [1.0, 2.0, 3.0, 4.0],
+    }))
+    assert index.codes == ["A", "B"] and "B" in index and "C" not in index
+    assert index.rows("B")["montant"].tolist() == [1.0, 3.0]
+    assert index.rows("C") is None
+
+
+def test_code_endpoints_ignore_lean_mode(valid_api_key, tmp_path, monkeypatch):
+    """Les chemins par code ont besoin des lignes : LEAN_MODE=1 ne doit pas les casser."""
+    pytest.importorskip("pyarrow")
+    import dataset_registry
+    from logic import DataCleaner
+    monkeypatch.setattr(DataCleaner, "LEAN_MODE", True)
+    monkeypatch.setattr(dataset_registry, "DATASET_DIR", str(tmp_path))
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["code_ordonnateur;date_reglement;montant"]
+    for i, d in enumerate(dates):
+        rows.append(f"LEAN1;{d:%d/%m/%Y};{1300 + 10 * i},50")
+        rows.append(f"LEAN2;{d:%d/%m/%Y};{400 + (i % 5) * 20},00")
+    payload = "\n".join(rows).encode('utf-8')
+    headers = {"X-API-Key": valid_api_key}
+
+    resp = client.post("/predict/by-code", params={"code": "LEAN1", "months": 3},
+                       files={"file": ("codes.csv", io.BytesIO(payload), "text/csv")}, headers=headers)
+    assert resp.status_code == 200, resp.json()
+    resp = client.post("/datasets", files={"file": ("codes.csv", io.BytesIO(payload), "text/csv")}, headers=headers)
+    assert resp.status_code == 200, resp.json()
+    assert resp.json()["codes"] == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_predict_by_codes_streams_ndjson(valid_api_key, workers):
+    import json
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    rows = ["code_ordonnateur;date_reglement;montant"]
+    for i, d in enumerate(dates):
+        rows.append(f"146014;{d:%d/%m/%Y};{1000 + 10 * i},50")
+        rows.append(f"146029;{d:%d/%m/%Y};500,00")  # constante → prévision naïve
+    resp = client.post(
+        "/predict/by-codes",
+        params={"codes": "146014,146029,999", "months": 3, "workers": workers},
+        files={"file": ("codes.csv", io.BytesIO("\n".join(rows).encode('utf-8')), "text/csv")},
+        headers={"X-API-Key": valid_api_key}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    results = {r["code"]: r for r in map(json.loads, resp.text.splitlines())}
+    assert set(results) == {"146014", "146029", "999"}
+    assert results["146014"]["status"] == "success"
+    assert results["146029"]["model_info"]["name"] == "NAIVE_CONSTANT"
+    assert results["999"]["status"] == "error"
+    from prediction_pool import prediction_pool
+    assert prediction_pool.in_flight == 0  # places du pool rendues à la fin du lot
+
+
+def test_predict_bulk_isolates_bad_files(valid_api_key):
+    import gzip
+    import json
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    good = "date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 10 * i},50" for i, d in enumerate(dates))
+    files = [
+        ("files", ("rabat.csv", io.BytesIO(good.encode('utf-8')), "text/csv")),
+        ("files", ("vide.csv", io.BytesIO(b""), "text/csv")),
+        ("files", ("binaire.csv", io.BytesIO(b"\x00\x01\x02" * 100), "text/csv")),
+        ("files", ("fes.csv.gz", io.BytesIO(gzip.compress(good.encode('utf-8'))), "application/gzip")),
+    ]
+    resp = client.post("/predict/bulk", params={"months": 3, "workers": 2}, files=files,
+                       headers={"X-API-Key": valid_api_key})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    results = {r["index"]: r for r in map(json.loads, resp.text.splitlines())}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert [results[i]["file"] for i in range(4)] == ["rabat.csv", "vide.csv", "binaire.csv", "fes.csv.gz"]
+    for i in (0, 3):
+        assert results[i]["status"] == "success"
+        assert len(results[i]["forecast"]["values"]) == 3
+        assert "_internal" in results[i]
+    assert results[1]["status"] == "error" and results[2]["status"] == "error"
+
+
+def test_uploads_spooled_to_disk_for_workers_and_removed(valid_api_key, tmp_path, monkeypatch):
+    import gzip
+    import uploads
+    from prediction_pool import prediction_pool
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+    sources = []
+    run = prediction_pool.run
+
+    async def spy(fn, source, **kwargs):
+        sources.append((source, os.path.exists(source)))
+        return await run(fn, source, **kwargs)
+
+    monkeypatch.setattr(prediction_pool, "run", spy)
+    dates = pd.date_range('2021-01-01', periods=30, freq='MS')
+    good = ("date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 10 * i},50" for i, d in enumerate(dates))).encode('utf-8')
+    headers = {"X-API-Key": valid_api_key}
+
+    for path in ("/predict", "/predict/auto"):
+        resp = client.post(path, params={"months": 3} if path == "/predict" else {}, headers=headers,
+                           files={"file": ("data.csv.gz", io.BytesIO(gzip.compress(good)), "application/gzip")})
+        assert resp.status_code == 200, resp.json()
+    assert [os.path.dirname(p) for p, _ in sources] == [str(tmp_path)] * 2
+    assert all(existed for _, existed in sources)
+
+    files = [("files", (f"f{i}.csv", io.BytesIO(good), "text/csv")) for i in range(3)]
+    resp = client.post("/predict/bulk", params={"months": 3}, files=files, headers=headers)
+    assert resp.status_code == 200
+    resp = client.post("/predict/stream", params={"months": 3}, headers=headers,
+                       files={"file": ("data.csv", io.BytesIO(good), "text/csv")})
+    assert '"status": "success"' in resp.text or '"status":"success"' in resp.text
+    assert list(tmp_path.iterdir()) == []  # copies supprimées après chaque prédiction
+
+
+def test_predict_include_and_compact_format(valid_api_key):
+    import json
+    dates = pd.date_range('2020-01-01', periods=36, freq='MS')
+    content = "date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 100 * np.sin(i / 2):.2f}" for i, d in enumerate(dates))
+    headers = {"X-API-Key": valid_api_key}
+
+    def post(**params):
+        return client.post("/predict", params={"months": 6, **params},
+                           files={"file": ("data.csv", io.BytesIO(content.encode()), "text/csv")}, headers=headers)
+
+    full = post()
+    compact = post(include="forecast", format="compact")
+    assert full.status_code == 200 and compact.status_code == 200
+    body = compact.json()
+    assert "history" not in body and "explanations" not in body and "anomalies" not in body
+    assert body["forecast"]["freq"] == "MS"
+    assert body["forecast"]["start"] == full.json()["forecast"]["dates"][0]
+    assert body["forecast"]["values"] == pytest.approx(full.json()["forecast"]["values"])
+    size = lambda payload: len(json.dumps({k: v for k, v in payload.items() if k != "_internal"}))
+    assert size(body) * 5 < size(full.json())
+
+    sampled = post(max_points=10).json()
+    assert len(sampled["history"]["values"]) <= 10 and sampled["history"]["original_points"] == len(full.json()["history"]["values"])
+    assert sampled["history"]["dates"][-1] == full.json()["history"]["dates"][-1]
+
+    assert post(include="everything").status_code == 400
+    assert post(format="xml").status_code == 400
+
+
+def test_persisted_prediction_always_checks_anomalies(valid_api_key, monkeypatch):
+    """include= ne filtre que la réponse : un résultat persisté a toujours ses anomalies détectées."""
+    from logic import SmartPredictor
+    from prediction_pool import prediction_pool
+    monkeypatch.setattr(prediction_pool, "workers", 0)  # calcul dans ce processus
+    calls = []
+    real_detect = SmartPredictor._detect_anomalies
+    monkeypatch.setattr(SmartPredictor, "_detect_anomalies", lambda self, results: calls.append(1) or real_detect(self, results))
+    dates = pd.date_range('2020-01-01', periods=36, freq='MS')
+    content = "date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 100 * np.cos(i / 3):.2f}" for i, d in enumerate(dates))
+
+    resp = client.post("/predict", params={"months": 3, "include": "forecast"},
+                       files={"file": ("data.csv", io.BytesIO(content.encode()), "text/csv")},
+                       headers={"X-API-Key": valid_api_key})
+    assert resp.status_code == 200
+    assert "anomalies" not in resp.json()
+    assert calls
+
+
+def test_export_predictions_streams_csv_and_parquet(valid_api_key, tmp_path, monkeypatch):
+    import json
+    from datetime import datetime, timezone
+    from sqlalchemy import create_engine
+    from models.database import db_config, User, UploadedFile, Prediction
+    monkeypatch.setattr(db_config, "engine", create_engine(f"sqlite:///{tmp_path / 'export.db'}"))
+    db_config.create_tables()
+    now = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    with db_config.get_session() as session:
+        user = User(api_key=valid_api_key, organization="TGR", created_at=now)
+        session.add(user)
+        session.commit()
+        for i, model in enumerate(["SARIMA", "NAIVE_CONSTANT", "SARIMA", "HoltWinters"]):
+            upload = UploadedFile(user_id=user.user_id, filename=f"f{i}.csv", file_hash=str(i), row_count=12, uploaded_at=now)
+            session.add(upload)
+            session.commit()
+            forecast = {"dates": ["2025-01-01", "2025-02-01", "2025-03-01"], "values": [1.0 + i, 2.0, 3.0],
+                        "confidence_upper": [2.0, 3.0, 4.0], "confidence_lower": [0.0, 1.0, 2.0]}
+            session.add(Prediction(user_id=user.user_id, file_id=upload.file_id, model_name=model, model_order="(1, 1, 1)",
+                                   forecast_months=3, model_aic=10.0, forecast_json=json.dumps(forecast), created_at=now))
+            session.commit()
+
+    params = {"api_key": valid_api_key, "batch_size": 2}
+    resp = client.get("/api/db/predictions/export", params=params)
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/csv")
+    frame = pd.read_csv(io.StringIO(resp.text))
+    assert len(frame) == 12 and frame["pred_id"].nunique() == 4
+    assert frame.loc[frame["filename"] == "f2.csv", "value"].tolist() == [3.0, 2.0, 3.0]
+
+    only_sarima = pd.read_csv(io.StringIO(client.get("/api/db/predictions/export", params={**params, "model": "sarima"}).text))
+    assert set(only_sarima["model"]) == {"SARIMA"} and len(only_sarima) == 6
+    holt = pd.read_csv(io.StringIO(client.get("/api/db/predictions/export", params={**params, "model": "HOLTWINTERS"}).text))
+    assert set(holt["model"]) == {"HoltWinters"} and len(holt) == 3  # filtre insensible à la casse
+    assert len(pd.read_csv(io.StringIO(client.get("/api/db/predictions/export", params={**params, "since": "2025-06-01", "until": "2025-06-01"}).text))) == 12
+    none = client.get("/api/db/predictions/export", params={**params, "until": "2025-05-31"})
+    assert none.text.strip() == "pred_id,created_at,model,order,aic,filename,forecast_date,value,confidence_lower,confidence_upper"
+
+    pytest.importorskip("pyarrow")
+    resp = client.get("/api/db/predictions/export", params={**params, "format": "parquet"})
+    assert resp.status_code == 200
+    table = pd.read_parquet(io.BytesIO(resp.content))
+    assert len(table) == 12 and str(table["forecast_date"].dtype).startswith("datetime64")
+
+
+def test_predict_returns_503_when_prediction_queue_full(valid_api_key, monkeypatch):
+    from prediction_pool import prediction_pool
+    monkeypatch.setattr(prediction_pool, "in_flight", prediction_pool.capacity)
+    csv = b"date;montant\n01/01/2020;100\n01/02/2020;200\n"
+    for path, params in (("/predict", {"months": 3}), ("/predict/auto", {}), ("/predict/by-code", {"code": "1"})):
+        resp = client.post(path, params=params, files={"file": ("data.csv", io.BytesIO(csv), "text/csv")},
+                           headers={"X-API-Key": valid_api_key})
+        assert resp.status_code == 503, path
+        assert int(resp.headers["Retry-After"]) > 0
+    # Les lots passent par le même pool borné
+    resp = client.post("/predict/by-codes", params={"codes": "all"},
+                       files={"file": ("data.csv", io.BytesIO(csv), "text/csv")}, headers={"X-API-Key": valid_api_key})
+    assert resp.status_code == 503
+    resp = client.post("/predict/bulk", files=[("files", ("data.csv", io.BytesIO(csv), "text/csv"))],
+                       headers={"X-API-Key": valid_api_key})
+    assert resp.status_code == 503
+    health = client.get("/health").json()
+    assert health["prediction_pool"]["in_flight"] == health["prediction_pool"]["capacity"]
+
+
+def test_prediction_jobs_queue_and_resume(valid_api_key, tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from models.database import db_config, User
+    import job_queue
+    monkeypatch.setattr(db_config, "engine", create_engine(f"sqlite:///{tmp_path / 'jobs.db'}"))
+    monkeypatch.setattr(job_queue, "JOB_DIR", str(tmp_path / "jobs"))
+    db_config.create_tables()
+    with db_config.get_session() as session:
+        session.add_all([User(api_key=valid_api_key, organization="TGR"), User(api_key="OTHER-KEY", organization="Autre")])
+        session.commit()
+    dates = pd.date_range('2020-01-01', periods=36, freq='MS')
+    content = "date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 100 * np.sin(i / 2):.2f}" for i, d in enumerate(dates))
+    headers = {"X-API-Key": valid_api_key}
+
+    resp = client.post("/jobs", params={"months": 3}, files={"file": ("data.csv", io.BytesIO(content.encode()), "text/csv")},
+                       headers=headers)
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+    assert client.get(f"/jobs/{job_id}", headers=headers).json()["status"] == "queued"
+
+    # Worker interrompu (API redémarrée) : le job réclamé est remis en file
+    assert job_queue.claim_next_job() == job_id
+    job_queue._update(job_id, worker=f"{job_queue.HOSTNAME}:99999999")
+    assert job_queue.requeue_orphans() == 1
+
+    assert job_queue.process_next() == job_id
+    assert job_queue.process_next() is None
+    job = client.get(f"/jobs/{job_id}", params={"include": "forecast"}, headers=headers).json()
+    assert job["status"] == "done" and job["stage"] == "terminé" and job["progress"] == 1.0
+    assert job["attempts"] == 2
+    assert len(job["result"]["forecast"]["values"]) == 3 and "history" not in job["result"]
+    assert not os.listdir(tmp_path / "jobs")
+    assert client.get("/jobs/unknown", headers=headers).status_code == 404
+
+    # Résultat persisté dans l'historique, comme pour /predict
+    history = client.get("/api/db/predictions/list", params={"api_key": valid_api_key}).json()
+    assert history["total_predictions"] == 1
+
+    # Un job soumis par un autre utilisateur n'est pas visible
+    other_job = job_queue.submit_job("OTHER-KEY", io.BytesIO(content.encode()), params={"months": 3})
+    assert client.get(f"/jobs/{other_job}", headers=headers).status_code == 404
+
+
+@pytest.mark.parametrize("workers", [None, 0])
+def test_predict_stream_sends_tournament_events(valid_api_key, workers, monkeypatch):
+    import json
+    from logic import TOURNAMENT_STAGES
+    from prediction_pool import prediction_pool
+    if workers is not None:
+        monkeypatch.setattr(prediction_pool, "workers", workers)
+    dates = pd.date_range('2020-01-01', periods=36, freq='MS')
+    content = "date;montant\n" + "\n".join(f"{d:%d/%m/%Y};{1000 + 100 * np.sin(i / 2):.2f}" for i, d in enumerate(dates))
+    headers = {"X-API-Key": valid_api_key}
+
+    resp = client.post("/predict/stream", params={"months": 3, "include": "forecast"},
+                       files={"file": ("data.csv", io.BytesIO(content.encode()), "text/csv")}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in resp.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    names = [name for name, _ in events]
+
+    assert [d["stage"] for name, d in events if name == "stage_start"] == list(TOURNAMENT_STAGES)
+    ends = [d for name, d in events if name == "stage_end"]
+    assert [d["stage"] for d in ends] == list(TOURNAMENT_STAGES)
+    assert all(d["duration_ms"] >= 0 for d in ends)
+    arima = next(d for d in ends if d["stage"] == "arima")
+    assert arima["metric"] == "aic" and arima["score"] == min(s for s in arima["models"].values() if s is not None)
+
+    # Meilleur provisoire dès la famille ARIMA, bien avant le résultat final
+    first_best = names.index("provisional_best")
+    assert events[first_best][1]["after_stage"] == "arima"
+    assert first_best < names.index("stage_start", first_best) < names.index("model_selected") < names.index("result")
+    assert [d["stage"] for name, d in events if name == "pipeline"] == ["lecture", "analyse", "prévision", "terminé"]
+    assert names[-1] == "result"
+    result = events[-1][1]
+    assert result["status"] == "success" and len(result["forecast"]["values"]) == 3 and "history" not in result
+    assert result["model_info"]["name"] == events[names.index("model_selected")][1]["model"]
+    assert prediction_pool.in_flight == 0
+
+    assert client.post("/predict/stream", params={"format": "msgpack"},
+                       files={"file": ("data.csv", io.BytesIO(content.encode()), "text/csv")},
+                       headers=headers).status_code == 400
+
+
 def test_predict_rejects_too_large_file(valid_api_key):
     # >50MB should be rejected by DataCleaner
     big = b"0" * (51 * 1024 * 1024)
@@ -41,6 +512,22 @@ def test_predict_rejects_too_large_file(valid_api_key):
     assert resp.status_code == 400
 
 
+@pytest.mark.parametrize("path", ["/predict", "/jobs", "/datasets"])
+def test_predict_rejects_oversized_stream_while_receiving(valid_api_key, path):
+    # Sans Content-Length (chunked) : refus dès que la limite est franchie
+    def body():
+        for _ in range(80):
+            yield b"0" * (1024 * 1024)
+
+    resp = client.post(
+        path,
+        content=body(),
+        headers={"X-API-Key": valid_api_key, "Content-Type": "multipart/form-data; boundary=xyz"},
+    )
+    assert resp.status_code == 400
+    assert "trop volumineux" in resp.json()["error_message"]
+
+
 def test_predict_auto_returns_duration_info_for_sparse(sample_csv_sparse, valid_api_key):
     resp = client.post(
         "/predict/auto",
@@ -51,4 +538,5 @@ def test_predict_auto_returns_duration_info_for_sparse(sample_csv_sparse, valid_
     data = resp.json()
     assert 'duration_info' in data
     assert data['duration_info']['validated_months'] == 3
+    assert '_internal' in data  # persisté comme /predict (persist_result)
     assert 'sparsity' in data['duration_info']['reason'].lower() or 'sparse' in data['duration_info']['reason'].lower()
@@ -5,11 +5,15 @@ Tests des classes DataCleaner et SmartPredictor
 Utilise pytest pour une meilleure gestion des tests
 """
 
+import json
 import os
+import numpy as np
 import pandas as pd
 import pytest
 from io import BytesIO
-from logic import DataCleaner, SmartPredictor, predict_from_file_content
+
+import logic
+from logic import DataCleaner, SmartPredictor, predict_from_file_content, parse_amounts
 
 
 class TestDataCleaner:
@@ -92,6 +96,275 @@ class TestDataCleaner:
         assert len(cleaner.logs) > 0
         assert any('Chargement' in log for log in cleaner.logs)
 
+    @pytest.fixture
+    def daily_csv_content(self):
+        """Transactions journalières sur ~2 ans, dernier mois incomplet."""
+        dates = pd.date_range('2022-01-03', '2023-12-17', freq='D')
+        amounts = [f"{1000 + (i * 37) % 900},{i % 100:02d}" for i in range(len(dates))]
+        df = pd.DataFrame({'date_reglement': dates.strftime('%d/%m/%Y'), 'montant': amounts})
+        return df.to_csv(index=False, sep=';').encode('utf-8')
+
+    def test_streaming_matches_full_read(self, daily_csv_content):
+        """Le mode streaming (chunksize) produit la même série que le mode classique."""
+        expected = DataCleaner(daily_csv_content).run()
+
+        cleaner = DataCleaner(daily_csv_content, chunksize=50)
+        result = cleaner.run()
+
+        pd.testing.assert_frame_equal(result, expected)
+        assert cleaner.df is None
+        assert cleaner.stats['rows_valid'] == cleaner.stats['rows_read']
+
+    def test_month_buckets_match_resample(self):
+        """L'agrégation directe par mois = resample('D') puis resample('MS')."""
+        dates = pd.to_datetime(['1998-03-14', '1998-03-02', '2010-07-31', '2024-01-01', '2024-01-31'])
+        amounts = pd.Series([10.5, 20.0, 3.25, 7.0, 1.0], index=dates).sort_index()
+
+        keys = DataCleaner._month_keys(amounts.index)
+        result = DataCleaner._keys_to_monthly(DataCleaner._bucket_sums(keys, amounts))
+        expected = amounts.resample('D').sum().resample('MS').sum()
+
+        assert result.index.freq == 'MS'
+        assert (result.index == expected.index).all()
+        assert result.tolist() == pytest.approx(expected.tolist())
+
+    def test_date_format_inferred_and_reported(self, daily_csv_content, monkeypatch):
+        """Le format de date est inféré une fois et apparaît dans les explications."""
+        monkeypatch.setattr(DataCleaner, '_schema_cache', {})
+        monkeypatch.setattr(DataCleaner, 'SCHEMA_CACHE_FILE', '')
+        cleaner = DataCleaner(daily_csv_content)
+        cleaner.run()
+
+        assert cleaner.date_format == '%d/%m/%Y'
+        assert any("'%d/%m/%Y'" in log and 'inféré' in log for log in cleaner.logs)
+
+        # Même en-tête → format réutilisé sans nouvelle inférence
+        second = DataCleaner(daily_csv_content)
+        second.run()
+        assert second.date_format == '%d/%m/%Y'
+        assert any('réutilisé' in log for log in second.logs)
+
+    @pytest.mark.parametrize("fmt", ['%d/%m/%Y', '%m/%d/%Y'])
+    @pytest.mark.parametrize("chunksize", [None, 10_000])
+    def test_ambiguous_date_sample_not_locked_in(self, fmt, chunksize, monkeypatch):
+        """
+        Export trié, 120 lignes par jour : les 500 premières lignes ont toutes
+        un jour ≤ 12, l'échantillon ne tranche pas entre dd/mm et mm/dd.
+        Aucune ligne ne doit être perdue ni aucun mois inversé.
+        """
+        monkeypatch.setattr(DataCleaner, '_schema_cache', {})
+        monkeypatch.setattr(DataCleaner, 'SCHEMA_CACHE_FILE', '')
+        days = pd.date_range('2020-01-01', '2021-12-31', freq='D')
+        dates = days.repeat(120)
+        csv = pd.DataFrame({'date': dates.strftime(fmt), 'montant': 1}).to_csv(index=False, sep=';')
+
+        cleaner = DataCleaner(csv.encode('utf-8'), chunksize=chunksize)
+        result = cleaner.run()
+
+        assert cleaner.date_format == fmt
+        assert cleaner.stats['rows_read'] == cleaner.stats['rows_valid'] == len(dates) == 87_720
+        assert len(result) == 24
+        assert result['montant'].tolist() == (days.to_series().dt.to_period('M').value_counts().sort_index() * 120).tolist()
+
+    def test_dirty_dates_single_pass(self):
+        """Quelques dates invalides ne font plus rebasculer tout le fichier."""
+        csv_text = "date,montant\n2023-01-15,100\nn/a,50\n2023-02-15,200\n2023-03-31,300\n"
+        cleaner = DataCleaner(csv_text.encode('utf-8'))
+        result = cleaner.run()
+
+        assert cleaner.date_format == 'ISO8601'
+        assert result['montant'].tolist() == [100.0, 200.0, 300.0]
+
+    def test_streaming_from_path(self, daily_csv_content, tmp_path):
+        """Le mode streaming accepte un chemin de fichier (pas de bytes en RAM)."""
+        path = tmp_path / "depenses.csv"
+        path.write_bytes(daily_csv_content)
+
+        result = DataCleaner(str(path), chunksize=100).run()
+        expected = DataCleaner(daily_csv_content).run()
+
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_amounts_parsed_by_c_parser(self, monkeypatch):
+        """"1 234,50" est converti par read_csv (decimal/thousands), sans replace."""
+        monkeypatch.setenv('CSV_ENGINE', 'c')
+        csv_text = "date;montant\n15/01/2023;1 234,50\n15/02/2023;2 000,25\n31/03/2023;10,75\n"
+        cleaner = DataCleaner(csv_text.encode('utf-8'))
+        result = cleaner.run()
+
+        assert cleaner.amount_convention == {"decimal": ",", "thousands": [" "]}
+        assert pd.api.types.is_float_dtype(cleaner.df['montant'])
+        assert result['montant'].tolist() == [1234.5, 2000.25, 10.75]
+
+    def test_only_date_and_amount_columns_read(self):
+        """Les colonnes inutiles ne sont jamais chargées (usecols)."""
+        csv_text = "libelle;date;commentaire;montant;service\n" + "".join(
+            f"ligne {i};2023-{m:02d}-15;ras;{100 * m};dep\n" for i, m in enumerate(range(1, 7))
+        )
+        cleaner = DataCleaner(csv_text.encode('utf-8'))
+        cleaner.run()
+
+        assert list(cleaner.df.columns) == ['date', 'montant', 'clean_amount']
+        assert pd.api.types.is_numeric_dtype(cleaner.df['montant'])
+
+    def test_csv_engine_fallback_without_pyarrow(self, monkeypatch, daily_csv_content):
+        """Sans pyarrow, CSV_ENGINE=auto retombe sur le parseur C (résultat identique)."""
+        expected = DataCleaner(daily_csv_content).run()
+        monkeypatch.setattr(logic.importlib.util, 'find_spec', lambda name: None)
+        monkeypatch.setenv('CSV_ENGINE', 'auto')
+
+        cleaner = DataCleaner(daily_csv_content)
+        result = cleaner.run()
+
+        assert cleaner.csv_engine == 'c'
+        assert "Moteur CSV : c" in cleaner.logs
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_columnar_formats_match_csv(self, daily_csv_content):
+        """Parquet et Feather typés donnent la même série que le CSV équivalent."""
+        pytest.importorskip('pyarrow')
+        expected = DataCleaner(daily_csv_content).run()
+
+        df = pd.read_csv(BytesIO(daily_csv_content), sep=';', decimal=',')
+        df['date_reglement'] = pd.to_datetime(df['date_reglement'], format='%d/%m/%Y')
+        df['libelle'] = 'dépense'  # colonne inutile : jamais lue (projection)
+        for write in (df.to_parquet, df.to_feather):
+            buffer = BytesIO()
+            write(buffer)
+            cleaner = DataCleaner(buffer.getvalue())
+            result = cleaner.run()
+
+            assert cleaner.input_format in ('parquet', 'feather')
+            assert list(cleaner.df.columns) == ['date_reglement', 'montant', 'clean_amount']
+            pd.testing.assert_frame_equal(result, expected)
+
+    def test_parquet_streaming_by_batches(self, daily_csv_content):
+        """Parquet + chunksize : lecture par lots, même résultat."""
+        pytest.importorskip('pyarrow')
+        df = pd.read_csv(BytesIO(daily_csv_content), sep=';', decimal=',')
+        buffer = BytesIO()
+        df.to_parquet(buffer, row_group_size=100)
+
+        expected = DataCleaner(daily_csv_content).run()
+        result = DataCleaner(buffer.getvalue(), chunksize=64).run()
+
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_parallel_byte_ranges_match_serial(self, daily_csv_content, tmp_path):
+        """workers > 1 : plages d'octets agrégées en parallèle = lecture en une passe."""
+        expected = DataCleaner(daily_csv_content).run()
+
+        cleaner = DataCleaner(daily_csv_content, workers=3)
+        result = cleaner.run()
+        pd.testing.assert_frame_equal(result, expected)
+        assert cleaner.stats['rows_read'] == daily_csv_content.count(b'\n') - 1
+
+        path = tmp_path / "depenses.csv"
+        path.write_bytes(daily_csv_content)
+        pd.testing.assert_frame_equal(DataCleaner(str(path), workers=3).run(), expected)
+
+    def test_split_byte_ranges_align_on_lines(self):
+        """Chaque plage commence en début de ligne et les plages couvrent tout."""
+        data = b"date;montant\n" + b"".join(b"2023-01-%02d;%d\n" % (d, d * 10) for d in range(1, 29))
+        ranges = logic.split_byte_ranges(data, len(data), 13, 4)
+
+        assert ranges[0][0] == 13 and ranges[-1][1] == len(data)
+        assert all(b == c for (_, b), (c, _) in zip(ranges, ranges[1:]))
+        assert all(data[a - 1:a] == b"\n" for a, _ in ranges)
+
+    def test_schema_cache_persisted_by_header_fingerprint(self, daily_csv_content, monkeypatch, tmp_path):
+        """Un en-tête déjà vu reprend séparateur, colonnes et formats sans détection."""
+        cache_file = tmp_path / "schema_cache.json"
+        monkeypatch.setattr(DataCleaner, '_schema_cache', None)
+        monkeypatch.setattr(DataCleaner, 'SCHEMA_CACHE_FILE', str(cache_file))
+        expected = DataCleaner(daily_csv_content).run()
+        assert [p.name for p in tmp_path.iterdir()] == ["schema_cache.json"]  # aucun fichier temporaire laissé
+
+        # Nouveau processus simulé : le cache est relu depuis le fichier
+        monkeypatch.setattr(DataCleaner, '_schema_cache', None)
+        monkeypatch.setattr(DataCleaner, '_detect_separator', lambda self: pytest.fail("détection non sautée"))
+        cleaner = DataCleaner(daily_csv_content)
+        result = cleaner.run()
+
+        assert any('Schéma connu' in log for log in cleaner.logs)
+        assert cleaner.date_format == '%d/%m/%Y'
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_stale_cached_date_format_evicted(self):
+        """Un format en cache qui passe la sonde mais que la colonne entière dément est évincé."""
+        days = pd.date_range('2020-01-01', '2021-12-31', freq='D').repeat(120)
+        def export(fmt):
+            return pd.DataFrame({'date': days.strftime(fmt), 'montant': 1}).to_csv(index=False, sep=';').encode('utf-8')
+
+        DataCleaner(export('%d/%m/%Y')).run()
+        cleaner = DataCleaner(export('%m/%d/%Y'))  # même en-tête, autre format
+        result = cleaner.run()
+
+        assert any('évincé' in log for log in cleaner.logs)
+        assert cleaner.date_format == '%m/%d/%Y'
+        assert cleaner.stats['rows_valid'] == len(days) and len(result) == 24
+        with open(DataCleaner.SCHEMA_CACHE_FILE, encoding='utf-8') as f:
+            assert [e['date_format'] for e in json.load(f).values()] == ['%m/%d/%Y']
+
+    def test_schema_hints_bypass_detection(self, monkeypatch):
+        """Colonnes aux noms non reconnus : les indications explicites suffisent."""
+        monkeypatch.setattr(DataCleaner, 'SCHEMA_CACHE_FILE', '')
+        csv_text = "jj|valeur_ttc|libelle\n" + "".join(f"15.{m:02d}.2023|1.000,50|x\n" for m in range(1, 8))
+        schema = {"sep": "|", "date_col": "JJ", "amount_col": "valeur_ttc",
+                  "date_format": "%d.%m.%Y", "decimal": ",", "thousands": "."}
+        cleaner = DataCleaner(csv_text.encode('utf-8'), schema=schema)
+        result = cleaner.run()
+
+        assert cleaner.date_format == '%d.%m.%Y'
+        assert result['montant'].tolist() == [1000.5] * 6  # dernier mois incomplet retiré
+
+    def test_gzip_decompressed_size_limited(self, daily_csv_content, monkeypatch):
+        """gzip lu à la volée ; la limite porte sur les octets décompressés."""
+        import gzip
+        compressed = gzip.compress(daily_csv_content)
+        pd.testing.assert_frame_equal(DataCleaner(BytesIO(compressed)).run(), DataCleaner(daily_csv_content).run())
+
+        monkeypatch.setattr(DataCleaner, 'MAX_FILE_SIZE', len(daily_csv_content) // 2)
+        with pytest.raises(ValueError, match="décompressé trop volumineux"):
+            DataCleaner(compressed).run()
+
+    def test_lean_mode_keeps_only_monthly_array(self, daily_csv_content):
+        """Mode lean : même série, mais table brute et octets libérés."""
+        expected = DataCleaner(daily_csv_content).run()
+        cleaner = DataCleaner(daily_csv_content, lean=True)
+        result = cleaner.run()
+
+        pd.testing.assert_frame_equal(result, expected)
+        assert cleaner.df is None and cleaner.file_content is None
+        assert cleaner.monthly_values.dtype == np.float64
+        assert len(cleaner.monthly_values) == len(expected)
+        assert cleaner.stats['rows_valid'] > 0
+
+    def test_predict_from_frame_matches_file(self, daily_csv_content):
+        """Lignes déjà en mémoire : même série mensuelle que le fichier, sans CSV."""
+        cleaner = DataCleaner(daily_csv_content)
+        expected = cleaner.run()
+        frame = pd.DataFrame({'date': cleaner.df.index, 'montant': cleaner.df['clean_amount'].to_numpy()})
+
+        monthly = DataCleaner(None).run_frame(frame)
+        pd.testing.assert_frame_equal(monthly, expected)
+
+        result = logic.predict_from_frame(frame, months=3)
+        assert result['status'] == 'success'
+        assert result['history']['values'] == predict_from_file_content(daily_csv_content, months=3)['history']['values']
+
+    def test_parse_amounts_conventions(self):
+        """Espace insécable, format anglo-saxon et colonne déjà numérique."""
+        nbsp = pd.Series(["1\u00A0234,50", "12,00", "abc"])
+        assert parse_amounts(nbsp).tolist()[:2] == [1234.5, 12.0]
+        assert pd.isna(parse_amounts(nbsp).iloc[2])
+
+        english = pd.Series(["1,234.50", "99.5"])
+        assert parse_amounts(english).tolist() == [1234.5, 99.5]
+
+        numeric = pd.Series([1, 2, 3])
+        assert parse_amounts(numeric).dtype == 'float64'
+
 
 class TestSmartPredictor:
     """Tests pour la classe SmartPredictor."""
@@ -232,6 +505,70 @@ class TestIntegration:
                   ["ARIMA", "SARIMA", "AR", "MA", "ARMA"])
 
 
+    def test_predict_from_series(self):
+        """Série mensuelle fournie directement (index fin de mois accepté)."""
+        index = pd.date_range('2020-01-01', periods=36, freq='MS') + pd.offsets.MonthEnd(0)  # fin de mois, toutes versions de pandas
+        series = pd.Series(1000 + 100 * np.sin(np.arange(36) / 2), index=index)
+        result = logic.predict_from_series(series, months=6)
+
+        assert result['status'] == 'success'
+        assert result['history']['dates'][0].startswith('2020-01-01')
+        assert len(result['forecast']['values']) <= 6
+
+    def test_shape_result_sections_and_compact(self):
+        """include= retire les sections ; le format compact remplace les dates mensuelles par start + freq."""
+        index = pd.date_range('2020-01-01', periods=36, freq='MS')
+        series = pd.Series(1000 + 100 * np.sin(np.arange(36) / 2), index=index)
+        result = logic.predict_from_series(series, months=6, include=('forecast',))
+        assert result['anomalies'] == []
+
+        shaped = logic.shape_result(result, include=('forecast',), compact=True)
+        assert set(shaped) & set(logic.RESPONSE_SECTIONS) == {'forecast'}
+        assert shaped['model_info'] == result['model_info']
+        assert shaped['forecast']['start'] == result['forecast']['dates'][0]
+        assert shaped['forecast']['freq'] == 'MS' and 'dates' not in shaped['forecast']
+        assert shaped['forecast']['values'] == result['forecast']['values']
+
+        irregular = {"history": {"dates": ["2020-01-05", "2020-03-01"], "values": [1.0, 2.0]},
+                     "anomalies": [{"date": "2020-01-05", "severity": "HIGH"}]}
+        compact = logic.shape_result(irregular, compact=True)
+        assert compact['history'] == irregular['history']
+        assert compact['anomalies'] == {"date": ["2020-01-05"], "severity": ["HIGH"]}
+        with pytest.raises(ValueError):
+            logic.parse_include('forecast,bogus')
+
+    def test_downsample_keeps_shape_anomalies_and_tail(self):
+        """max_points : LTTB garde pics, dates d'anomalies et derniers points exacts."""
+        n = 3000
+        dates = [d.strftime('%Y-%m-%d') for d in pd.date_range('2015-01-01', periods=n, freq='D')]
+        values = np.sin(np.arange(n) / 40.0)
+        values[1500] = 10.0  # pic isolé
+        result = {"status": "success",
+                  "history": {"dates": dates, "values": values.tolist()},
+                  "anomalies": [{"date": dates[777], "severity": "HIGH"}]}
+
+        history = logic.shape_result(result, max_points=200)['history']
+        assert len(history['values']) <= 200 and history['original_points'] == n
+        assert dates[1500] in history['dates'] and max(history['values']) == 10.0
+        assert dates[777] in history['dates']
+        assert history['dates'][-logic.DOWNSAMPLE_KEEP_LAST:] == dates[-logic.DOWNSAMPLE_KEEP_LAST:]
+        assert history['dates'] == sorted(history['dates'])
+
+        # Plus d'anomalies que de points : toutes gardées, max_points dépassé de leur nombre au plus
+        anomaly_dates = dates[100:150]
+        many = dict(result, anomalies=[{"date": d} for d in anomaly_dates])
+        for max_points in (3, 4, 10, 17, 100):
+            sampled = logic.shape_result(many, max_points=max_points)['history']
+            assert set(anomaly_dates) <= set(sampled['dates'])
+            assert len(sampled['values']) <= max_points + len(anomaly_dates)
+            assert sampled['dates'][-1] == dates[-1] and sampled['dates'] == sorted(sampled['dates'])
+        assert len(logic.shape_result(many, max_points=100)['history']['values']) <= 100  # anomalies dans le budget
+
+        idx = logic.lttb_indices(values, 50)
+        assert len(idx) == 50 and idx[0] == 0 and idx[-1] == n - 1 and np.all(np.diff(idx) > 0)
+        assert logic.shape_result(result, max_points=n)['history'] is result['history']
+
+
 class TestErrorHandling:
     """Tests de gestion des erreurs."""
     
@@ -268,6 +605,28 @@ class TestErrorHandling:
         except ValueError:
             pass  # C'est acceptable aussi
 
+    def test_binary_upload_rejected(self):
+        """Contenu binaire inconnu : refus sur l'échantillon."""
+        with pytest.raises(ValueError, match="binaire"):
+            DataCleaner(b"\x89PNG\r\n\x1a\n\x00\x00" * 100).run()
+
+    def test_rejected_before_full_read(self, monkeypatch):
+        """Aucun montant exploitable : refus sans lire le fichier entier."""
+        monkeypatch.setattr(DataCleaner, 'SCHEMA_CACHE_FILE', '')
+        monkeypatch.setattr(logic, 'read_csv', lambda *a, **k: pytest.fail("lecture complète"))
+        csv_text = "date;montant\n" + "01/01/2023;n/a\n" * 50000
+        with pytest.raises(ValueError, match="Aucun montant"):
+            DataCleaner(csv_text.encode('utf-8')).run()
+
+    def test_cp1252_file_accepted(self):
+        """Export Windows (cp1252) : repli d'encodage détecté sur l'échantillon."""
+        csv_text = "date;montant;libellé\n" + "".join(f"15/{m:02d}/2023;100,50;Dépense\n" for m in range(1, 8))
+        cleaner = DataCleaner(csv_text.encode('cp1252'))
+        result = cleaner.run()
+
+        assert cleaner.encoding == 'cp1252'
+        assert len(result) == 6
+
 
 # ==============================================================================
 # TESTS À EXÉCUTER MANUELLEMENT
@@ -0,0 +1,190 @@
+"""
+uploads.py - Réception des fichiers uploadés sans les charger en RAM
+
+Deux garde-fous complémentaires :
+  1. UploadSizeLimitMiddleware : compte les octets du corps de la requête AU FIL
+     DE L'EAU (avant le parsing multipart) et répond 400 dès que la limite est
+     dépassée. Un upload géant n'est donc jamais entièrement reçu.
+  2. open_upload() : rend le fichier temporaire déjà constitué par Starlette
+     (SpooledTemporaryFile : mémoire sous SPOOL_MAX_SIZE, disque au-delà),
+     rembobiné, après vérification exacte de sa taille. Le parseur lit ce flux
+     directement : plus de `await file.read()` qui dupliquait tout le contenu.
+  3. CSV compressés (gzip/zstd) : signalés par Content-Encoding sur la partie
+     fichier ou reconnus à leur signature ; décompressés à la volée, la limite
+     portant sur les octets décompressés (voir logic.open_decompressed).
+  4. spool_upload() : copie l'upload dans un fichier temporaire NOMMÉ (dans
+     UPLOAD_TMP_DIR), dont le chemin est transmis aux processus du pool de
+     prédiction au lieu du contenu ; l'appelant le supprime ensuite.
+
+INTÉGRATION AVEC MAIN :
+    ```python
+    from uploads import UploadSizeLimitMiddleware, open_upload
+
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_size=MAX_FILE_SIZE,
+                       paths=("/predict", "/jobs", "/datasets"))
+
+    upload = open_upload(file, MAX_FILE_SIZE)
+    result = predict_from_file_content(upload, months=months)
+    ```
+"""
+
+import os
+import shutil
+import tempfile
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+from logic import COMPRESSIONS
+
+# Seuil mémoire → disque des fichiers uploadés (Starlette : 1 MB par défaut)
+SPOOL_MAX_SIZE = int(os.getenv("UPLOAD_SPOOL_MAX_SIZE", str(8 * 1024 * 1024)))
+MultiPartParser.max_file_size = SPOOL_MAX_SIZE
+
+# Valeurs de Content-Encoding reconnues → nom de compression (voir logic.COMPRESSIONS)
+CONTENT_ENCODINGS = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd", "identity": None}
+
+# Copies des uploads transmises au pool de prédiction ("" = dossier temporaire système)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "")
+
+# Marge pour l'enveloppe multipart (boundaries, en-têtes des parties, champs)
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Le corps de la requête dépasse la limite autorisée."""
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Middleware ASGI : refuse (400, comme les autres erreurs de fichier) les
+    requêtes POST dont le corps dépasse max_body_size + MULTIPART_OVERHEAD.
+    Content-Length est vérifié d'emblée ; sans Content-Length (transfert
+    chunked), les octets sont comptés à la réception et le parsing est
+    interrompu au premier dépassement. La réponse produite par l'application
+    (ex : "erreur de parsing" de FastAPI) est alors remplacée par la nôtre.
+
+    path_limits : limites propres à certains chemins exacts (ex : envoi de
+    plusieurs fichiers sur /predict/bulk), à la place de max_body_size.
+    """
+
+    def __init__(self, app, max_body_size, paths=("/predict",), path_limits=None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = tuple(paths)
+        self.path_limits = dict(path_limits or {})
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.paths)
+        ):
+            return await self.app(scope, receive, send)
+
+        max_body_size = self.path_limits.get(scope["path"], self.max_body_size)
+        limit = max_body_size + MULTIPART_OVERHEAD
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            return await self._reject(scope, receive, send, max_body_size)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                if exceeded:
+                    return await self._reject(scope, receive, send, max_body_size)
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if not started:
+                await self._reject(scope, receive, send, max_body_size)
+
+    async def _reject(self, scope, receive, send, max_body_size):
+        response = JSONResponse(
+            status_code=400,
+            content={
+                "status": "error",
+                "error_message": f"Fichier trop volumineux (max {max_body_size // (1024 * 1024)} MB)",
+            },
+        )
+        await response(scope, receive, send)
+
+
+def open_upload(file: UploadFile, max_size: int):
+    """
+    Retourne le flux binaire de l'upload, rembobiné, après contrôle de taille.
+
+    Le contenu n'est pas copié : c'est le SpooledTemporaryFile de Starlette,
+    lisible directement par DataCleaner / pandas / pyarrow.
+
+    Raises:
+        ValueError: fichier vide ou plus grand que max_size (→ 400 via le
+            gestionnaire d'erreurs de main.py).
+    """
+    stream = file.file
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > max_size:
+        raise ValueError(
+            f"Fichier trop volumineux ({size / (1024 * 1024):.1f} MB, max {max_size // (1024 * 1024)} MB)"
+        )
+    if size == 0:
+        raise ValueError("Fichier vide ou contenu invalide")
+    return stream
+
+
+def spool_upload(stream):
+    """
+    Copie le flux uploadé, par blocs, dans un fichier temporaire nommé et
+    retourne son chemin (le flux est rembobiné). Appel bloquant : depuis la
+    boucle d'événements, passer par run_in_threadpool. L'appelant supprime
+    le fichier une fois la prédiction terminée.
+    """
+    if UPLOAD_TMP_DIR:
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(
+        dir=UPLOAD_TMP_DIR or None, prefix="upload_", suffix=".input"
+    )
+    try:
+        stream.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+        stream.seek(0)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def upload_compression(file: UploadFile):
+    """
+    Compression annoncée par l'en-tête Content-Encoding de la partie fichier.
+    None si absent : la signature sera alors examinée par le lecteur.
+    """
+    encoding = (file.headers.get("content-encoding") or "identity").strip().lower()
+    if encoding not in CONTENT_ENCODINGS:
+        raise ValueError(
+            f"Content-Encoding non supporté : {encoding} (attendu : {', '.join(COMPRESSIONS)})"
+        )
+    return CONTENT_ENCODINGS[encoding]
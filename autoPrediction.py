@@ -20,10 +20,15 @@ class DataCleaner:
     
     Utilise seulement les opérations pandas du cours : parsing, resampling, 
     nettoyage simple.
+
+    Avec `chunksize=N`, le fichier est lu par blocs de N lignes et replié dans
+    des sommes mensuelles courantes (mode streaming pour les gros exports) :
+    la mémoire dépend de N et non de la taille du fichier.
     """
     
-    def __init__(self, file_path):
+    def __init__(self, file_path, chunksize=None):
         self.file_path = file_path
+        self.chunksize = chunksize
         self.df = None
 
     def _detect_separator(self):
@@ -41,11 +46,56 @@ class DataCleaner:
                     return c
         return None
 
+    def _fold_chunks(self, sep, dayfirst):
+        """Replie le fichier bloc par bloc en sommes mensuelles (PeriodIndex)."""
+        monthly, had_nat = None, False
+        col_date = col_amount = None
+        for chunk in pd.read_csv(self.file_path, sep=sep, encoding='utf-8', chunksize=self.chunksize):
+            chunk.columns = chunk.columns.str.strip().str.lower()
+            if col_date is None:
+                col_date = self._find_column(chunk.columns, ['date', 'jour', 'time', 'reglement', 'payment'])
+                col_amount = self._find_column(chunk.columns, ['montant', 'sum', 'prix', 'amount', 'valeur'])
+                if not col_date or not col_amount:
+                    raise ValueError(f"Impossible de trouver Date/Montant. Colonnes : {list(chunk.columns)}")
+
+            amounts = pd.to_numeric(
+                chunk[col_amount].astype(str).str.replace('\u00A0', '').str.replace(' ', '').str.replace(',', '.'),
+                errors='coerce'
+            )
+            dates = pd.to_datetime(chunk[col_date], dayfirst=dayfirst, errors='coerce')
+            had_nat = had_nat or bool(dates.isna().any())
+            valid = dates.notna() & amounts.notna()
+            part = amounts[valid].groupby(dates[valid].dt.to_period('M')).sum()
+            monthly = part if monthly is None else monthly.add(part, fill_value=0)
+        return monthly, had_nat
+
+    def _run_streaming(self, sep):
+        """Pipeline streaming : mêmes règles que run(), sans charger tout le fichier."""
+        monthly, had_nat = self._fold_chunks(sep, dayfirst=True)
+        if had_nat:
+            monthly, _ = self._fold_chunks(sep, dayfirst=False)
+        if monthly is None or monthly.empty:
+            raise ValueError("Aucune date valide trouvée après parsing")
+
+        monthly = monthly.sort_index()
+        monthly.index = monthly.index.to_timestamp()
+        full_index = pd.date_range(monthly.index[0], monthly.index[-1], freq='MS', name='clean_date')
+        self.df_clean = monthly.reindex(full_index, fill_value=0.0).to_frame(name='montant')
+
+        # Enlever dernier mois si incomplet
+        if len(self.df_clean) > 1:
+            self.df_clean = self.df_clean.iloc[:-1]
+
+        print(f"   -> Données prêtes : {len(self.df_clean)} mois (streaming, blocs de {self.chunksize} lignes).")
+        return self.df_clean
+
     def run(self):
         """Lance le pipeline complet : chargement -> nettoyage -> agrégation -> retour DataFrame."""
         print(f"--- 1. NETTOYAGE : {os.path.basename(self.file_path)} ---")
         
         sep = self._detect_separator()
+        if self.chunksize:
+            return self._run_streaming(sep)
         self.df = pd.read_csv(self.file_path, sep=sep, encoding='utf-8', low_memory=False)
         self.df.columns = self.df.columns.str.strip().str.lower()
 
@@ -1,7 +1,19 @@
+import io
 import os
+import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import pandas as pd
 
+# add the API folder to path so the CLI parses exports exactly like the API
+sys.path.insert(0, str(Path(__file__).parent / 'Desktop' / 'Test_API'))
+
+from logic import (
+    detect_amount_convention, amount_reader_kwargs, parse_amounts, resolve_csv_engine, read_csv,
+    split_byte_ranges,
+)
+
 
 def detect_separator(path):
     with open(path, 'r', encoding='utf-8', errors='ignore') as f:
@@ -15,38 +27,73 @@ def sanitize_filename(s: str) -> str:
     return ''.join(c if c in keep else '_' for c in str(s))
 
 
-def split_by_ordonateur(input_csv: str, out_folder: str):
-    sep = detect_separator(input_csv)
-    df = pd.read_csv(input_csv, sep=sep, encoding='utf-8', low_memory=False)
-    df.columns = df.columns.str.strip().str.lower()
-
-    # detect columns
-    col_date = next((c for c in df.columns if 'date' in c or 'jour' in c or 'reglement' in c), None)
-    col_amount = next((c for c in df.columns if 'montant' in c or 'amount' in c or 'somme' in c or 'sum' in c), None)
-    col_ord = next((c for c in df.columns if 'ordon' in c or 'ordonnat' in c or 'etabl' in c or 'code' in c), None)
+def find_columns(columns):
+    col_date = next((c for c in columns if 'date' in c or 'jour' in c or 'reglement' in c), None)
+    col_amount = next((c for c in columns if 'montant' in c or 'amount' in c or 'somme' in c or 'sum' in c), None)
+    col_ord = next((c for c in columns if 'ordon' in c or 'ordonnat' in c or 'etabl' in c or 'code' in c), None)
 
     if not col_date or not col_amount or not col_ord:
-        raise ValueError(f"Colonnes introuvables. Cherchées: date, montant, ordonnateur. Colonnes trouvées: {list(df.columns)}")
+        raise ValueError(f"Colonnes introuvables. Cherchées: date, montant, ordonnateur. Colonnes trouvées: {list(columns)}")
+    return col_date, col_amount, col_ord
 
-    # clean amount and date
-    df['__amount'] = df[col_amount].astype(str).str.replace('\u00A0', '').str.replace(' ', '').str.replace(',', '.')
-    df['__amount'] = pd.to_numeric(df['__amount'], errors='coerce')
-    df['__date'] = pd.to_datetime(df[col_date], dayfirst=True, errors='coerce')
 
-    df = df.dropna(subset=['__date', '__amount', col_ord])
+def daily_sums(df, col_date, col_amount, col_ord, convention=None):
+    # clean amount and date, then sum per (ordonnateur, day)
+    amounts = parse_amounts(df[col_amount], convention)
+    dates = pd.to_datetime(df[col_date], dayfirst=True, errors='coerce')
 
-    # aggregate by ordonnateur and date (daily), then write per ordonnateur aggregated by date
-    df = df.set_index('__date')
-    grouped = df.groupby([col_ord, pd.Grouper(freq='D')])['__amount'].sum().reset_index()
+    valid = dates.notna() & amounts.notna() & df[col_ord].notna()
+    codes = df[col_ord][valid].astype(str).str.strip()
+    return amounts[valid].groupby([codes, dates[valid].dt.normalize()]).sum()
 
+
+def _aggregate_range(task):
+    # Worker: parse one byte range (header prepended) into partial (code, day) sums
+    path, header, start, end, sep, kwargs, convention = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = read_csv(io.BytesIO(header + data), engine='c', sep=sep, encoding='utf-8', **kwargs)
+    df.columns = df.columns.str.strip().str.lower()
+    return daily_sums(df, *find_columns(df.columns), convention=convention)
+
+
+def split_by_ordonateur(input_csv: str, out_folder: str, workers: int = 1):
+    sep = detect_separator(input_csv)
+    header_cols = pd.read_csv(input_csv, sep=sep, encoding='utf-8', nrows=0).columns
+    wanted = find_columns(header_cols.str.strip().str.lower())
+    col_date_raw, col_amount_raw, col_ord_raw = (
+        next(c for c in header_cols if c.strip().lower() == name) for name in wanted)
+
+    # Amount convention ("1 234,50", "1,234.50"...) sniffed on a sample, as the API does:
+    # the C parser converts the column itself when it can, parse_amounts handles the rest
+    sample = pd.read_csv(input_csv, sep=sep, encoding='utf-8', usecols=[col_amount_raw], dtype=str,
+                         nrows=500)[col_amount_raw]
+    convention = detect_amount_convention(sample)
+    kwargs = amount_reader_kwargs(convention)
+    kwargs['usecols'] = [col_date_raw, col_amount_raw, col_ord_raw]
+    kwargs['dtype'] = {col_ord_raw: str, col_date_raw: str}  # same code labels in every range
+
+    if workers > 1:
+        # map-reduce: byte ranges aligned on newlines, parsed and aggregated in a process pool
+        with open(input_csv, 'rb') as f:
+            header = f.readline()
+        ranges = split_byte_ranges(input_csv, os.path.getsize(input_csv), len(header), workers)
+        tasks = [(input_csv, header, a, b, sep, kwargs, convention) for a, b in ranges]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_aggregate_range, tasks))
+        grouped = pd.concat(partials).groupby(level=[0, 1]).sum()
+    else:
+        # CSV_ENGINE as in the API (pyarrow falls back to the C parser for thousands=)
+        df = read_csv(input_csv, sep=sep, encoding='utf-8', low_memory=False, **kwargs)
+        df.columns = df.columns.str.strip().str.lower()
+        grouped = daily_sums(df, *find_columns(df.columns), convention=convention)
+
+    # write one file per ordonnateur, aggregated by date
     os.makedirs(out_folder, exist_ok=True)
     written = 0
-    for code, sub in grouped.groupby(col_ord):
-        sub2 = sub[[ 'level_1' if 'level_1' in sub.columns else sub.columns[1], '__amount']]
-        # fix columns: after reset_index names: [col_ord, 'index'/'__date']
-        # safer: reconstruct
-        sub_dates = sub.iloc[:, 1]
-        df_out = pd.DataFrame({'date': sub_dates.dt.strftime('%Y-%m-%d'), 'montant': sub['__amount'].values})
+    for code, sub in grouped.groupby(level=0):
+        df_out = pd.DataFrame({'date': sub.index.get_level_values(1).strftime('%Y-%m-%d'), 'montant': sub.values})
         fname = sanitize_filename(code)
         out_path = os.path.join(out_folder, f"{fname}.csv")
         df_out.to_csv(out_path, index=False, sep=';')
@@ -59,9 +106,11 @@ def _cli():
     parser = argparse.ArgumentParser(description='Split dataset by ORDONNATEUR into separate CSVs')
     parser.add_argument('--input', default=os.path.join('dataSets', 'depensesEtat.csv'), help='Input CSV path')
     parser.add_argument('--out', default=os.path.join('dataSets', 'ordonateurs'), help='Output folder')
+    parser.add_argument('--workers', type=int, default=1, help='Parallel processes (byte-range map-reduce)')
     args = parser.parse_args()
 
-    n = split_by_ordonateur(args.input, args.out)
+    print(f"Moteur CSV: {resolve_csv_engine()}")
+    n = split_by_ordonateur(args.input, args.out, workers=args.workers)
     print(f"Fichiers écrits: {n} dans {args.out}")
 
 